@@ -0,0 +1,220 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.score_assignments import calculate_elector_balances, validate_assignment, load_json, save_json, score_assignment, score_assignment_file, is_contiguous
+from scripts.score_assignments import adjacency_data, district_to_elector_size
+from scripts.run_manifest import start_run_manifest, save_run_manifest
+
+try:
+    from scipy.optimize import Bounds, LinearConstraint, milp
+    from scipy.sparse import coo_matrix
+except ImportError:
+    milp = None
+
+
+def select_free_districts(assignments, radius):
+    """Districts within radius hops of a constituency boundary, which the solver may reassign.
+
+    A district is only freed if the fixed districts left in its constituency stay contiguous,
+    so that every constituency keeps a connected core that the flow constraints can grow from.
+    """
+    district_to_assignment_idx = {district: assignment_idx for assignment_idx, item in enumerate(assignments) for district in item["polling_districts"]}
+    boundary = [district for district in sorted(district_to_assignment_idx) if any(district_to_assignment_idx[b] != district_to_assignment_idx[district] for b in adjacency_data[district])]
+
+    distances = {district: 0 for district in boundary}
+    queue = deque(boundary)
+    while queue:
+        district = queue.popleft()
+        if distances[district] + 1 >= radius:
+            continue
+        for b in sorted(adjacency_data[district]):
+            if b not in distances:
+                distances[b] = distances[district] + 1
+                queue.append(b)
+
+    free_districts = set()
+    cores = [set(item["polling_districts"]) for item in assignments]
+    for district in sorted(distances, key=lambda district: (distances[district], district)):
+        core = cores[district_to_assignment_idx[district]]
+        if len(core) > 1 and is_contiguous(sorted(core - {district}), adjacency_data):
+            core.remove(district)
+            free_districts.add(district)
+    return free_districts, cores, district_to_assignment_idx
+
+
+def build_model(assignments, free_districts, cores, district_to_assignment_idx, radius):
+    """Variables and constraints that do not depend on the balance target.
+
+    x[d, k] assigns free district d to constituency k, for the constituencies within radius hops of d.
+    f[k, u, v] is a flow of constituency k along edge u -> v into free district v, sourced by the core of k.
+    Every free district assigned to k consumes one unit, and flow only runs between districts assigned to k,
+    so every free district assigned to k is connected to its core.
+    """
+    allowed = {}
+    for district in sorted(free_districts):
+        nearby = {district}
+        frontier = {district}
+        for _ in range(radius):
+            frontier = set(b for a in frontier for b in adjacency_data[a]) - nearby
+            nearby |= frontier
+        allowed[district] = sorted(set(district_to_assignment_idx[b] for b in nearby))
+
+    x_index = {}
+    for district in sorted(free_districts):
+        for assignment_idx in allowed[district]:
+            x_index[district, assignment_idx] = len(x_index)
+
+    f_index = {}
+    for v, assignment_idx in x_index:
+        for u in sorted(adjacency_data[v]):
+            if u in cores[assignment_idx] or (u, assignment_idx) in x_index:
+                f_index[assignment_idx, u, v] = len(x_index) + len(f_index)
+
+    num_variables = len(x_index) + len(f_index)
+    rows, cols, values, lower, upper = [], [], [], [], []
+
+    def add_row(coefficients, lb, ub):
+        row = len(lower)
+        for col, value in coefficients:
+            rows.append(row)
+            cols.append(col)
+            values.append(value)
+        lower.append(lb)
+        upper.append(ub)
+
+    # Every free district is assigned exactly once
+    for district in sorted(free_districts):
+        add_row([(x_index[district, assignment_idx], 1) for assignment_idx in allowed[district]], 1, 1)
+
+    # Flow conservation, and flow only between districts assigned to the same constituency
+    flow_in = {key: [] for key in x_index}
+    flow_out = {key: [] for key in x_index}
+    for (assignment_idx, u, v), col in f_index.items():
+        flow_in[v, assignment_idx].append(col)
+        if (u, assignment_idx) in x_index:
+            flow_out[u, assignment_idx].append(col)
+    capacity = {assignment_idx: sum(1 for (_, k) in x_index if k == assignment_idx) for assignment_idx in range(len(assignments))}
+    for key, col in x_index.items():
+        add_row([(c, 1) for c in flow_in[key]] + [(c, -1) for c in flow_out[key]] + [(col, -1)], 0, 0)
+    for (assignment_idx, u, v), col in f_index.items():
+        add_row([(col, 1), (x_index[v, assignment_idx], -capacity[assignment_idx])], -np.inf, 0)
+        if (u, assignment_idx) in x_index:
+            add_row([(col, 1), (x_index[u, assignment_idx], -capacity[assignment_idx])], -np.inf, 0)
+
+    return x_index, f_index, num_variables, (rows, cols, values, lower, upper)
+
+
+def solve_for_balance(target, assignments, cores, x_index, f_index, num_variables, base_constraints, mean_electors_per_member, time_limit):
+    """Find the plan closest to the warm start whose every constituency has an elector balance of at least target, or None."""
+    rows, cols, values, lower, upper = (list(part) for part in base_constraints)
+
+    # Elector balance min(r, 1 / r) >= target, with r the electors per member over the mean, is linear in the assignment
+    for assignment_idx, item in enumerate(assignments):
+        core_elector_size = sum(district_to_elector_size.get(district, 0) for district in cores[assignment_idx])
+        row = len(lower)
+        for (district, k), col in x_index.items():
+            if k == assignment_idx:
+                rows.append(row)
+                cols.append(col)
+                values.append(district_to_elector_size.get(district, 0))
+        lower.append(target * mean_electors_per_member * item["member_size"] - core_elector_size)
+        upper.append(mean_electors_per_member * item["member_size"] / target - core_elector_size)
+
+    # Stay as close as possible to the warm start, so that the other metrics are disturbed as little as possible
+    objective = np.zeros(num_variables)
+    for (district, assignment_idx), col in x_index.items():
+        if district in assignments[assignment_idx]["polling_districts"]:
+            objective[col] = -1
+
+    integrality = np.zeros(num_variables)
+    integrality[: len(x_index)] = 1
+    upper_bounds = np.full(num_variables, np.inf)
+    upper_bounds[: len(x_index)] = 1
+    constraint_matrix = coo_matrix((values, (rows, cols)), shape=(len(lower), num_variables)).tocsr()
+    result = milp(
+        objective,
+        constraints=LinearConstraint(constraint_matrix, lower, upper),
+        integrality=integrality,
+        bounds=Bounds(np.zeros(num_variables), upper_bounds),
+        options={"time_limit": time_limit, "disp": False},
+    )
+    if result.x is None:
+        return None
+    return {key: result.x[col] > 0.5 for key, col in x_index.items()}
+
+
+def apply_solution(assignment_data, cores, solution):
+    for assignment_idx, item in enumerate(assignment_data["assignment"]):
+        item["polling_districts"] = [district for district in item["polling_districts"] if district in cores[assignment_idx]]
+    for (district, assignment_idx), assigned in sorted(solution.items()):
+        if assigned:
+            assignment_data["assignment"][assignment_idx]["polling_districts"].append(district)
+
+
+def optimize(assignment_data, radius=2, tolerance=1e-4, time_limit=60, deadline=None, verbose=True):
+    """Maximise the minimum elector balance by bisection over feasibility MILPs, warm-started from the given assignment.
+
+    The warm start fixes the constituencies, their member sizes and their districts away from the boundaries,
+    and the solver reassigns the districts within radius hops of a boundary.
+    Each bisection step asks for a contiguous plan with every elector balance at least the target,
+    moving as few districts as possible. The assignment is updated in place with the best plan found.
+    Returns the minimum elector balance of the final assignment.
+    """
+    if milp is None:
+        raise ImportError("The balance solver needs scipy (scipy.optimize.milp with the HiGHS solver), install it with pip install scipy")
+    log = print if verbose else lambda *args, **kwargs: None
+    assignments = assignment_data["assignment"]
+
+    free_districts, cores, district_to_assignment_idx = select_free_districts(assignments, radius)
+    x_index, f_index, num_variables, base_constraints = build_model(assignments, free_districts, cores, district_to_assignment_idx, radius)
+    mean_electors_per_member = sum(district_to_elector_size.get(district, 0) for district in district_to_assignment_idx) / sum(item["member_size"] for item in assignments)
+    log(f"{len(free_districts)} free polling districts, {len(x_index)} assignment and {len(f_index)} flow variables")
+
+    low = min(calculate_elector_balances(assignment_data))
+    high = 1.0
+    log(f"Warm start minimum elector balance {low}")
+    while high - low > tolerance:
+        if deadline is not None and time.time() > deadline:
+            log("Deadline reached")
+            break
+        target = (low + high) / 2
+        start_time = time.time()
+        solution = solve_for_balance(target, assignments, cores, x_index, f_index, num_variables, base_constraints, mean_electors_per_member, time_limit)
+        log(f"Target {target:.6f}: {'feasible' if solution is not None else 'infeasible or timed out'} in {time.time() - start_time:.1f}s")
+        if solution is None:
+            high = target
+        else:
+            apply_solution(assignment_data, cores, solution)
+            low = min(calculate_elector_balances(assignment_data))
+
+    return min(calculate_elector_balances(assignment_data))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maximise the minimum elector balance of the official assignment with an integer program.")
+    parser.add_argument("--radius", type=int, default=2, help="Polling districts within this many hops of a constituency boundary may be reassigned")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Bisection tolerance on the minimum elector balance")
+    parser.add_argument("--time-limit", type=float, default=60, help="Time limit of each MILP solve in seconds")
+    parser.add_argument("--budget", type=float, default=None, help="Wall-clock budget in seconds")
+    parser.add_argument("--output", default="balance_milp.json", help="Filename of the balanced assignment in assignments/")
+    args = parser.parse_args()
+
+    assignment_data = load_json("assignments/official_ge_2025.json")
+    assignment_data["assignment_name"] = "With maximised elector balance"
+    deadline = time.time() + args.budget if args.budget is not None else None
+    manifest = start_run_manifest("balance_milp", None, vars(args))
+    min_elector_balance = optimize(assignment_data, radius=args.radius, tolerance=args.tolerance, time_limit=args.time_limit, deadline=deadline)
+
+    validated, errors = validate_assignment(assignment_data)
+    assert validated, errors
+    print(f"Minimum elector balance {min_elector_balance}, overall score {score_assignment(assignment_data)['overall_score']}")
+    save_json(assignment_data, os.path.join("assignments", args.output))
+    score_assignment_file(args.output)
+    save_run_manifest(manifest, args.output)
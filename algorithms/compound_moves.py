@@ -0,0 +1,232 @@
+import argparse
+import atexit
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.score_assignments import score_assignment, score_assignment_proxy, validate_assignment, load_json, save_json, score_assignment_file, calculate_geometric_score
+from scripts.score_assignments import start_profiling, print_profile_summary, adjacency_data, district_to_elector_size
+from scripts.run_manifest import start_run_manifest, save_run_manifest
+
+# Bitset representation: each polling district is a bit, and a set of polling districts is a Python int
+district_names = sorted(set(adjacency_data) | set(district_to_elector_size))
+district_to_bit = {district: 1 << idx for idx, district in enumerate(district_names)}
+adjacency_masks = [sum(district_to_bit[b] for b in adjacency_data.get(district, [])) for district in district_names]
+
+
+def to_mask(districts):
+    return sum(district_to_bit[district] for district in districts)
+
+
+def iterate_bits(mask):
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+def neighbour_mask(mask):
+    neighbours = 0
+    for idx in iterate_bits(mask):
+        neighbours |= adjacency_masks[idx]
+    return neighbours & ~mask
+
+
+def is_connected(mask):
+    """Flood fill over the adjacency bitsets."""
+    if not mask:
+        return False
+    visited = frontier = mask & -mask
+    while frontier:
+        frontier = neighbour_mask(frontier) & mask & ~visited
+        visited |= frontier
+    return visited == mask
+
+
+def grow_clusters(seed, source_mask, target_mask, max_cluster_size):
+    """Connected clusters of districts of the source constituency that contain the seed, one of each size up to the maximum.
+
+    The cluster grows one district at a time, preferring districts that border the target constituency, then by name.
+    """
+    cluster = district_to_bit[seed]
+    clusters = [cluster]
+    target_neighbours = neighbour_mask(target_mask)
+    while len(clusters) < max_cluster_size:
+        options = neighbour_mask(cluster) & source_mask
+        if not options:
+            break
+        preferred = options & target_neighbours
+        cluster |= (preferred or options) & -(preferred or options)
+        clusters.append(cluster)
+    return clusters
+
+
+def elector_size_of(mask):
+    return sum(district_to_elector_size.get(district_names[idx], 0) for idx in iterate_bits(mask))
+
+
+def apply_moves(assignment_data, masks, moves):
+    """Apply (district mask, from, to) moves to the assignment and the constituency masks."""
+    assignments = assignment_data["assignment"]
+    for mask, assignment_idx_1, assignment_idx_2 in moves:
+        for idx in iterate_bits(mask):
+            assignments[assignment_idx_1]["polling_districts"].remove(district_names[idx])
+            assignments[assignment_idx_2]["polling_districts"].append(district_names[idx])
+        masks[assignment_idx_1] &= ~mask
+        masks[assignment_idx_2] |= mask
+
+
+def revert_moves(assignment_data, masks, moves):
+    apply_moves(assignment_data, masks, [(mask, assignment_idx_2, assignment_idx_1) for mask, assignment_idx_1, assignment_idx_2 in reversed(moves)])
+
+
+def enumerate_compound_moves(assignment_data, masks, max_cluster_size):
+    """Cluster moves between adjacent constituencies, and three-way rotations of one district each around adjacent triples.
+
+    Each candidate is a list of (district mask, from, to) moves that together keep every constituency contiguous.
+    """
+    num_assignments = len(masks)
+    neighbours = [neighbour_mask(mask) for mask in masks]
+    adjacent = [
+        [assignment_idx_2 for assignment_idx_2 in range(num_assignments) if assignment_idx_2 != assignment_idx_1 and neighbours[assignment_idx_1] & masks[assignment_idx_2]]
+        for assignment_idx_1 in range(num_assignments)
+    ]
+
+    candidates = []
+    seen = set()
+    for assignment_idx_1 in range(num_assignments):
+        for assignment_idx_2 in adjacent[assignment_idx_1]:
+            # Districts of constituency 1 on the boundary with constituency 2
+            boundary = masks[assignment_idx_1] & neighbours[assignment_idx_2]
+            for seed_idx in iterate_bits(boundary):
+                for cluster in grow_clusters(district_names[seed_idx], masks[assignment_idx_1], masks[assignment_idx_2], max_cluster_size):
+                    if (cluster, assignment_idx_1, assignment_idx_2) in seen:
+                        continue
+                    seen.add((cluster, assignment_idx_1, assignment_idx_2))
+                    if is_connected(masks[assignment_idx_1] & ~cluster):
+                        candidates.append([(cluster, assignment_idx_1, assignment_idx_2)])
+
+    for assignment_idx_1 in range(num_assignments):
+        for assignment_idx_2 in adjacent[assignment_idx_1]:
+            for assignment_idx_3 in adjacent[assignment_idx_2]:
+                # Each directed triangle once, starting from its smallest index
+                if assignment_idx_3 == assignment_idx_1 or assignment_idx_1 > min(assignment_idx_2, assignment_idx_3) or assignment_idx_1 not in adjacent[assignment_idx_3]:
+                    continue
+                triple = (assignment_idx_1, assignment_idx_2, assignment_idx_3)
+                boundaries = [masks[triple[k]] & neighbours[triple[(k + 1) % 3]] for k in range(3)]
+                for idx_a in iterate_bits(boundaries[0]):
+                    for idx_b in iterate_bits(boundaries[1]):
+                        for idx_c in iterate_bits(boundaries[2]):
+                            moves = [(1 << idx_a, triple[0], triple[1]), (1 << idx_b, triple[1], triple[2]), (1 << idx_c, triple[2], triple[0])]
+                            # Constituency k loses its district and gains the district of the previous constituency
+                            if all(is_connected((masks[triple[k]] & ~moves[k][0]) | moves[k - 1][0]) for k in range(3)):
+                                candidates.append(moves)
+    return candidates
+
+
+def balance_bound(moves, elector_sizes, member_sizes, mean_electors_per_member):
+    """Minimum elector balance after the moves, which bounds the overall score. This is arithmetic over elector sizes."""
+    changed_elector_sizes = {}
+    for mask, assignment_idx_1, assignment_idx_2 in moves:
+        moved_elector_size = elector_size_of(mask)
+        changed_elector_sizes[assignment_idx_1] = changed_elector_sizes.get(assignment_idx_1, elector_sizes[assignment_idx_1]) - moved_elector_size
+        changed_elector_sizes[assignment_idx_2] = changed_elector_sizes.get(assignment_idx_2, elector_sizes[assignment_idx_2]) + moved_elector_size
+    return min(
+        calculate_geometric_score(changed_elector_sizes.get(assignment_idx, elector_size) / member_size, mean_electors_per_member)
+        for assignment_idx, (elector_size, member_size) in enumerate(zip(elector_sizes, member_sizes))
+    )
+
+
+def describe_moves(assignment_data, moves):
+    assignments = assignment_data["assignment"]
+    return ", ".join(
+        f"{[district_names[idx] for idx in iterate_bits(mask)]} from {assignments[assignment_idx_1]['constituency_name']} to {assignments[assignment_idx_2]['constituency_name']}"
+        for mask, assignment_idx_1, assignment_idx_2 in moves
+    )
+
+
+def optimize(assignment_data, max_cluster_size=3, proxy_limit=200, top_k=5, max_rounds=100, deadline=None, assignment_filename=None, verbose=True):
+    """Improve an assignment in place with compound moves.
+
+    Every round enumerates the cluster moves and three-way rotations that keep the constituencies contiguous (checked on bitsets),
+    prunes those whose minimum elector balance does not beat the current score, ranks the rest by elector balance bound
+    and then by proxy score, and applies the best of the top K by exact score.
+    Returns the overall score of the final assignment.
+    """
+    log = print if verbose else lambda *args, **kwargs: None
+    assignments = assignment_data["assignment"]
+    masks = [to_mask(item["polling_districts"]) for item in assignments]
+    member_sizes = [item["member_size"] for item in assignments]
+
+    best_score = score_assignment(assignment_data)["overall_score"]
+    for round_idx in range(max_rounds):
+        if deadline is not None and time.time() > deadline:
+            log("Deadline reached")
+            break
+
+        elector_sizes = [elector_size_of(mask) for mask in masks]
+        mean_electors_per_member = sum(elector_sizes) / sum(member_sizes)
+        candidates = enumerate_compound_moves(assignment_data, masks, max_cluster_size)
+
+        bounded = []
+        for candidate_idx, moves in enumerate(candidates):
+            bound = balance_bound(moves, elector_sizes, member_sizes, mean_electors_per_member)
+            if bound > best_score:
+                bounded.append((bound, candidate_idx, moves))
+        bounded.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+
+        screened = []
+        for _, candidate_idx, moves in bounded[:proxy_limit]:
+            apply_moves(assignment_data, masks, moves)
+            screened.append((score_assignment_proxy(assignment_data)["overall_score"], candidate_idx, moves))
+            revert_moves(assignment_data, masks, moves)
+        screened.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+        log(f"Round {round_idx}: {len(candidates)} feasible compound moves, {len(bounded)} within the balance bound, scoring {min(top_k, len(screened))} exactly")
+
+        best_moves = None
+        for _, _, moves in screened[:top_k]:
+            apply_moves(assignment_data, masks, moves)
+            score = score_assignment(assignment_data, threshold=best_score)["overall_score"]
+            if score > best_score:
+                best_score = score
+                best_moves = moves
+            revert_moves(assignment_data, masks, moves)
+
+        if best_moves is None:
+            log("No improving compound move")
+            break
+
+        log(f"Moving {describe_moves(assignment_data, best_moves)}, score {best_score}")
+        apply_moves(assignment_data, masks, best_moves)
+        if assignment_filename is not None:
+            validated, errors = validate_assignment(assignment_data)
+            assert validated, errors
+            save_json(assignment_data, os.path.join("assignments", assignment_filename))
+            score_assignment_file(assignment_filename)
+
+    return score_assignment(assignment_data)["overall_score"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Improve the official assignment with cluster moves and three-way rotations between constituencies.")
+    parser.add_argument("--max-cluster-size", type=int, default=3, help="Largest connected cluster of polling districts moved at once")
+    parser.add_argument("--proxy-limit", type=int, default=200, help="Candidates with the best elector balance bound that are ranked by the proxy score")
+    parser.add_argument("--top-k", type=int, default=5, help="Candidates with the best proxy score that are scored exactly")
+    parser.add_argument("--budget", type=float, default=None, help="Wall-clock budget in seconds")
+    parser.add_argument("--output", default="compound_moves.json", help="Filename of the improved assignment in assignments/")
+    parser.add_argument("--profile", action="store_true", help="Run under cProfile and print a timing summary on exit")
+    args = parser.parse_args()
+
+    if args.profile:
+        atexit.register(print_profile_summary, start_profiling())
+
+    assignment_data = load_json("assignments/official_ge_2025.json")
+    assignment_data["assignment_name"] = "With compound moves"
+    deadline = time.time() + args.budget if args.budget is not None else None
+    manifest = start_run_manifest("compound_moves", None, vars(args))
+    optimize(assignment_data, max_cluster_size=args.max_cluster_size, proxy_limit=args.proxy_limit, top_k=args.top_k, deadline=deadline, assignment_filename=args.output)
+    save_json(assignment_data, os.path.join("assignments", args.output))
+    score_assignment_file(args.output)
+    save_run_manifest(manifest, args.output)
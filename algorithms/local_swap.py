@@ -1,148 +1,286 @@
+import argparse
+import atexit
 import os
+import random
 import sys
+import time
 import pandas as pd
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from scripts.score_assignments import score_assignment, validate_assignment, load_json, save_json, calculate_relevance, score_assignment_file
+from scripts.score_assignments import score_assignment, score_assignment_proxy, calculate_elector_balances, validate_assignment, load_json, save_json, calculate_relevance, score_assignment_file
+from scripts.score_assignments import start_profiling, print_profile_summary, adjacency_data
+from scripts.run_manifest import start_run_manifest, save_run_manifest
+from scripts.plan_hash import plan_hash, move_hash, rename_hash, new_transposition_table, lookup_score, store_score, TRANSPOSITION_TABLE_SIZE
+from scripts.pair_moves import evaluate_pair_moves
 
+possible_constituency_names = list(pd.read_csv("raw_data/mrt_stations.csv")["name"])
 
-assignment_data = load_json("assignments/official_ge_2025.json")
-assignments = assignment_data["assignment"]
-assignment_data["assignment_name"] = "With local optimization"
-assignment_filename = "local_swap.json"
-assignment_filepath = os.path.join("assignments", assignment_filename)
+# Slack on the upper bounds of evaluate_pair_moves, which sum the same terms as score_assignment in a different order
+BOUND_TOLERANCE = 1e-12
 
-adjacency_data = load_json("intermediate_data/ge2025_polling_districts_to_adjacent_districts.json")
 
-possible_constituency_names = list(pd.read_csv("raw_data/mrt_stations.csv")["name"])
+def apply_move(polling_districts_1, polling_districts_2, move_1_to_2, move_2_to_1):
+    for a in move_1_to_2:
+        polling_districts_1.remove(a)
+        polling_districts_2.append(a)
+    for b in move_2_to_1:
+        polling_districts_2.remove(b)
+        polling_districts_1.append(b)
+
+
+def score_plan(assignment_data, value, table, threshold=None):
+    """Overall score of the assignment, looked up in the transposition table if its plan hash was scored before."""
+    if table is None:
+        return score_assignment(assignment_data, threshold=threshold)["overall_score"]
+    score = lookup_score(table, value, threshold)
+    if score is None:
+        score = store_score(table, value, score_assignment(assignment_data, threshold=threshold))
+    return score
+
+
+def screen_candidates(assignment_data, candidates, constituency_name_1, constituency_name_2, polling_districts_1, polling_districts_2, best_score, top_k, log=print, candidate_hashes=None, table=None):
+    """Rank candidate moves by the proxy score, and only score the top K candidates exactly.
+
+    The overall score is bounded by the minimum elector balance,
+    so candidates whose bound does not exceed the best score are pruned without any geometry work.
+    """
+    screened = []
+    for move_1_to_2, move_2_to_1 in candidates:
+        apply_move(polling_districts_1, polling_districts_2, move_1_to_2, move_2_to_1)
+        if min(calculate_elector_balances(assignment_data)) > best_score:
+            screened.append((score_assignment_proxy(assignment_data)["overall_score"], move_1_to_2, move_2_to_1))
+        apply_move(polling_districts_1, polling_districts_2, move_2_to_1, move_1_to_2)
+    screened.sort(key=lambda candidate: candidate[0], reverse=True)
+    log(f"Screening kept {len(screened)} of {len(candidates)} candidates, scoring {min(top_k, len(screened))} exactly")
+
+    best_move_1_to_2 = []
+    best_move_2_to_1 = []
+    for _, move_1_to_2, move_2_to_1 in screened[:top_k]:
+        apply_move(polling_districts_1, polling_districts_2, move_1_to_2, move_2_to_1)
+        if candidate_hashes is not None:
+            score = score_plan(assignment_data, candidate_hashes[(tuple(move_1_to_2), tuple(move_2_to_1))], table, best_score)
+        else:
+            score = score_assignment(assignment_data, threshold=best_score)["overall_score"]
+        if score > best_score:
+            log(f"Considering {score} after moving {move_1_to_2} from {constituency_name_1} and {move_2_to_1} from {constituency_name_2}")
+            best_score = score
+            best_move_1_to_2 = move_1_to_2
+            best_move_2_to_1 = move_2_to_1
+        apply_move(polling_districts_1, polling_districts_2, move_2_to_1, move_1_to_2)
+    return best_score, best_move_1_to_2, best_move_2_to_1
+
+
+def optimize(assignment_data, iterations=10, screen_top_k=0, seed=None, deadline=None, assignment_filename=None, verbose=True, transposition_table_size=TRANSPOSITION_TABLE_SIZE):
+    """Improve an assignment in place with name replacements, boundary moves and swaps between constituency pairs.
+
+    With a seed, the order in which constituency pairs and candidate districts are tried is shuffled.
+    The contiguity and an upper bound of the score of every move and swap of a pair are evaluated at once (see
+    scripts/pair_moves.py), and candidates whose bound does not exceed the best score are not scored.
+    Scores of visited plans are kept in a transposition table of the given size, keyed by Zobrist plan hash,
+    so that a plan reached again (such as the same swap from the other constituency of a pair) is not scored again.
+    A size of 0 disables the table.
+    The search stops when the deadline (a time.time() timestamp) passes.
+    If an assignment filename is given, every improvement is saved to assignments/ and scored.
+    Returns the overall score of the final assignment.
+    """
+    log = print if verbose else lambda *args, **kwargs: None
+    rng = random.Random(seed) if seed is not None else None
+    assignments = assignment_data["assignment"]
+    table = new_transposition_table(transposition_table_size) if transposition_table_size else None
+    current_hash = plan_hash(assignment_data)
+
+    best_score = score_assignment(assignment_data)["overall_score"]
+
+    for iteration in range(iterations):
+        seen_constituency_names = set()
+        for assignment_idx in range(len(assignments)):
+            initial_constituency_name = best_constituency_name = assignments[assignment_idx]["constituency_name"]
+            for initial_constituency_name_part in initial_constituency_name.split("-"):
+                seen_constituency_names.add(initial_constituency_name_part)
+
+        for assignment_idx in range(len(assignments)):
+            polling_districts = assignments[assignment_idx]["polling_districts"]
+            initial_constituency_name = best_constituency_name = assignments[assignment_idx]["constituency_name"]
+            best_relevance = calculate_relevance(best_constituency_name, tuple(polling_districts))
+            for possible_constituency_name in possible_constituency_names:
+                if possible_constituency_name in seen_constituency_names:
+                    continue
+                relevance = calculate_relevance(possible_constituency_name, tuple(polling_districts))
+                if relevance > best_relevance:
+                    best_relevance = relevance
+                    best_constituency_name = possible_constituency_name
+            if initial_constituency_name != best_constituency_name:
+                log(f"Replacing name {initial_constituency_name} with name {best_constituency_name}")
+                assignments[assignment_idx]["constituency_name"] = best_constituency_name
+                current_hash = rename_hash(current_hash, assignment_idx, initial_constituency_name, best_constituency_name)
+                seen_constituency_names.add(best_constituency_name)
+                validated, _ = validate_assignment(assignment_data)
+                assert validated
+                score = score_assignment(assignment_data)["overall_score"]
+                log("Current score", score)
+
+        elector_balance_and_assignment_idx = []
+        for assignment_idx, annotation in enumerate(score_assignment(assignment_data)["annotations"]):
+            elector_balance_and_assignment_idx.append((annotation["elector_balance"], assignment_idx))
+        elector_balance_and_assignment_idx.sort()
+
+        early_termination = elector_balance_and_assignment_idx[0][0] == score_assignment(assignment_data)["overall_score"]
+        log(f"iteration {iteration}, early_termination {early_termination}")
+
+        for _, assignment_idx_1 in elector_balance_and_assignment_idx:
+            assignment_idxs_2 = [assignment_idx_2 for _, assignment_idx_2 in elector_balance_and_assignment_idx]
+            if rng is not None:
+                rng.shuffle(assignment_idxs_2)
+            for assignment_idx_2 in assignment_idxs_2:
+                if assignment_idx_1 == assignment_idx_2:
+                    continue
+                constituency_name_1 = assignments[assignment_idx_1]["constituency_name"]
+                constituency_name_2 = assignments[assignment_idx_2]["constituency_name"]
+                for pair_iteration in range(10):
+                    if deadline is not None and time.time() > deadline:
+                        log("Deadline reached")
+                        return score_assignment(assignment_data)["overall_score"]
 
-best_score = score_assignment(assignment_data)["overall_score"]
-
-adjacency_pairs = set()
-for polling_district, polling_districts in adjacency_data.items():
-    for polling_district_other in polling_districts:
-        adjacency_pairs.add((polling_district, polling_district_other))
-
-for iteration in range(10):
-    seen_constituency_names = set()
-    for assignment_idx in range(len(assignments)):
-        initial_constituency_name = best_constituency_name = assignments[assignment_idx]["constituency_name"]
-        for initial_constituency_name_part in initial_constituency_name.split("-"):
-            seen_constituency_names.add(initial_constituency_name_part)
-
-    for assignment_idx in range(len(assignments)):
-        polling_districts = assignments[assignment_idx]["polling_districts"]
-        initial_constituency_name = best_constituency_name = assignments[assignment_idx]["constituency_name"]
-        best_relevance = calculate_relevance(best_constituency_name, tuple(polling_districts))
-        for possible_constituency_name in possible_constituency_names:
-            if possible_constituency_name in seen_constituency_names:
-                continue
-            relevance = calculate_relevance(possible_constituency_name, tuple(polling_districts))
-            if relevance > best_relevance:
-                best_relevance = relevance
-                best_constituency_name = possible_constituency_name
-        if initial_constituency_name != best_constituency_name:
-            print(f"Replacing name {initial_constituency_name} with name {best_constituency_name}")
-            assignments[assignment_idx]["constituency_name"] = best_constituency_name
-            seen_constituency_names.add(best_constituency_name)
-            validated, _ = validate_assignment(assignment_data)
-            assert validated
-            score = score_assignment(assignment_data)["overall_score"]
-            print("Current score", score)
-
-    elector_balance_and_assignment_idx = []
-    for assignment_idx, annotation in enumerate(score_assignment(assignment_data)["annotations"]):
-        elector_balance_and_assignment_idx.append((annotation["elector_balance"], assignment_idx))
-    elector_balance_and_assignment_idx.sort()
-
-    early_termination = elector_balance_and_assignment_idx[0][0] == score_assignment(assignment_data)["overall_score"]
-    print(f"iteration {iteration}, early_termination {early_termination}")
-
-    for _, assignment_idx_1 in elector_balance_and_assignment_idx:
-        for _, assignment_idx_2 in elector_balance_and_assignment_idx:
-            if assignment_idx_1 == assignment_idx_2:
-                continue
-            constituency_name_1 = assignments[assignment_idx_1]["constituency_name"]
-            constituency_name_2 = assignments[assignment_idx_2]["constituency_name"]
-            for pair_iteration in range(10):
-                print(f"{constituency_name_1} {constituency_name_2} - iteration {pair_iteration}")
-                pairs_tried = set()
-
-                best_score = score_assignment(assignment_data)["overall_score"]
-                best_move_1_to_2 = []
-                best_move_2_to_1 = []
-
-                polling_districts_1: list[str] = assignments[assignment_idx_1]["polling_districts"]
-                polling_districts_2: list[str] = assignments[assignment_idx_2]["polling_districts"]
-                polling_districts_1_set = set(polling_districts_1)
-                polling_districts_2_set = set(polling_districts_2)
-
-                polling_districts_1_for_consideration = set()
-                polling_districts_2_for_consideration = set()
-                for a in polling_districts_1:
-                    for b in adjacency_data[a]:
-                        if b in polling_districts_2_set:
-                            polling_districts_1_for_consideration.add(a)
-                            polling_districts_2_for_consideration.add(b)
-
-                polling_districts_1_for_consideration = list(polling_districts_1_for_consideration)
-                polling_districts_2_for_consideration = list(polling_districts_2_for_consideration)
-
-                improvement_found = False
-                for a in polling_districts_1_for_consideration:
-                    polling_districts_1.remove(a)
-                    polling_districts_2.append(a)
-                    validated, _ = validate_assignment(assignment_data)
-                    if validated:
-                        score = score_assignment(assignment_data)["overall_score"]
-                        if score > best_score:
-                            print(f"Considering {score} after moving {a} from {constituency_name_1} to {constituency_name_2}")
-                            improvement_found = True
-                            best_score = score
-                            best_move_1_to_2 = [a]
-                    polling_districts_1.append(a)
-                    polling_districts_2.remove(a)
-
-                for a in polling_districts_1_for_consideration:
-                    for b in polling_districts_2_for_consideration:
-                        if (a, b) in pairs_tried:
-                            continue
+                    log(f"{constituency_name_1} {constituency_name_2} - iteration {pair_iteration}")
+                    pairs_tried = set()
+
+                    best_score = score_plan(assignment_data, current_hash, table)
+                    best_move_1_to_2 = []
+                    best_move_2_to_1 = []
+
+                    polling_districts_1: list[str] = assignments[assignment_idx_1]["polling_districts"]
+                    polling_districts_2: list[str] = assignments[assignment_idx_2]["polling_districts"]
+                    polling_districts_1_set = set(polling_districts_1)
+                    polling_districts_2_set = set(polling_districts_2)
+
+                    polling_districts_1_for_consideration = set()
+                    polling_districts_2_for_consideration = set()
+                    for a in polling_districts_1:
+                        for b in adjacency_data[a]:
+                            if b in polling_districts_2_set:
+                                polling_districts_1_for_consideration.add(a)
+                                polling_districts_2_for_consideration.add(b)
+
+                    # Sorted, so that the candidate order does not depend on string hashing and runs are reproducible
+                    polling_districts_1_for_consideration = sorted(polling_districts_1_for_consideration)
+                    polling_districts_2_for_consideration = sorted(polling_districts_2_for_consideration)
+                    if rng is not None:
+                        rng.shuffle(polling_districts_1_for_consideration)
+                        rng.shuffle(polling_districts_2_for_consideration)
+
+                    pair_moves = evaluate_pair_moves(assignment_data, assignment_idx_1, assignment_idx_2)
+                    valid = pair_moves["valid"]
+                    upper_bound = pair_moves["upper_bound"]
+
+                    improvement_found = False
+                    candidates = []
+                    candidate_hashes = {}
+                    for a in polling_districts_1_for_consideration:
                         polling_districts_1.remove(a)
-                        polling_districts_1.append(b)
-                        polling_districts_2.remove(b)
                         polling_districts_2.append(a)
-                        validated, _ = validate_assignment(assignment_data)
-                        if validated:
-                            score = score_assignment(assignment_data)["overall_score"]
+                        candidate_hash = candidate_hashes[((a,), ())] = move_hash(current_hash, a, assignment_idx_1, assignment_idx_2)
+                        candidate_idx = pair_moves["candidate_idxs"][((a,), ())]
+                        validated = valid[candidate_idx]
+                        if validated and screen_top_k:
+                            candidates.append(([a], []))
+                        elif validated and upper_bound[candidate_idx] > best_score - BOUND_TOLERANCE:
+                            score = score_plan(assignment_data, candidate_hash, table, best_score)
                             if score > best_score:
-                                print(f"Considering {score} after swapping {a} from {constituency_name_1} with {b} from {constituency_name_2}")
+                                log(f"Considering {score} after moving {a} from {constituency_name_1} to {constituency_name_2}")
                                 improvement_found = True
                                 best_score = score
                                 best_move_1_to_2 = [a]
-                                best_move_2_to_1 = [b]
-                        else:
-                            pairs_tried.add((a, b))
-                            pairs_tried.add((b, a))
-                        polling_districts_1.remove(b)
                         polling_districts_1.append(a)
                         polling_districts_2.remove(a)
-                        polling_districts_2.append(b)
 
-                if improvement_found:
-                    for a in best_move_1_to_2:
-                        print(f"Moving {a} from {constituency_name_1} to {constituency_name_2}")
-                        polling_districts_1.remove(a)
-                        polling_districts_2.append(a)
-                    for b in best_move_2_to_1:
-                        print(f"Moving {b} from {constituency_name_1} to {constituency_name_2}")
-                        polling_districts_2.remove(b)
-                        polling_districts_1.append(b)
-                    save_json(assignment_data, assignment_filepath)
-                    score_assignment_file(assignment_filename)
-
-                if not improvement_found:
-                    break
-
-        if early_termination:
-            break
+                    for a in polling_districts_1_for_consideration:
+                        for b in polling_districts_2_for_consideration:
+                            if (a, b) in pairs_tried:
+                                continue
+                            polling_districts_1.remove(a)
+                            polling_districts_1.append(b)
+                            polling_districts_2.remove(b)
+                            polling_districts_2.append(a)
+                            candidate_hash = candidate_hashes[((a,), (b,))] = move_hash(move_hash(current_hash, a, assignment_idx_1, assignment_idx_2), b, assignment_idx_2, assignment_idx_1)
+                            candidate_idx = pair_moves["candidate_idxs"][((a,), (b,))]
+                            validated = valid[candidate_idx]
+                            if validated and screen_top_k:
+                                candidates.append(([a], [b]))
+                            elif validated and upper_bound[candidate_idx] > best_score - BOUND_TOLERANCE:
+                                score = score_plan(assignment_data, candidate_hash, table, best_score)
+                                if score > best_score:
+                                    log(f"Considering {score} after swapping {a} from {constituency_name_1} with {b} from {constituency_name_2}")
+                                    improvement_found = True
+                                    best_score = score
+                                    best_move_1_to_2 = [a]
+                                    best_move_2_to_1 = [b]
+                            elif not validated:
+                                pairs_tried.add((a, b))
+                                pairs_tried.add((b, a))
+                            polling_districts_1.remove(b)
+                            polling_districts_1.append(a)
+                            polling_districts_2.remove(a)
+                            polling_districts_2.append(b)
+
+                    if candidates:
+                        best_score, best_move_1_to_2, best_move_2_to_1 = screen_candidates(
+                            assignment_data,
+                            candidates,
+                            constituency_name_1,
+                            constituency_name_2,
+                            polling_districts_1,
+                            polling_districts_2,
+                            best_score,
+                            screen_top_k,
+                            log=log,
+                            candidate_hashes=candidate_hashes,
+                            table=table,
+                        )
+                        improvement_found = bool(best_move_1_to_2 or best_move_2_to_1)
+
+                    if improvement_found:
+                        current_hash = candidate_hashes[(tuple(best_move_1_to_2), tuple(best_move_2_to_1))]
+                        for a in best_move_1_to_2:
+                            log(f"Moving {a} from {constituency_name_1} to {constituency_name_2}")
+                            polling_districts_1.remove(a)
+                            polling_districts_2.append(a)
+                        for b in best_move_2_to_1:
+                            log(f"Moving {b} from {constituency_name_1} to {constituency_name_2}")
+                            polling_districts_2.remove(b)
+                            polling_districts_1.append(b)
+                        if assignment_filename is not None:
+                            save_json(assignment_data, os.path.join("assignments", assignment_filename))
+                            score_assignment_file(assignment_filename)
+
+                    if not improvement_found:
+                        break
+
+            if early_termination:
+                break
+
+    if table is not None:
+        log(f"Transposition table: {table['hits']} hits, {table['misses']} misses, {len(table['scores'])} plans stored")
+    return score_assignment(assignment_data)["overall_score"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Improve the official assignment with local moves and swaps between constituency pairs.")
+    parser.add_argument("--screen-top-k", type=int, default=0, help="Rank valid candidates with the proxy score and only score the top K exactly (0 scores every candidate exactly)")
+    parser.add_argument("--seed", type=int, default=None, help="Shuffle the order in which constituency pairs and candidate districts are tried (the default order is fixed)")
+    parser.add_argument("--output", default="local_swap.json", help="Filename of the improved assignment in assignments/")
+    parser.add_argument("--transposition-table-size", type=int, default=TRANSPOSITION_TABLE_SIZE, help="Number of plan scores to remember so revisited plans are not scored again (0 disables)")
+    parser.add_argument("--profile", action="store_true", help="Run under cProfile and print a timing summary on exit")
+    args = parser.parse_args()
+
+    if args.profile:
+        # Registered at exit so that interrupted long runs still report where the time went
+        atexit.register(print_profile_summary, start_profiling())
+
+    assignment_data = load_json("assignments/official_ge_2025.json")
+    assignment_data["assignment_name"] = "With local optimization"
+    manifest = start_run_manifest("local_swap", args.seed, vars(args))
+    optimize(assignment_data, screen_top_k=args.screen_top_k, seed=args.seed, assignment_filename=args.output, transposition_table_size=args.transposition_table_size)
+    save_json(assignment_data, os.path.join("assignments", args.output))
+    score_assignment_file(args.output)
+    save_run_manifest(manifest, args.output)
@@ -0,0 +1,156 @@
+import argparse
+import atexit
+import heapq
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.score_assignments import score_assignment, score_assignment_proxy, validate_assignment, load_json, save_json, score_assignment_file, is_contiguous
+from scripts.score_assignments import start_profiling, print_profile_summary, adjacency_data
+from scripts.run_manifest import start_run_manifest, save_run_manifest
+
+# Gains below this are treated as no improvement, so that float noise does not cause endless moves
+MIN_GAIN = 1e-12
+
+
+def move_district(assignments, district, from_assignment_idx, to_assignment_idx):
+    assignments[from_assignment_idx]["polling_districts"].remove(district)
+    assignments[to_assignment_idx]["polling_districts"].append(district)
+
+
+def candidate_moves(districts, district_to_assignment_idx):
+    """Moves of each district to each constituency it borders, in a fixed order."""
+    for a in sorted(districts):
+        assignment_idx_1 = district_to_assignment_idx[a]
+        for assignment_idx_2 in sorted(set(district_to_assignment_idx[b] for b in adjacency_data[a]) - {assignment_idx_1}):
+            yield a, assignment_idx_1, assignment_idx_2
+
+
+def evaluate_move(assignment_data, a, assignment_idx_1, assignment_idx_2, current_proxy_score):
+    """Proxy score gain of a move, or None if the move would leave its constituency empty or split."""
+    assignments = assignment_data["assignment"]
+    polling_districts_1 = assignments[assignment_idx_1]["polling_districts"]
+    if len(polling_districts_1) == 1 or not is_contiguous([district for district in polling_districts_1 if district != a], adjacency_data):
+        return None
+    move_district(assignments, a, assignment_idx_1, assignment_idx_2)
+    score = score_assignment_proxy(assignment_data)["overall_score"]
+    move_district(assignments, a, assignment_idx_2, assignment_idx_1)
+    return score - current_proxy_score
+
+
+def optimize(assignment_data, max_moves=1000, deadline=None, assignment_filename=None, verbose=True):
+    """Best-improvement local search over single polling district moves, driven by a priority queue of move gains.
+
+    The queue holds every boundary move keyed by its proxy score gain (see score_assignment_proxy).
+    After a move from constituency i to constituency j, only the moves of districts in or bordering i and j
+    are regenerated, since the set of boundary moves and their contiguity only change there.
+    The gains of other moves can still change through the overall score (for example when the minimum elector balance moves),
+    so entries are stamped with the move count and re-evaluated lazily when they reach the top of the queue.
+    The best fresh move is then confirmed with the exact score before it is applied.
+
+    Returns the overall score of the final assignment.
+    """
+    log = print if verbose else lambda *args, **kwargs: None
+    assignments = assignment_data["assignment"]
+    district_to_assignment_idx = {district: assignment_idx for assignment_idx, item in enumerate(assignments) for district in item["polling_districts"]}
+
+    best_score = score_assignment(assignment_data)["overall_score"]
+    proxy_score = score_assignment_proxy(assignment_data)["overall_score"]
+    move_count = 0
+    evaluations = 0
+
+    # Entries are (-gain, district, from, to, move count when evaluated)
+    queue = []
+    for a, assignment_idx_1, assignment_idx_2 in candidate_moves(district_to_assignment_idx, district_to_assignment_idx):
+        gain = evaluate_move(assignment_data, a, assignment_idx_1, assignment_idx_2, proxy_score)
+        evaluations += 1
+        if gain is not None:
+            queue.append((-gain, a, assignment_idx_1, assignment_idx_2, move_count))
+    heapq.heapify(queue)
+    log(f"Initial score {best_score}, {len(queue)} candidate moves")
+
+    # Moves that failed the exact check, which are retried once either of their constituencies changes
+    rejected = set()
+    assignment_versions = [0] * len(assignments)
+
+    while queue and move_count < max_moves:
+        if deadline is not None and time.time() > deadline:
+            log("Deadline reached")
+            break
+
+        negative_gain, a, assignment_idx_1, assignment_idx_2, evaluated_at = heapq.heappop(queue)
+        if district_to_assignment_idx[a] != assignment_idx_1:
+            continue
+        if (a, assignment_idx_1, assignment_idx_2, assignment_versions[assignment_idx_1], assignment_versions[assignment_idx_2]) in rejected:
+            continue
+
+        if evaluated_at != move_count:
+            # Stale entry, re-evaluate it and put it back in order
+            gain = evaluate_move(assignment_data, a, assignment_idx_1, assignment_idx_2, proxy_score)
+            evaluations += 1
+            if gain is not None:
+                heapq.heappush(queue, (-gain, a, assignment_idx_1, assignment_idx_2, move_count))
+            continue
+
+        if -negative_gain < MIN_GAIN:
+            log("No improving move left")
+            break
+
+        move_district(assignments, a, assignment_idx_1, assignment_idx_2)
+        score = score_assignment(assignment_data, threshold=best_score)["overall_score"]
+        if score <= best_score:
+            move_district(assignments, a, assignment_idx_2, assignment_idx_1)
+            rejected.add((a, assignment_idx_1, assignment_idx_2, assignment_versions[assignment_idx_1], assignment_versions[assignment_idx_2]))
+            continue
+
+        constituency_name_1 = assignments[assignment_idx_1]["constituency_name"]
+        constituency_name_2 = assignments[assignment_idx_2]["constituency_name"]
+        log(f"Moving {a} from {constituency_name_1} to {constituency_name_2}, score {score} ({evaluations} evaluations so far)")
+        best_score = score
+        district_to_assignment_idx[a] = assignment_idx_2
+        proxy_score = score_assignment_proxy(assignment_data)["overall_score"]
+        move_count += 1
+        assignment_versions[assignment_idx_1] += 1
+        assignment_versions[assignment_idx_2] += 1
+
+        # Regenerate the moves whose districts are in or border the two changed constituencies
+        changed_districts = set(assignments[assignment_idx_1]["polling_districts"]) | set(assignments[assignment_idx_2]["polling_districts"])
+        nearby_districts = changed_districts | set(b for district in changed_districts for b in adjacency_data[district])
+        for b, candidate_idx_1, candidate_idx_2 in candidate_moves(nearby_districts, district_to_assignment_idx):
+            if {candidate_idx_1, candidate_idx_2} & {assignment_idx_1, assignment_idx_2}:
+                gain = evaluate_move(assignment_data, b, candidate_idx_1, candidate_idx_2, proxy_score)
+                evaluations += 1
+                if gain is not None:
+                    heapq.heappush(queue, (-gain, b, candidate_idx_1, candidate_idx_2, move_count))
+
+        if assignment_filename is not None:
+            validated, errors = validate_assignment(assignment_data)
+            assert validated, errors
+            save_json(assignment_data, os.path.join("assignments", assignment_filename))
+            score_assignment_file(assignment_filename)
+
+    log(f"Finished after {move_count} moves and {evaluations} evaluations")
+    return score_assignment(assignment_data)["overall_score"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Improve the official assignment with a best-improvement local search over a priority queue of move gains.")
+    parser.add_argument("--max-moves", type=int, default=1000, help="Maximum number of moves to apply")
+    parser.add_argument("--budget", type=float, default=None, help="Wall-clock budget in seconds")
+    parser.add_argument("--output", default="move_gain_search.json", help="Filename of the improved assignment in assignments/")
+    parser.add_argument("--profile", action="store_true", help="Run under cProfile and print a timing summary on exit")
+    args = parser.parse_args()
+
+    if args.profile:
+        atexit.register(print_profile_summary, start_profiling())
+
+    assignment_data = load_json("assignments/official_ge_2025.json")
+    assignment_data["assignment_name"] = "With move-gain local search"
+    deadline = time.time() + args.budget if args.budget is not None else None
+    manifest = start_run_manifest("move_gain_search", None, vars(args))
+    optimize(assignment_data, max_moves=args.max_moves, deadline=deadline, assignment_filename=args.output)
+    save_json(assignment_data, os.path.join("assignments", args.output))
+    score_assignment_file(args.output)
+    save_run_manifest(manifest, args.output)
@@ -0,0 +1,133 @@
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.scoring_dataset import attach_shared_dataset, release_shared_dataset
+
+# The scoring modules are imported inside the functions rather than here.
+# Spawned workers import this module before their initializer runs, and importing score_assignments
+# at that point would parse the data files instead of attaching the shared dataset.
+
+with open("assignments/official_ge_2025.json", "r") as f:
+    official_assignment_data = json.load(f)
+
+
+def perturb_assignment(assignment_data, rng, num_moves):
+    """Move random boundary polling districts to an adjacent constituency, keeping the assignment valid."""
+    from scripts.score_assignments import adjacency_data, validate_assignment
+
+    assignments = assignment_data["assignment"]
+    district_to_assignment_idx = {district: assignment_idx for assignment_idx, item in enumerate(assignments) for district in item["polling_districts"]}
+
+    moves_made = 0
+    for _ in range(num_moves * 20):
+        if moves_made == num_moves:
+            break
+        assignment_idx_1 = rng.randrange(len(assignments))
+        polling_districts_1 = assignments[assignment_idx_1]["polling_districts"]
+        a = rng.choice(polling_districts_1)
+        adjacent_assignment_idxs = sorted(set(district_to_assignment_idx[b] for b in adjacency_data[a]) - {assignment_idx_1})
+        if not adjacent_assignment_idxs or len(polling_districts_1) == 1:
+            continue
+        assignment_idx_2 = rng.choice(adjacent_assignment_idxs)
+        polling_districts_2 = assignments[assignment_idx_2]["polling_districts"]
+
+        polling_districts_1.remove(a)
+        polling_districts_2.append(a)
+        validated, _ = validate_assignment(assignment_data)
+        if validated:
+            district_to_assignment_idx[a] = assignment_idx_2
+            moves_made += 1
+        else:
+            polling_districts_2.remove(a)
+            polling_districts_1.append(a)
+    return moves_made
+
+
+def run_start(run_id, seed, perturbation_moves, iterations, screen_top_k, deadline):
+    """One independent optimizer run, executed in a worker process."""
+    from algorithms.local_swap import optimize
+
+    if time.time() > deadline:
+        return None
+
+    start_time = time.time()
+    rng = random.Random(seed)
+    assignment_data = copy.deepcopy(official_assignment_data)
+    moves_made = perturb_assignment(assignment_data, rng, perturbation_moves) if perturbation_moves else 0
+    overall_score = optimize(assignment_data, iterations=iterations, screen_top_k=screen_top_k, seed=seed, deadline=deadline, verbose=False)
+    return {
+        "run_id": run_id,
+        "seed": seed,
+        "perturbation_moves": moves_made,
+        "overall_score": overall_score,
+        "seconds": time.time() - start_time,
+        "assignment_data": assignment_data,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several local swap optimizations in parallel from perturbed official assignments and keep the best.")
+    parser.add_argument("--runs", type=int, default=8, help="Number of independent optimizer runs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--budget", type=float, default=3600, help="Global wall-clock budget in seconds, shared by all runs")
+    parser.add_argument("--perturbation-moves", type=int, default=20, help="Random boundary moves applied to the official assignment before each run (run 0 is not perturbed)")
+    parser.add_argument("--iterations", type=int, default=10, help="Outer iterations of each local swap run")
+    parser.add_argument("--screen-top-k", type=int, default=0, help="Passed to local swap, see algorithms/local_swap.py")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed, run i uses seed + i")
+    parser.add_argument("--output", default="multi_start.json", help="Filename of the best assignment in assignments/")
+    args = parser.parse_args()
+
+    from scripts.score_assignments import save_json, validate_assignment, score_assignment_file, export_scoring_dataset
+    from scripts.run_manifest import start_run_manifest, save_run_manifest
+
+    manifest = start_run_manifest("multi_start", args.seed, vars(args))
+    deadline = time.time() + args.budget
+
+    # Workers attach to one read-only copy of the scoring data in shared memory, see scripts/scoring_dataset.py
+    shared_memory_blocks, dataset_spec = export_scoring_dataset()
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"), initializer=attach_shared_dataset, initargs=(dataset_spec,)) as executor:
+            futures = [
+                executor.submit(run_start, run_id, args.seed + run_id, args.perturbation_moves if run_id > 0 else 0, args.iterations, args.screen_top_k, deadline) for run_id in range(args.runs)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                if result is None:
+                    continue
+                print(f"Run {result['run_id']} (seed {result['seed']}) finished with score {result['overall_score']} in {result['seconds']:.0f}s")
+                results.append(result)
+    finally:
+        release_shared_dataset(shared_memory_blocks)
+
+    if not results:
+        print("No run finished within the budget")
+        return
+
+    results.sort(key=lambda result: (-result["overall_score"], result["run_id"]))
+    best_result = results[0]
+    validated, errors = validate_assignment(best_result["assignment_data"])
+    assert validated, errors
+
+    best_result["assignment_data"]["assignment_name"] = f"Best of {len(results)} local swap runs"
+    save_json(best_result["assignment_data"], os.path.join("assignments", args.output))
+    score_assignment_file(args.output)
+    save_run_manifest(manifest, args.output, timings={"best_run_seconds": best_result["seconds"]})
+
+    leaderboard = [{key: value for key, value in result.items() if key != "assignment_data"} for result in results]
+    leaderboard_filename = args.output.replace(".json", "_leaderboard.json")
+    save_json({"leaderboard": leaderboard}, os.path.join("annotations", leaderboard_filename), noindent=False)
+    print(f"Best run {best_result['run_id']} scored {best_result['overall_score']}, leaderboard saved to annotations/{leaderboard_filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import atexit
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.score_assignments import score_assignment, score_assignment_proxy, validate_assignment, load_json, save_json, score_assignment_file, calculate_shared_boundary_length
+from scripts.score_assignments import start_profiling, print_profile_summary, adjacency_data, district_to_elector_size
+from scripts.run_manifest import start_run_manifest, save_run_manifest
+from algorithms import move_gain_search
+from algorithms.move_gain_search import MIN_GAIN
+
+
+def get_district_to_group_idx(groups):
+    return {district: group_idx for group_idx, group in enumerate(groups) for district in group}
+
+
+def group_edge_weights(groups):
+    """Shared boundary length between each pair of adjacent groups, keyed by group index then adjacent group index."""
+    district_to_group_idx = get_district_to_group_idx(groups)
+    edge_weights = [{} for _ in groups]
+    for group_idx, group in enumerate(groups):
+        for district in group:
+            for adjacent in adjacency_data[district]:
+                adjacent_group_idx = district_to_group_idx[adjacent]
+                if adjacent_group_idx != group_idx:
+                    edge_weights[group_idx][adjacent_group_idx] = edge_weights[group_idx].get(adjacent_group_idx, 0.0) + calculate_shared_boundary_length(district, adjacent)
+    return edge_weights
+
+
+def coarsen(groups, district_to_assignment_idx, max_group_electors, rng):
+    """Merge pairs of adjacent groups of the same constituency by heavy edge matching.
+
+    Groups are visited from the smallest elector size up (ties in random order), and each unmatched group is merged with
+    the unmatched neighbour it shares the longest boundary with, as long as the merged elector size stays within the cap.
+    Groups never span two constituencies, so the assignment can be expressed at every level.
+    """
+    edge_weights = group_edge_weights(groups)
+    group_electors = [sum(district_to_elector_size.get(district, 0) for district in group) for group in groups]
+    order = list(range(len(groups)))
+    rng.shuffle(order)
+    order.sort(key=lambda group_idx: group_electors[group_idx])
+
+    matched = [False] * len(groups)
+    coarse_groups = []
+    for group_idx in order:
+        if matched[group_idx]:
+            continue
+        matched[group_idx] = True
+        assignment_idx = district_to_assignment_idx[groups[group_idx][0]]
+        best_weight = 0.0
+        best_group_idx = None
+        for adjacent_group_idx, weight in sorted(edge_weights[group_idx].items()):
+            if matched[adjacent_group_idx] or district_to_assignment_idx[groups[adjacent_group_idx][0]] != assignment_idx:
+                continue
+            if group_electors[group_idx] + group_electors[adjacent_group_idx] > max_group_electors:
+                continue
+            if weight > best_weight:
+                best_weight = weight
+                best_group_idx = adjacent_group_idx
+        if best_group_idx is None:
+            coarse_groups.append(groups[group_idx])
+        else:
+            matched[best_group_idx] = True
+            coarse_groups.append(tuple(sorted(groups[group_idx] + groups[best_group_idx])))
+    return sorted(coarse_groups)
+
+
+def build_levels(assignment_data, max_group_electors, min_groups, rng, log=print):
+    """Groups of polling districts at each level, from the single districts up to the coarsest level."""
+    district_to_assignment_idx = {district: assignment_idx for assignment_idx, item in enumerate(assignment_data["assignment"]) for district in item["polling_districts"]}
+    levels = [sorted((district,) for district in district_to_assignment_idx)]
+    while len(levels[-1]) > min_groups:
+        coarse_groups = coarsen(levels[-1], district_to_assignment_idx, max_group_electors, rng)
+        # Stop once matching no longer shrinks the graph by a tenth, as the remaining groups are at the elector cap
+        if len(coarse_groups) > 0.9 * len(levels[-1]):
+            break
+        levels.append(coarse_groups)
+        log(f"Level {len(levels) - 1}: {len(coarse_groups)} groups")
+    return levels
+
+
+def move_group(assignments, group, from_assignment_idx, to_assignment_idx):
+    for district in group:
+        assignments[from_assignment_idx]["polling_districts"].remove(district)
+        assignments[to_assignment_idx]["polling_districts"].append(district)
+
+
+def refine_level(assignment_data, groups, best_score, confirm_top_k, max_moves, deadline=None, log=print):
+    """Move whole groups between adjacent constituencies while the exact score improves.
+
+    Each pass ranks every boundary group move by its proxy score gain, and confirms the best few with the exact score.
+    The first confirmed move is applied and the next pass starts from the new assignment.
+    Returns the new best score and the number of moves applied.
+    """
+    assignments = assignment_data["assignment"]
+    edge_weights = group_edge_weights(groups)
+    move_count = 0
+    while move_count < max_moves:
+        if deadline is not None and time.time() > deadline:
+            log("Deadline reached")
+            break
+
+        district_to_assignment_idx = {district: assignment_idx for assignment_idx, item in enumerate(assignments) for district in item["polling_districts"]}
+        proxy_score = score_assignment_proxy(assignment_data)["overall_score"]
+        ranked_moves = []
+        for group_idx, group in enumerate(groups):
+            assignment_idx_1 = district_to_assignment_idx[group[0]]
+            if len(group) == len(assignments[assignment_idx_1]["polling_districts"]):
+                continue
+            for assignment_idx_2 in sorted(set(district_to_assignment_idx[groups[adjacent_group_idx][0]] for adjacent_group_idx in edge_weights[group_idx]) - {assignment_idx_1}):
+                move_group(assignments, group, assignment_idx_1, assignment_idx_2)
+                if validate_assignment(assignment_data)[0]:
+                    gain = score_assignment_proxy(assignment_data)["overall_score"] - proxy_score
+                    if gain > MIN_GAIN:
+                        ranked_moves.append((-gain, group_idx, assignment_idx_1, assignment_idx_2))
+                move_group(assignments, group, assignment_idx_2, assignment_idx_1)
+        ranked_moves.sort()
+
+        applied = False
+        for _, group_idx, assignment_idx_1, assignment_idx_2 in ranked_moves[:confirm_top_k]:
+            move_group(assignments, groups[group_idx], assignment_idx_1, assignment_idx_2)
+            score = score_assignment(assignment_data, threshold=best_score)["overall_score"]
+            if score > best_score:
+                log(f"Moving {len(groups[group_idx])} districts from {assignments[assignment_idx_1]['constituency_name']} to {assignments[assignment_idx_2]['constituency_name']}, score {score}")
+                best_score = score
+                move_count += 1
+                applied = True
+                break
+            move_group(assignments, groups[group_idx], assignment_idx_2, assignment_idx_1)
+        if not applied:
+            break
+    return best_score, move_count
+
+
+def optimize(assignment_data, max_group_fraction=0.25, min_groups=200, confirm_top_k=5, max_moves=1000, seed=None, deadline=None, assignment_filename=None, verbose=True):
+    """Multilevel optimization: coarsen the adjacency graph, improve the assignment on the coarse graph, then refine level by level.
+
+    The polling districts of each constituency are merged into groups by heavy edge matching (see coarsen), capped at
+    max_group_fraction of the mean elector size of a constituency, until there are at most min_groups groups.
+    Starting from the coarsest level, whole groups are moved between constituencies (see refine_level), which makes large
+    changes with few moves. Each finer level splits the groups again, and the single districts are finally refined by
+    the move-gain local search (see algorithms/move_gain_search.py). Every applied move is confirmed with the exact score.
+
+    The seed breaks ties in the matching order. Returns the overall score of the final assignment.
+    """
+    log = print if verbose else lambda *args, **kwargs: None
+    rng = random.Random(seed)
+    assignments = assignment_data["assignment"]
+
+    mean_constituency_electors = sum(district_to_elector_size.values()) / len(assignments)
+    levels = build_levels(assignment_data, max_group_fraction * mean_constituency_electors, min_groups, rng, log=log)
+
+    best_score = score_assignment(assignment_data)["overall_score"]
+    log(f"Initial score {best_score}, {len(levels)} levels")
+    total_moves = 0
+    for level_idx in range(len(levels) - 1, 0, -1):
+        best_score, move_count = refine_level(assignment_data, levels[level_idx], best_score, confirm_top_k, max_moves - total_moves, deadline=deadline, log=log)
+        total_moves += move_count
+        log(f"Level {level_idx} ({len(levels[level_idx])} groups): {move_count} moves, score {best_score}")
+        if assignment_filename is not None and move_count:
+            save_json(assignment_data, os.path.join("assignments", assignment_filename))
+            score_assignment_file(assignment_filename)
+
+    # The finest level moves single districts, which the move-gain search does with incremental gain updates
+    return move_gain_search.optimize(assignment_data, max_moves=max_moves - total_moves, deadline=deadline, assignment_filename=assignment_filename, verbose=verbose)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Improve the official assignment by multilevel coarsening, coarse optimization and refinement.")
+    parser.add_argument("--max-group-fraction", type=float, default=0.25, help="Cap on the elector size of a merged group, as a fraction of the mean constituency elector size")
+    parser.add_argument("--min-groups", type=int, default=200, help="Stop coarsening at this number of groups")
+    parser.add_argument("--confirm-top-k", type=int, default=5, help="Group moves confirmed with the exact score per pass, in proxy gain order")
+    parser.add_argument("--max-moves", type=int, default=1000, help="Maximum number of moves over all levels")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the matching order")
+    parser.add_argument("--budget", type=float, default=None, help="Wall-clock budget in seconds")
+    parser.add_argument("--output", default="multilevel.json", help="Filename of the improved assignment in assignments/")
+    parser.add_argument("--profile", action="store_true", help="Run under cProfile and print a timing summary on exit")
+    args = parser.parse_args()
+
+    if args.profile:
+        atexit.register(print_profile_summary, start_profiling())
+
+    assignment_data = load_json("assignments/official_ge_2025.json")
+    assignment_data["assignment_name"] = "With multilevel optimization"
+    deadline = time.time() + args.budget if args.budget is not None else None
+    manifest = start_run_manifest("multilevel", args.seed, vars(args))
+    optimize(
+        assignment_data,
+        max_group_fraction=args.max_group_fraction,
+        min_groups=args.min_groups,
+        confirm_top_k=args.confirm_top_k,
+        max_moves=args.max_moves,
+        seed=args.seed,
+        deadline=deadline,
+        assignment_filename=args.output,
+    )
+    save_json(assignment_data, os.path.join("assignments", args.output))
+    score_assignment_file(args.output)
+    save_run_manifest(manifest, args.output)
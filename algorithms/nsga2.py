@@ -0,0 +1,200 @@
+import argparse
+import copy
+import glob
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.score_assignments import score_assignment, validate_assignment, load_json, save_json, score_assignment_file
+from scripts.run_manifest import start_run_manifest, save_run_manifest
+from algorithms.multi_start import perturb_assignment
+
+# Plan objectives, all maximised: the member-weighted mean of each constituency metric, and the minimum elector balance
+# (the overall score is capped by the minimum elector balance, so the mean would hide the constituency that binds)
+OBJECTIVES = ["nonenclavity", "compactness", "convexity", "relevance", "elector_balance"]
+
+
+def plan_key(assignment_data):
+    return tuple(tuple(sorted(item["polling_districts"])) for item in assignment_data["assignment"])
+
+
+def evaluate_plan(assignment_data):
+    """Objectives and overall score of a plan, as one task for a worker process."""
+    results = score_assignment(assignment_data)
+    annotations = results["annotations"]
+    total_member_size = sum(annotation["member_size"] for annotation in annotations)
+    objectives = [sum(annotation[metric] * annotation["member_size"] for annotation in annotations) / total_member_size for metric in OBJECTIVES[:-1]]
+    objectives.append(min(annotation["elector_balance"] for annotation in annotations))
+    return tuple(objectives), results["overall_score"]
+
+
+def dominates(objectives_1, objectives_2):
+    return all(a >= b for a, b in zip(objectives_1, objectives_2)) and any(a > b for a, b in zip(objectives_1, objectives_2))
+
+
+def non_dominated_sort(objectives):
+    """Indices of the plans in each Pareto front, best front first."""
+    dominated_by = [[] for _ in objectives]
+    domination_counts = [0] * len(objectives)
+    for i in range(len(objectives)):
+        for j in range(len(objectives)):
+            if dominates(objectives[i], objectives[j]):
+                dominated_by[i].append(j)
+            elif dominates(objectives[j], objectives[i]):
+                domination_counts[i] += 1
+
+    fronts = [[i for i in range(len(objectives)) if domination_counts[i] == 0]]
+    while fronts[-1]:
+        next_front = []
+        for i in fronts[-1]:
+            for j in dominated_by[i]:
+                domination_counts[j] -= 1
+                if domination_counts[j] == 0:
+                    next_front.append(j)
+        fronts.append(sorted(next_front))
+    return fronts[:-1]
+
+
+def crowding_distances(front, objectives):
+    """Crowding distance of each plan in a front. The extreme plans of every objective get an infinite distance."""
+    distances = {i: 0.0 for i in front}
+    for objective_idx in range(len(OBJECTIVES)):
+        ordered = sorted(front, key=lambda i: (objectives[i][objective_idx], i))
+        low, high = objectives[ordered[0]][objective_idx], objectives[ordered[-1]][objective_idx]
+        distances[ordered[0]] = distances[ordered[-1]] = float("inf")
+        if high == low:
+            continue
+        for previous, current, following in zip(ordered, ordered[1:], ordered[2:]):
+            distances[current] += (objectives[following][objective_idx] - objectives[previous][objective_idx]) / (high - low)
+    return distances
+
+
+def select_survivors(objectives, population_size):
+    """NSGA-II environmental selection: whole fronts while they fit, then the least crowded plans of the next front."""
+    survivors = []
+    ranks = {}
+    for rank, front in enumerate(non_dominated_sort(objectives)):
+        for i in front:
+            ranks[i] = rank
+        if len(survivors) + len(front) <= population_size:
+            survivors.extend(front)
+        else:
+            distances = crowding_distances(front, objectives)
+            survivors.extend(sorted(front, key=lambda i: (-distances[i], i))[: population_size - len(survivors)])
+            break
+    return survivors, ranks
+
+
+def optimize(initial_plans, population_size=24, generations=20, mutation_moves=3, seed=0, jobs=1, deadline=None, verbose=True):
+    """Evolve a population of plans towards the Pareto front of the five metrics.
+
+    Offspring are copies of tournament-selected parents with a few random boundary moves that keep the plan valid.
+    Partitions do not recombine without breaking contiguity, so there is no crossover.
+    Each generation's offspring are scored as one batch on the worker processes, and the objectives of every plan seen so far
+    are cached by plan, so a plan that reappears is not scored again.
+    Returns the plans and objectives of the final Pareto front.
+    """
+    log = print if verbose else lambda *args, **kwargs: None
+    rng = random.Random(seed)
+    evaluated = {}
+
+    # Forked workers inherit the loaded scoring data, and keep their metric caches from generation to generation
+    mp_context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=mp_context) as executor:
+
+        def evaluate(plans):
+            new_plans = {}
+            for plan in plans:
+                if plan_key(plan) not in evaluated:
+                    new_plans.setdefault(plan_key(plan), plan)
+            for key, result in zip(new_plans, executor.map(evaluate_plan, new_plans.values())):
+                evaluated[key] = result
+            return [evaluated[plan_key(plan)][0] for plan in plans]
+
+        population = [copy.deepcopy(plan) for plan in initial_plans]
+        while len(population) < population_size:
+            plan = copy.deepcopy(rng.choice(initial_plans))
+            perturb_assignment(plan, rng, mutation_moves * 3)
+            population.append(plan)
+        objectives = evaluate(population)
+        survivors, ranks = select_survivors(objectives, population_size)
+        population = [population[i] for i in survivors]
+        objectives = [objectives[i] for i in survivors]
+        ranks = [ranks[i] for i in survivors]
+
+        for generation in range(generations):
+            if deadline is not None and time.time() > deadline:
+                log("Deadline reached")
+                break
+            start_time = time.time()
+
+            distances = {}
+            for rank in set(ranks):
+                distances.update(crowding_distances([i for i in range(len(population)) if ranks[i] == rank], objectives))
+
+            offspring = []
+            while len(offspring) < population_size:
+                # Binary tournament on rank, then crowding distance
+                i, j = rng.randrange(len(population)), rng.randrange(len(population))
+                parent = i if (ranks[i], -distances[i]) <= (ranks[j], -distances[j]) else j
+                child = copy.deepcopy(population[parent])
+                if perturb_assignment(child, rng, mutation_moves):
+                    offspring.append(child)
+
+            combined = population + offspring
+            combined_objectives = objectives + evaluate(offspring)
+            # Identical plans would crowd out the rest of the front
+            unique = list({plan_key(plan): i for i, plan in reversed(list(enumerate(combined)))}.values())
+            unique.sort()
+            survivors, combined_ranks = select_survivors([combined_objectives[i] for i in unique], population_size)
+            population = [combined[unique[i]] for i in survivors]
+            objectives = [combined_objectives[unique[i]] for i in survivors]
+            ranks = [combined_ranks[i] for i in survivors]
+            log(f"Generation {generation}: front of {ranks.count(0)} plans, {len(evaluated)} plans scored, {time.time() - start_time:.1f}s")
+
+    front = [i for i in range(len(population)) if ranks[i] == 0]
+    return [population[i] for i in front], [objectives[i] for i in front]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Explore the Pareto front of the five metrics with NSGA-II, starting from the official assignment.")
+    parser.add_argument("--population", type=int, default=24, help="Population size")
+    parser.add_argument("--generations", type=int, default=20, help="Number of generations")
+    parser.add_argument("--mutation-moves", type=int, default=3, help="Random boundary moves applied to each offspring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="Number of worker processes that score the offspring")
+    parser.add_argument("--budget", type=float, default=None, help="Wall-clock budget in seconds")
+    parser.add_argument("--max-front-files", type=int, default=10, help="Largest number of front plans written to assignments/, the least crowded first")
+    args = parser.parse_args()
+
+    official_assignment_data = load_json("assignments/official_ge_2025.json")
+    deadline = time.time() + args.budget if args.budget is not None else None
+    manifest = start_run_manifest("nsga2", args.seed, vars(args))
+    front_plans, front_objectives = optimize(
+        [official_assignment_data], population_size=args.population, generations=args.generations, mutation_moves=args.mutation_moves, seed=args.seed, jobs=args.jobs, deadline=deadline
+    )
+
+    # Write the spread-out plans of the front first, so that a limited number of files still covers the extremes
+    distances = crowding_distances(list(range(len(front_plans))), front_objectives)
+    order = sorted(range(len(front_plans)), key=lambda i: (-distances[i], i))[: args.max_front_files]
+    # Plans of an earlier run with a larger front would otherwise be left behind next to this front
+    for stale_file in glob.glob("assignments/pareto_*.json") + glob.glob("annotations/pareto_*"):
+        os.remove(stale_file)
+    summary = []
+    for file_idx, i in enumerate(order):
+        plan = front_plans[i]
+        validated, errors = validate_assignment(plan)
+        assert validated, errors
+        assignment_file = f"pareto_{file_idx:02d}.json"
+        plan["assignment_name"] = f"Pareto front plan {file_idx}"
+        save_json(plan, os.path.join("assignments", assignment_file))
+        score_assignment_file(assignment_file)
+        save_run_manifest(manifest, assignment_file)
+        summary.append({"assignment_file": assignment_file, **dict(zip(OBJECTIVES, front_objectives[i]))})
+    save_json({"objectives": OBJECTIVES, "front": summary}, os.path.join("annotations", "pareto_front.json"), noindent=False)
+    print(f"Wrote {len(summary)} of {len(front_plans)} front plans to assignments/pareto_*.json, summary in annotations/pareto_front.json")
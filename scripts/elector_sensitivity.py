@@ -0,0 +1,130 @@
+"""Sensitivity of the scores of an assignment to the estimated elector sizes of the polling districts.
+
+Annex B of the Electoral Boundaries Review Committee report only gives the elector size of groups of polling districts
+(raw_data/ge2025_polling_districts_and_elector_size.json), and scripts/estimate_elector_size.py splits each group
+evenly. Here plausible elector size vectors are sampled instead: the shares of the districts of a group are drawn
+from a symmetric Dirichlet distribution and the electors of the group from a multinomial with those shares, so every
+sample keeps the Annex B totals exactly.
+
+Only the elector balance and relevance depend on the elector sizes. Both are sums over the districts of a
+constituency (relevance is a ratio of two such sums), so for a batch of samples they are matrix products of the
+samples with a district by constituency weight matrix. The nonenclavity, compactness and convexity are scored once,
+which gives the constituency and overall scores of every sample without calling score_assignment per sample.
+
+Usage: python scripts/elector_sensitivity.py assignments/official_ge_2025.json --samples 10000
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.score_assignments import load_json, score_assignment, calculate_relevance_weights, district_to_elector_size
+
+ELECTOR_GROUPS_FILE = "raw_data/ge2025_polling_districts_and_elector_size.json"
+
+# Dirichlet concentration of each district's share of its group, the relative standard deviation of a district's
+# elector size is about 1 / sqrt(CONCENTRATION + 1), and higher values stay closer to the even split
+CONCENTRATION = 3.0
+
+# Samples drawn and scored together, which bounds the memory of the sample matrices
+BATCH_SIZE = 1000
+
+PERCENTILES = [5, 50, 95]
+
+
+def sample_elector_sizes(elector_groups: List[Dict[str, Any]], districts: List[str], num_samples: int, concentration: float, rng: np.random.Generator) -> np.ndarray:
+    """Matrix of sampled elector sizes, one row per sample and one column per district, that sum to the total of each group."""
+    district_idxs = {district: district_idx for district_idx, district in enumerate(districts)}
+    samples = np.zeros((num_samples, len(districts)))
+    for group in elector_groups:
+        columns = [district_idxs[district] for district in group["polling_districts"]]
+        shares = rng.dirichlet(np.full(len(columns), concentration), size=num_samples)
+        samples[:, columns] = rng.multinomial(group["elector_size"], shares)
+    return samples
+
+
+def build_weight_matrices(assignment_data: Dict[str, Any], districts: List[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """District by constituency matrices whose products with the elector sizes give the elector size, and the relevance numerator and denominator of each constituency."""
+    district_idxs = {district: district_idx for district_idx, district in enumerate(districts)}
+    membership = np.zeros((len(districts), len(assignment_data["assignment"])))
+    relevance_numerator = np.zeros_like(membership)
+    relevance_denominator = np.zeros_like(membership)
+    for assignment_idx, item in enumerate(assignment_data["assignment"]):
+        rows = [district_idxs[district] for district in item["polling_districts"]]
+        membership[rows, assignment_idx] = 1
+        relevance_numerator[rows, assignment_idx], relevance_denominator[rows, assignment_idx] = calculate_relevance_weights(item["constituency_name"], tuple(item["polling_districts"]))
+    return membership, relevance_numerator, relevance_denominator
+
+
+def score_samples(
+    elector_sizes: np.ndarray, membership: np.ndarray, relevance_numerator: np.ndarray, relevance_denominator: np.ndarray, member_sizes: np.ndarray, fixed_metrics: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """Scores of a batch of elector size samples, as in calculate_overall_score.
+
+    fixed_metrics is the sum of the nonenclavity, compactness and convexity of each constituency, which do not depend on the elector sizes.
+    """
+    constituency_elector_sizes = elector_sizes @ membership
+    electors_per_member = constituency_elector_sizes / member_sizes
+    mean_electors_per_member = (constituency_elector_sizes.sum(axis=1) / member_sizes.sum())[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        elector_balance = np.nan_to_num(np.minimum(electors_per_member / mean_electors_per_member, mean_electors_per_member / electors_per_member))
+        relevance = (elector_sizes @ relevance_numerator) / (elector_sizes @ relevance_denominator)
+    constituency_score = np.minimum((fixed_metrics + relevance + elector_balance) / 5, elector_balance)
+    overall_score = np.minimum(constituency_score @ member_sizes / member_sizes.sum(), elector_balance.min(axis=1))
+    return {"elector_balance": elector_balance, "relevance": relevance, "constituency_score": constituency_score, "overall_score": overall_score}
+
+
+def run_sensitivity(assignment_data: Dict[str, Any], num_samples: int = 10000, concentration: float = CONCENTRATION, seed: int = 0, elector_groups: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Score distributions of an assignment over sampled elector sizes.
+
+    Returns the score_assignment results under the estimated elector sizes as "results", and arrays with one row per
+    sample: "elector_balance", "relevance" and "constituency_score" with one column per constituency, and "overall_score".
+    """
+    if elector_groups is None:
+        elector_groups = load_json(ELECTOR_GROUPS_FILE)
+    rng = np.random.default_rng(seed)
+    districts = sorted(district_to_elector_size)
+    results = score_assignment(assignment_data)
+    membership, relevance_numerator, relevance_denominator = build_weight_matrices(assignment_data, districts)
+    member_sizes = np.array([annotation["member_size"] for annotation in results["annotations"]], dtype=float)
+    fixed_metrics = np.array([annotation["nonenclavity"] + annotation["compactness"] + annotation["convexity"] for annotation in results["annotations"]])
+
+    batches = []
+    for batch_start in range(0, num_samples, BATCH_SIZE):
+        elector_sizes = sample_elector_sizes(elector_groups, districts, min(BATCH_SIZE, num_samples - batch_start), concentration, rng)
+        batches.append(score_samples(elector_sizes, membership, relevance_numerator, relevance_denominator, member_sizes, fixed_metrics))
+    sensitivity = {key: np.concatenate([batch[key] for batch in batches]) for key in batches[0]}
+    sensitivity["results"] = results
+    return sensitivity
+
+
+def print_sensitivity(sensitivity: Dict[str, Any]) -> None:
+    """Print the estimate and the percentiles of each score per constituency, then of the overall score."""
+    percentile_headers = "".join(f"{f'p{percentile}':>8}" for percentile in PERCENTILES)
+    for metric in ("elector_balance", "relevance", "constituency_score"):
+        print(f"\n{metric:<36} {'estimate':>8}{percentile_headers}")
+        percentiles = np.percentile(sensitivity[metric], PERCENTILES, axis=0)
+        for assignment_idx, annotation in enumerate(sensitivity["results"]["annotations"]):
+            print(f"{annotation['constituency_name']:<36} {annotation[metric]:>8.4f}" + "".join(f"{value:>8.4f}" for value in percentiles[:, assignment_idx]))
+    percentiles = np.percentile(sensitivity["overall_score"], PERCENTILES)
+    print(f"\n{'overall_score':<36} {sensitivity['results']['overall_score']:>8.4f}" + "".join(f"{value:>8.4f}" for value in percentiles))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score an assignment over elector sizes sampled within the Annex B group totals.")
+    parser.add_argument("assignment_file", help="Assignment JSON file, e.g. assignments/official_ge_2025.json")
+    parser.add_argument("--samples", type=int, default=10000, help="Number of elector size samples")
+    parser.add_argument("--concentration", type=float, default=CONCENTRATION, help="Dirichlet concentration of the district shares of a group (higher is closer to the even split)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sampling")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    sensitivity = run_sensitivity(load_json(args.assignment_file), num_samples=args.samples, concentration=args.concentration, seed=args.seed)
+    print_sensitivity(sensitivity)
+    print(f"\nScored {args.samples} samples in {time.time() - start_time:.2f} seconds")
@@ -1,46 +1,43 @@
 #!/usr/bin/env python3
-import json
 import os
+import sys
 
-# Input and output file paths
-script_dir = os.path.dirname(os.path.abspath(__file__))
-input_file = os.path.join(script_dir, "../raw_data/ge2025_polling_districts_and_elector_size.json")
-output_file = os.path.join(
-    script_dir,
-    "../intermediate_data/ge2025_polling_distrct_and_estimated_elector_size.json",
-)
-
-# Create a dictionary to store the estimated elector size for each polling district
-district_to_size = {}
-
-# Read the input file
-with open(input_file, "r") as f:
-    data = json.load(f)
-
-# Process each constituency division
-for division in data:
-    elector_size = division["elector_size"]
-    polling_districts = division["polling_districts"]
-    num_districts = len(polling_districts)
-
-    # Calculate base size and remainder
-    base_size = elector_size // num_districts
-    remainder = elector_size % num_districts
-
-    # Distribute electors so each district gets base_size,
-    # and the first 'remainder' districts get one extra elector
-    for i, district in enumerate(polling_districts):
-        if i < remainder:
-            district_to_size[district] = base_size + 1
-        else:
-            district_to_size[district] = base_size
-
-# Convert the dictionary to the desired output format
-output_data = [{"polling_district": pd, "estimated_elector_size": size} for pd, size in district_to_size.items()]
-
-# Write the output to a JSON file
-with open(output_file, "w") as f:
-    json.dump(output_data, f, indent=2)
-
-print(f"Processed {len(district_to_size)} polling districts.")
-print(f"Output written to {output_file}")
+
+def estimate_elector_sizes(data):
+    """Estimate the elector size of each polling district by splitting the elector size of its division evenly."""
+    # Create a dictionary to store the estimated elector size for each polling district
+    district_to_size = {}
+
+    # Process each constituency division
+    for division in data:
+        elector_size = division["elector_size"]
+        polling_districts = division["polling_districts"]
+        num_districts = len(polling_districts)
+
+        # Calculate base size and remainder
+        base_size = elector_size // num_districts
+        remainder = elector_size % num_districts
+
+        # Distribute electors so each district gets base_size,
+        # and the first 'remainder' districts get one extra elector
+        for i, district in enumerate(polling_districts):
+            if i < remainder:
+                district_to_size[district] = base_size + 1
+            else:
+                district_to_size[district] = base_size
+
+    print(f"Processed {len(district_to_size)} polling districts.")
+    return district_to_size
+
+
+def format_elector_sizes(district_to_size):
+    # Convert the dictionary to the output format of intermediate_data/ge2025_polling_distrct_and_estimated_elector_size.json
+    return [{"polling_district": pd, "estimated_elector_size": size} for pd, size in district_to_size.items()]
+
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from scripts.pipeline import run_pipeline
+
+    # The estimation is one stage of the in-memory pipeline, see scripts/pipeline.py
+    run_pipeline(outputs=["elector_sizes"])
@@ -1,10 +1,13 @@
-# Use lxml for parsing and writing, plus refined manual post-processing
+# Use lxml for streaming parsing and incremental writing
 from lxml import etree as ET
 import sys
-from math import sqrt
 from pathlib import Path
 from collections import defaultdict
-import re  # Import regular expressions
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from scripts.kml_reader import iter_placemarks
 
 # --- Configuration ---
 INPUT_KML_FILE = Path("raw_data/ge2025_polling_districts.kml")
@@ -13,19 +16,10 @@ SNAP_TOLERANCE = 1e-4  # Further increased tolerance for finding close vertices
 INDENT_SPACES = "  "  # Define the desired indent unit
 MIN_AREA_THRESHOLD = 1e-7  # Minimum area for valid polygons
 MIN_VERTICES = 4  # Minimum number of vertices for a valid polygon
+CONTAINER_TAGS = ("kml", "Document", "Folder")  # Elements streamed by their start and end tags rather than written whole
 # -------------------
 
 
-def parse_coords(coord_string):
-    """Parses the KML coordinate string into a list of (lon, lat, alt) tuples."""
-    points = []
-    lines = [line.strip() for line in coord_string.strip().split("\n") if line.strip()]
-    for point_str in lines:
-        lon, lat, alt = map(float, point_str.split(","))
-        points.append((lon, lat, alt))
-    return points
-
-
 def format_coord_tuple(lon, lat, alt):
     """Formats a single coordinate tuple with integer altitude and minimal precision."""
     alt_fmt = "{:d}".format(int(alt)) if alt == int(alt) else "{}".format(alt)
@@ -35,22 +29,20 @@ def format_coord_tuple(lon, lat, alt):
 
 
 # --- Formatter using newlines ---
-def format_coords_for_processing(coord_list):
-    """Formats coordinates with one point per line, simple newline separation."""
-    # Ensure there's a newline at the beginning and end for the post-processor
-    coord_lines = [format_coord_tuple(lon, lat, alt) for lon, lat, alt in coord_list]
-    return "\n" + "\n".join(coord_lines) + "\n"
+def format_coords(coords):
+    """Formats a coordinate array with one point per line, simple newline separation."""
+    return "\n".join(format_coord_tuple(lon, lat, alt) for lon, lat, alt in coords.tolist())
 
 
-# ---
+def format_coordinates_text(coordinates_text, level):
+    """Text of a <coordinates> element at the given depth, with one coordinate tuple per line indented a level deeper than its tags."""
+    coord_lines = [line.strip() for line in coordinates_text.splitlines() if line.strip()]
+    if not coord_lines:
+        return ""
+    return "".join(f"\n{INDENT_SPACES * (level + 1)}{line}" for line in coord_lines) + "\n" + INDENT_SPACES * level
 
 
-def find_namespace(element):
-    if element.nsmap and None in element.nsmap:
-        return element.nsmap[None]
-    if "}" in element.tag and element.tag.startswith("{"):
-        return element.tag.split("}", 1)[0][1:]
-    return ""
+# ---
 
 
 # --- DSU Functions (find_representative, union_sets, snap_vertices) ---
@@ -74,66 +66,89 @@ def union_sets(v1, v2, parent_map):
         parent_map[root2] = root1
 
 
+def close_vertex_pairs(vertices, tolerance):
+    """
+    Index pairs (i, j), i < j, of vertices closer than the tolerance, in the order of a nested loop over i and then j.
+    Vertices are bucketed in a grid of tolerance-sized cells, so only the 3x3 cells around each vertex are compared.
+    """
+    tolerance_sq = tolerance**2
+    cells = defaultdict(list)
+    for idx, (lon, lat) in enumerate(vertices):
+        cells[(int(lon // tolerance), int(lat // tolerance))].append(idx)
+
+    for i, v1 in enumerate(vertices):
+        cell_lon, cell_lat = int(v1[0] // tolerance), int(v1[1] // tolerance)
+        candidates = []
+        for d_lon in (-1, 0, 1):
+            for d_lat in (-1, 0, 1):
+                candidates.extend(j for j in cells.get((cell_lon + d_lon, cell_lat + d_lat), []) if j > i)
+        for j in sorted(candidates):
+            v2 = vertices[j]
+            dist_sq = (v1[0] - v2[0]) ** 2 + (v1[1] - v2[1]) ** 2
+            if dist_sq < tolerance_sq:
+                yield i, j, dist_sq
+
+
+def stack_rings(placemarks_data):
+    """All ring points of the Placemarks in one array, with the index of the district of each point."""
+    coords = np.concatenate(list(placemarks_data.values()))
+    vertex_districts = np.repeat(np.arange(len(placemarks_data)), [len(coords_list) for coords_list in placemarks_data.values()])
+    return coords, vertex_districts
+
+
+def group_districts_by_vertex(vertex_idxs, vertex_districts, n_vertices):
+    """District indices of the points sorted by vertex, and the start of each vertex's run in them."""
+    order = np.argsort(vertex_idxs, kind="stable")
+    starts = np.searchsorted(vertex_idxs[order], np.arange(n_vertices + 1))
+    return vertex_districts[order], starts
+
+
 def snap_vertices(placemarks_data, tolerance, max_passes=3):
+    """Snap the outer ring coordinate arrays of placemarks_data in place, merging vertices within the tolerance over up to max_passes passes."""
     print("Starting multi-pass vertex snapping process...")
 
-    original_placemarks = {k: list(v) for k, v in placemarks_data.items()}  # Make a deep copy
+    names = list(placemarks_data)
+    coords, vertex_districts = stack_rings(placemarks_data)
     total_merged_pairs = []
     total_merge_count = 0
 
     for pass_num in range(1, max_passes + 1):
         print(f"\nStarting pass {pass_num} of {max_passes}...")
-        all_vertices_with_alt = {}
-        all_coords_2d = set()
-        vertex_to_district = {}  # Map vertices to districts that contain them
 
         print("Step 1: Collecting all unique vertices...")
-        for district, coords_list in placemarks_data.items():
-            for lon, lat, alt in coords_list:
-                coord_2d = (lon, lat)
-                all_coords_2d.add(coord_2d)
-                if coord_2d not in all_vertices_with_alt:
-                    all_vertices_with_alt[coord_2d] = alt
-
-                # Track which districts contain this vertex
-                if coord_2d not in vertex_to_district:
-                    vertex_to_district[coord_2d] = set()
-                vertex_to_district[coord_2d].add(district)
-
-        unique_vertices_list = list(all_coords_2d)
+        # A set filled in ring order, since the order of the vertices decides which one a merged group snaps to
+        unique_vertices_list = list(set(zip(coords[:, 0].tolist(), coords[:, 1].tolist())))
         n_vertices = len(unique_vertices_list)
         print(f"Found {n_vertices} unique vertices.")
 
-        parent = {v: v for v in unique_vertices_list}
+        # Index of every ring point in unique_vertices_list, matched through the lexicographic order np.unique sorts in
+        unique_vertices = np.array(unique_vertices_list)
+        _, sorted_idxs = np.unique(coords[:, :2], axis=0, return_inverse=True)
+        vertex_idxs = np.lexsort((unique_vertices[:, 1], unique_vertices[:, 0]))[sorted_idxs.ravel()]
+        district_idxs, district_starts = group_districts_by_vertex(vertex_idxs, vertex_districts, n_vertices)
+
+        parent = list(range(n_vertices))
         print(f"Step 2: Finding and merging vertices within tolerance ({tolerance:.1E} degrees)...")
-        tolerance_sq = tolerance**2
         merge_count = 0
         merged_pairs = []  # Track which pairs were merged and their districts
 
-        for i in range(n_vertices):
-            v1 = unique_vertices_list[i]
-            for j in range(i + 1, n_vertices):
-                v2 = unique_vertices_list[j]
-                dist_sq = (v1[0] - v2[0]) ** 2 + (v1[1] - v2[1]) ** 2
-                if dist_sq < tolerance_sq:
-                    if find_representative(v1, parent) != find_representative(v2, parent):
-                        union_sets(v1, v2, parent)
-                        merge_count += 1
-
-                        # Record the districts involved in this merge
-                        districts1 = vertex_to_district.get(v1, set())
-                        districts2 = vertex_to_district.get(v2, set())
-                        involved_districts = districts1.union(districts2)
-
-                        if len(involved_districts) > 1:  # Only report if multiple districts are affected
-                            merged_pairs.append(
-                                {
-                                    "vertex1": v1,
-                                    "vertex2": v2,
-                                    "distance": dist_sq**0.5,
-                                    "districts": sorted(list(involved_districts)),
-                                }
-                            )
+        for i, j, dist_sq in close_vertex_pairs(unique_vertices_list, tolerance):
+            if find_representative(i, parent) != find_representative(j, parent):
+                union_sets(i, j, parent)
+                merge_count += 1
+
+                # Record the districts involved in this merge
+                involved_districts = {names[district_idx] for idx in (i, j) for district_idx in district_idxs[district_starts[idx] : district_starts[idx + 1]].tolist()}
+
+                if len(involved_districts) > 1:  # Only report if multiple districts are affected
+                    merged_pairs.append(
+                        {
+                            "vertex1": unique_vertices_list[i],
+                            "vertex2": unique_vertices_list[j],
+                            "distance": dist_sq**0.5,
+                            "districts": sorted(list(involved_districts)),
+                        }
+                    )
 
         print(f"Merged {merge_count} pairs of close vertices in pass {pass_num}")
         total_merge_count += merge_count
@@ -143,24 +158,10 @@ def snap_vertices(placemarks_data, tolerance, max_passes=3):
             print(f"No more vertices to merge in pass {pass_num}. Early termination.")
             break
 
-        # Update coordinates for the next pass
+        # Move every point to its representative for the next pass, keeping the altitudes
         print("Creating vertex mapping and updating placemarks...")
-        vertex_snap_map = {}
-        for v_orig in unique_vertices_list:
-            representative = find_representative(v_orig, parent)
-            vertex_snap_map[v_orig] = representative
-
-        # Update the placemarks with snapped coordinates for the next pass
-        for name, original_coords_list in placemarks_data.items():
-            new_coords_list = [
-                (
-                    vertex_snap_map.get((lon, lat), (lon, lat))[0],
-                    vertex_snap_map.get((lon, lat), (lon, lat))[1],
-                    alt,
-                )
-                for lon, lat, alt in original_coords_list
-            ]
-            placemarks_data[name] = new_coords_list
+        representatives = np.array([find_representative(idx, parent) for idx in range(n_vertices)])
+        coords[:, :2] = unique_vertices[representatives[vertex_idxs]]
 
     # Report the merged pairs between different districts
     if total_merged_pairs:
@@ -173,89 +174,16 @@ def snap_vertices(placemarks_data, tolerance, max_passes=3):
 
     print(f"\nVertex snapping finished. Total merged pairs: {total_merge_count}")
 
-    # Final result is an updated placemarks_data and a map for the original vertices
-    # Prepare final vertex map based on original coordinates
-    final_vertex_map = {}
-    representative_altitudes = {}
-
-    # For each original vertex, find where it ended up after all passes
-    for district, original_coords in original_placemarks.items():
-        for i, (orig_lon, orig_lat, orig_alt) in enumerate(original_coords):
-            orig_key = (orig_lon, orig_lat)
-            if i < len(placemarks_data[district]):  # Safety check
-                final_lon, final_lat, final_alt = placemarks_data[district][i]
-                final_vertex_map[orig_key] = (final_lon, final_lat)
-                if (final_lon, final_lat) not in representative_altitudes:
-                    representative_altitudes[(final_lon, final_lat)] = final_alt
-
-    return final_vertex_map, representative_altitudes
+    # Hand each Placemark its slice of the snapped points
+    ring_ends = np.cumsum([len(coords_list) for coords_list in placemarks_data.values()])
+    for name, snapped_coords in zip(names, np.split(coords, ring_ends[:-1])):
+        placemarks_data[name] = snapped_coords
+    return total_merge_count
 
 
 # --- End DSU Functions ---
 
 
-# --- Refined Manual Indentation Function ---
-def indent_coordinate_blocks(xml_string, indent_unit="  "):
-    """
-    Manually indents the lines within <coordinates> blocks
-    relative to the <coordinates> tag itself. Assumes xml_string
-    is generally pretty-printed for tags by lxml.
-    """
-    output_lines = []
-    # Regex to find opening coordinates tag and capture its indent. Handles namespaces.
-    open_tag_regex = re.compile(r"^(\s*)<(?:\w+:)?coordinates>")
-    # Regex to find closing coordinates tag. Handles namespaces.
-    close_tag_regex = re.compile(r"^\s*</(?:\w+:)?coordinates>")
-
-    lines = xml_string.splitlines()
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        match_open = open_tag_regex.match(line)
-
-        if match_open:
-            # Found the opening <coordinates> tag
-            base_indent = match_open.group(1)
-            coord_indent = base_indent + indent_unit
-            output_lines.append(line)  # Add the opening tag line as is
-            i += 1
-
-            # For coordinate blocks, collect all content lines before processing
-            content_lines = []
-            while i < len(lines):
-                inner_line = lines[i]
-                if close_tag_regex.match(inner_line):
-                    # Found closing tag - will process after collecting content
-                    break
-                content_lines.append(inner_line.strip())
-                i += 1
-
-            # Process all non-empty coordinate lines with proper indentation
-            for content in content_lines:
-                if content:
-                    output_lines.append(coord_indent + content)
-
-            # Add the closing tag with correct indentation
-            if i < len(lines):
-                output_lines.append(base_indent + "</coordinates>")
-                i += 1
-            else:
-                print(f"Warning: Unterminated coordinates block detected near line: {line}")
-        else:
-            # Line is not the start of a coordinates block, add it as is
-            output_lines.append(line)
-            i += 1  # Move to next line
-
-    # Add a final newline if the original string had one (splitlines removes it)
-    final_string = "\n".join(output_lines)
-    if xml_string.endswith("\n"):
-        final_string += "\n"
-    return final_string
-
-
-# --- End Manual Indentation Function ---
-
-
 # Function to identify weak boundaries with issues
 def identify_weak_boundaries(placemarks_data):
     """Identify boundaries that have potential issues"""
@@ -270,25 +198,18 @@ def identify_weak_boundaries(placemarks_data):
 
         # Check for self-intersections (simplified check)
         # This is just a basic check that could be expanded
-        coord_set = set()
-        has_duplicates = False
-        duplicate_positions = []
-
-        for i, (lon, lat, alt) in enumerate(coords_list[:-1]):  # Skip last point which should be same as first
-            coord_2d = (lon, lat)
-            if coord_2d in coord_set:
-                has_duplicates = True
-                duplicate_positions.append(i)
-            coord_set.add(coord_2d)
-
-        if has_duplicates:
+        # Positions of points that repeat an earlier one, skipping the last point which should be same as first.
+        # The stable sort keeps equal points in ring order, so each one after the first of its run is a repeat
+        order = np.lexsort((coords_list[:-1, 1], coords_list[:-1, 0]))
+        sorted_points = coords_list[order, :2]
+        duplicate_positions = sorted(order[1:][np.all(sorted_points[1:] == sorted_points[:-1], axis=1)].tolist())
+
+        if duplicate_positions:
             weak_boundaries[name] = f"Contains duplicate points at positions {duplicate_positions}"
 
         # Check for very small polygons (area too small)
         # Simple rectangular approximation for quick check
-        lons = [p[0] for p in coords_list]
-        lats = [p[1] for p in coords_list]
-        area_approx = (max(lons) - min(lons)) * (max(lats) - min(lats))
+        area_approx = np.ptp(coords_list[:, 0]) * np.ptp(coords_list[:, 1])
         if area_approx < MIN_AREA_THRESHOLD:
             if name in weak_boundaries:
                 weak_boundaries[name] += f", Very small area ({area_approx:.2e})"
@@ -305,95 +226,63 @@ def identify_weak_boundaries(placemarks_data):
     return weak_boundaries
 
 
-# --- Main Script ---
-if __name__ == "__main__":
-    print(f"Processing KML file: {INPUT_KML_FILE} using lxml + manual indent")
-    print(f"Python version: {sys.version}")
-
-    if not INPUT_KML_FILE.is_file():
-        exit(f"Error: Input file not found at {INPUT_KML_FILE}")
-
-    # --- Parsing with lxml (remove blank text helps pretty_print) ---
-    # Keep remove_blank_text=True as it helps lxml's pretty printer
-    parser = ET.XMLParser(remove_blank_text=True)
-    tree = ET.parse(str(INPUT_KML_FILE), parser=parser)
-    root = tree.getroot()
-
-    namespace = find_namespace(root)
-    print(f"Detected KML namespace: '{namespace}'")
-    ns_map = {"kml": namespace} if namespace else {}
-
+def read_placemarks(kml_file):
+    """Stream the Placemarks of the KML, and return the closed outer ring as an (n, 3) coordinate array, the inner ring arrays and the style URL of each."""
     placemarks_data = {}
-    coords_elements_map = {}
+    inner_rings = {}
+    style_urls = {}
     print("Extracting Placemark coordinates...")
-    xpath_placemark = ".//kml:Placemark" if namespace else ".//Placemark"
-    xpath_name = "kml:name" if namespace else "name"
-    xpath_coords = "kml:Polygon/kml:outerBoundaryIs/kml:LinearRing/kml:coordinates" if namespace else "Polygon/outerBoundaryIs/LinearRing/coordinates"
-
-    for placemark_elem in root.xpath(xpath_placemark, namespaces=ns_map):
-        name_elem = placemark_elem.find(xpath_name, ns_map)
-        coords_elem = placemark_elem.find(xpath_coords, ns_map)
-        if name_elem is not None and name_elem.text is not None and coords_elem is not None and coords_elem.text is not None:
-            name = name_elem.text.strip()
-            coords_list = parse_coords(coords_elem.text)
-            if coords_list:
-                if len(coords_list) < 2 or coords_list[0] != coords_list[-1]:
-                    if len(coords_list) >= 1:
-                        print(f"Fixing unclosed polygon for {name} by adding closing point")
-                        coords_list.append(coords_list[0])
-                    else:
-                        continue
-                placemarks_data[name] = coords_list
-                # Store the element itself for later modification
-                coords_elements_map[name] = coords_elem
+    for name, outer_ring, placemark_inner_rings, style_url in iter_placemarks(kml_file):
+        if len(outer_ring) == 0:
+            continue
+        if outer_ring.shape[1] == 2:
+            outer_ring = np.column_stack([outer_ring, np.zeros(len(outer_ring))])
+        coords_list = outer_ring[:, :3]
+        if len(coords_list) < 2 or not np.array_equal(coords_list[0], coords_list[-1]):
+            print(f"Fixing unclosed polygon for {name} by adding closing point")
+            coords_list = np.vstack([coords_list, coords_list[:1]])
+        placemarks_data[name] = coords_list
+        inner_rings[name] = placemark_inner_rings
+        if style_url:
+            style_urls[name] = style_url
 
     print(f"Extracted valid coordinate data for {len(placemarks_data)} Placemarks.")
-    if not placemarks_data:
-        exit("Error: No valid Placemark data found.")
+    return placemarks_data, inner_rings, style_urls
+
 
+def find_remaining_misalignments(placemarks_data, tolerance):
+    """Pairs of points of two districts that are closer than the tolerance but not identical."""
+    names = list(placemarks_data)
+    coords, vertex_districts = stack_rings(placemarks_data)
+    unique_points, point_idxs = np.unique(coords[:, :2], axis=0, return_inverse=True)
+    points = [tuple(point) for point in unique_points.tolist()]
+    district_idxs, district_starts = group_districts_by_vertex(point_idxs.ravel(), vertex_districts, len(points))
+
+    remaining_misalignments = []
+    for i, j, dist_sq in close_vertex_pairs(points, tolerance):
+        districts_i = sorted({names[district_idx] for district_idx in district_idxs[district_starts[i] : district_starts[i + 1]].tolist()})
+        districts_j = sorted({names[district_idx] for district_idx in district_idxs[district_starts[j] : district_starts[j + 1]].tolist()})
+        for d_i in districts_i:
+            for d_j in districts_j:
+                if d_i == d_j:
+                    continue
+                # Each pair of districts once, in name order
+                (d1, p1), (d2, p2) = sorted([(d_i, points[i]), (d_j, points[j])])
+                remaining_misalignments.append({"district1": d1, "district2": d2, "point1": p1, "point2": p2, "distance": dist_sq**0.5})
+    return remaining_misalignments
+
+
+def fix_boundaries(placemarks_data):
+    """Snap the vertices of the Placemarks in place, and report weak boundaries and remaining misalignments."""
     # Identify weak boundaries before snapping
     weak_boundaries = identify_weak_boundaries(placemarks_data)
 
     # Do multiple passes of vertex snapping to ensure all boundaries are aligned
-    vertex_snap_map, representative_altitudes = snap_vertices(placemarks_data, SNAP_TOLERANCE, max_passes=3)
-
-    # The placemarks_data is now updated with the snapped coordinates from multiple passes
-    print("Rebuilding Placemarks with snapped coordinates...")
-    update_count = 0
+    snap_vertices(placemarks_data, SNAP_TOLERANCE, max_passes=3)
 
-    # Final check for fully aligned boundaries - verify no remaining close pairs
-    district_boundaries = {}
-
-    # Extract boundary points for each district
-    for name, coords_list in placemarks_data.items():
-        district_boundaries[name] = set((lon, lat) for lon, lat, _ in coords_list)
-
-    # Check for any remaining close but unaligned boundaries
-    remaining_misalignments = []
+    # Final check for fully aligned boundaries - verify no remaining close pairs, with a tighter tolerance
     print("\nVerifying final boundary alignments...")
-
-    for d1, points1 in district_boundaries.items():
-        for d2, points2 in district_boundaries.items():
-            if d1 >= d2:  # Only check each pair once
-                continue
-
-            # Check if any points are very close but not identical
-            for p1 in points1:
-                for p2 in points2:
-                    if p1 == p2:  # Points are exactly aligned
-                        continue
-
-                    dist_sq = (p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2
-                    if dist_sq < (SNAP_TOLERANCE / 10) ** 2:  # Use tighter tolerance for verification
-                        remaining_misalignments.append(
-                            {
-                                "district1": d1,
-                                "district2": d2,
-                                "point1": p1,
-                                "point2": p2,
-                                "distance": dist_sq**0.5,
-                            }
-                        )
+    remaining_misalignments = find_remaining_misalignments(placemarks_data, SNAP_TOLERANCE / 10)
 
     if remaining_misalignments:
         print(f"WARNING: Found {len(remaining_misalignments)} remaining potential misalignments after snapping")
@@ -406,37 +295,90 @@ if __name__ == "__main__":
     else:
         print("All boundaries are perfectly aligned!")
 
-    # Update XML with snapped coordinates
-    for name, original_coords_list in placemarks_data.items():
-        # Format coordinates with newlines (including leading/trailing for structure)
-        coord_lines_str = format_coords_for_processing(original_coords_list)
-
-        coords_elem = coords_elements_map.get(name)
-        if coords_elem is not None:
-            # Assign the simple newline-separated string.
-            # lxml's pretty_print will handle base indent, manual step fixes inner.
-            coords_elem.text = coord_lines_str
-            update_count += 1
-        else:
-            print(f"Error: Could not find stored coordinates element for '{name}' during update.")
+    if weak_boundaries:
+        print(f"Fixed {len(weak_boundaries)} weak boundaries.")
+    return weak_boundaries
 
-    print(f"Updated coordinates for {update_count} Placemarks.")
 
-    # --- Generate pretty-printed XML string using lxml ---
-    print("Generating base pretty-printed XML string...")
-    pretty_xml_bytes = ET.tostring(tree, encoding="UTF-8", xml_declaration=True, pretty_print=True)  # Use lxml's pretty print
-    pretty_xml_string = pretty_xml_bytes.decode("utf-8")
+def declared_namespaces(elem):
+    """Namespace declarations of an element that its parent does not already make."""
+    parent = elem.getparent()
+    parent_nsmap = parent.nsmap if parent is not None else {}
+    return {prefix: uri for prefix, uri in elem.nsmap.items() if parent_nsmap.get(prefix) != uri}
 
-    # --- Apply manual indentation to coordinate blocks ---
-    print("Applying manual indentation to <coordinates> blocks...")
-    final_xml_string = indent_coordinate_blocks(pretty_xml_string, indent_unit=INDENT_SPACES)
 
-    # --- Write the final, manually adjusted string to file ---
-    print(f"Writing final fixed KML to: {OUTPUT_KML_FILE}")
-    OUTPUT_KML_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(OUTPUT_KML_FILE, "w", encoding="utf-8") as f:
-        f.write(final_xml_string)
+def write_element(xf, elem, level):
+    """Write an element and its descendants to the incremental writer, indented as lxml's pretty printer does, with one coordinate tuple per line."""
+    with xf.element(elem.tag, dict(elem.attrib), nsmap=declared_namespaces(elem)):
+        if len(elem):
+            for child in elem:
+                xf.write("\n" + INDENT_SPACES * (level + 1))
+                write_element(xf, child, level + 1)
+            xf.write("\n" + INDENT_SPACES * level)
+        elif ET.QName(elem).localname == "coordinates":
+            xf.write(format_coordinates_text(elem.text or "", level))
+        elif elem.text:
+            xf.write(elem.text)
 
-    if weak_boundaries:
-        print(f"Fixed {len(weak_boundaries)} weak boundaries.")
-    print("Processing complete.")
+
+def write_kml(input_kml_file, placemarks_data, output_kml_file):
+    """Write the input KML with the snapped outer ring coordinates of the Placemarks, keeping the rest of the document.
+
+    The input is streamed with iterparse and the output written with lxml's incremental writer. Container elements are
+    opened and closed as their tags are read, and every other element is written once its closing tag is read and then
+    cleared, so neither document is held as a whole tree.
+    """
+    print(f"Streaming fixed KML to: {output_kml_file}")
+    Path(output_kml_file).parent.mkdir(parents=True, exist_ok=True)
+    updated_names = set()
+    open_containers = []  # (element, writer context, whether a child was written) from the root down
+
+    with open(output_kml_file, "wb") as f:
+        with ET.xmlfile(f, encoding="UTF-8") as xf:
+            xf.write_declaration()
+            for event, elem in ET.iterparse(str(input_kml_file), events=("start", "end"), remove_blank_text=True):
+                parent = elem.getparent()
+                parent_is_open = parent is None or (bool(open_containers) and parent is open_containers[-1][0])
+                if event == "start":
+                    if parent_is_open and ET.QName(elem).localname in CONTAINER_TAGS:
+                        if open_containers:
+                            xf.write("\n" + INDENT_SPACES * len(open_containers))
+                            open_containers[-1][2] = True
+                        container = xf.element(elem.tag, dict(elem.attrib), nsmap=declared_namespaces(elem))
+                        container.__enter__()
+                        open_containers.append([elem, container, False])
+                elif open_containers and elem is open_containers[-1][0]:
+                    _, container, has_children = open_containers.pop()
+                    if has_children:
+                        xf.write("\n" + INDENT_SPACES * len(open_containers))
+                    container.__exit__(None, None, None)
+                elif parent_is_open:
+                    if ET.QName(elem).localname == "Placemark":
+                        name = elem.findtext("{*}name")
+                        coords_elem = elem.find("{*}Polygon/{*}outerBoundaryIs/{*}LinearRing/{*}coordinates")
+                        if name is not None and coords_elem is not None and name.strip() in placemarks_data:
+                            coords_elem.text = format_coords(placemarks_data[name.strip()])
+                            updated_names.add(name.strip())
+                    xf.write("\n" + INDENT_SPACES * len(open_containers))
+                    open_containers[-1][2] = True
+                    write_element(xf, elem, len(open_containers))
+
+                    # Free the written element and everything before it, as in kml_reader.iter_placemarks
+                    elem.clear(keep_tail=True)
+                    while elem.getprevious() is not None:
+                        del parent[0]
+        # Text after the root element is not allowed by the writer, so the final newline goes straight to the file
+        f.write(b"\n")
+
+    for name in placemarks_data:
+        if name not in updated_names:
+            print(f"Error: Could not find stored coordinates element for '{name}' during update.")
+    print(f"Updated coordinates for {len(updated_names)} Placemarks.")
+
+
+# --- Main Script ---
+if __name__ == "__main__":
+    from scripts.pipeline import run_pipeline
+
+    # The snapping is one stage of the in-memory pipeline, see scripts/pipeline.py
+    run_pipeline(outputs=["fixed_kml"])
@@ -0,0 +1,43 @@
+"""Streaming KML reader.
+
+lxml's iterparse hands over each Placemark as soon as its closing tag is read, and the reader clears the element
+and the siblings before it once its name, style and rings are extracted. Memory therefore stays flat however large
+the file is, instead of growing with a full tree. Coordinate text is parsed straight into NumPy arrays.
+"""
+
+from typing import Iterator, List, Tuple, Union
+
+import numpy as np
+from lxml import etree as ET
+
+
+def parse_coordinates(coordinates_text: str) -> np.ndarray:
+    """Parse KML coordinate text ("lon,lat[,alt] lon,lat[,alt] ...") into an (n, 2) or (n, 3) float array."""
+    tuples = coordinates_text.split()
+    if not tuples:
+        return np.empty((0, 2))
+    values = np.array(",".join(tuples).split(","), dtype=np.float64)
+    if len(values) % len(tuples):
+        raise ValueError(f"Coordinate tuples of mixed dimensions: {tuples[0]!r}")
+    return values.reshape(len(tuples), len(values) // len(tuples))
+
+
+def iter_placemarks(kml_file: str) -> Iterator[Tuple[str, np.ndarray, List[np.ndarray], Union[str, None]]]:
+    """Yield (name, outer ring, inner rings, style URL) for each Placemark with a Polygon, in document order.
+
+    The rings are coordinate arrays as returned by parse_coordinates. Only the first Polygon of a Placemark is read.
+    """
+    for _, placemark_elem in ET.iterparse(str(kml_file), events=("end",), tag="{*}Placemark"):
+        name = placemark_elem.findtext("{*}name")
+        polygon_elem = placemark_elem.find("{*}Polygon")
+        if name is not None and polygon_elem is not None:
+            outer_text = polygon_elem.findtext("{*}outerBoundaryIs/{*}LinearRing/{*}coordinates")
+            if outer_text is not None:
+                inner_rings = [parse_coordinates(elem.text or "") for elem in polygon_elem.iterfind("{*}innerBoundaryIs/{*}LinearRing/{*}coordinates")]
+                style_url = placemark_elem.findtext("{*}styleUrl")
+                yield name.strip(), parse_coordinates(outer_text), inner_rings, style_url.strip() if style_url else None
+
+        # Free the Placemark and everything parsed before it, the Document keeps no children
+        placemark_elem.clear(keep_tail=True)
+        while placemark_elem.getprevious() is not None:
+            del placemark_elem.getparent()[0]
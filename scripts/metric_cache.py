@@ -0,0 +1,113 @@
+"""Persistent SQLite cache of constituency metrics, shared across runs and processes.
+
+functools.cache only lives as long as the process, so every run of the scorer or an optimizer recomputes the
+geometric metrics of the same constituencies. The metrics are also stored in intermediate_data/metric_cache.sqlite,
+keyed by the metric, a hash of the input data it depends on and a canonical hash of the district set, so repeated
+and parallel runs start warm. A change to the input data, to the metric function or to one of the helper functions
+and constants it is declared to depend on changes the key, which leaves the stale rows unused instead of returning them.
+
+The database is in WAL mode, so readers do not block the writer, and each process opens its own connection
+(connections must not cross a fork). Inserts are idempotent, as every process computes the same value for a key.
+Any SQLite error disables the cache for the process instead of failing the scoring.
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import sqlite3
+from typing import Any, Callable, Dict, Iterable, Union
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CACHE_FILE = os.path.join(repo_dir, "intermediate_data/metric_cache.sqlite")
+
+# Seconds a process waits for another process's write lock before giving up
+BUSY_TIMEOUT = 30
+
+# Set to False to compute every metric from scratch, e.g. for timings
+enabled = True
+
+# One connection per process id, since a forked child must open its own
+connections: Dict[int, sqlite3.Connection] = {}
+
+
+def district_set_hash(constituency_districts: Iterable[str]) -> str:
+    """Hash of a set of polling districts, independent of their order."""
+    return hashlib.sha256("\n".join(sorted(constituency_districts)).encode()).hexdigest()
+
+
+def get_connection() -> Union[sqlite3.Connection, None]:
+    global enabled
+    pid = os.getpid()
+    if pid not in connections:
+        try:
+            connection = sqlite3.connect(CACHE_FILE, timeout=BUSY_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS metrics (metric TEXT, input_hash TEXT, district_set_hash TEXT, value REAL, PRIMARY KEY (metric, input_hash, district_set_hash)) WITHOUT ROWID"
+            )
+        except sqlite3.Error as e:
+            print(f"WARNING: metric cache {CACHE_FILE} is unavailable ({e}), computing metrics without it")
+            enabled = False
+            return None
+        connections[pid] = connection
+    return connections[pid]
+
+
+def code_hash(dependency: Any) -> str:
+    """Hash of the source of a function, or of the value of a constant (NumPy arrays by their bytes)."""
+    if callable(dependency):
+        # Through decorators such as profiled and cache, to the source of the function itself
+        data = inspect.getsource(inspect.unwrap(dependency)).encode()
+    elif hasattr(dependency, "tobytes"):
+        data = dependency.tobytes()
+    else:
+        data = repr(dependency).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def persistent(metric: str, input_hash: Callable[[], str], dependencies: Iterable[Any] = ()):
+    """Decorator that stores the results of a metric of a constituency in the cache.
+
+    The metric is called with the tuple of the constituency's polling districts, and its result must not depend on their order.
+    input_hash returns the hash of the input data the metric reads; it is called on first use, so importing stays cheap.
+    dependencies are the helper functions and constants the result depends on, all the way down, since only their
+    hashes and that of the metric function itself are part of the key. None results are not stored.
+    """
+
+    def decorator(function):
+        # Editing the metric function or one of its dependencies invalidates its rows
+        source_hash = hashlib.sha256("".join(code_hash(dependency) for dependency in [function, *dependencies]).encode()).hexdigest()[:16]
+        full_input_hash = None
+
+        @functools.wraps(function)
+        def wrapper(constituency_districts):
+            global enabled
+            nonlocal full_input_hash
+            if not enabled:
+                return function(constituency_districts)
+            connection = get_connection()
+            if connection is None:
+                return function(constituency_districts)
+            if full_input_hash is None:
+                full_input_hash = f"{input_hash()}:{source_hash}"
+
+            key = (metric, full_input_hash, district_set_hash(constituency_districts))
+            try:
+                row = connection.execute("SELECT value FROM metrics WHERE metric = ? AND input_hash = ? AND district_set_hash = ?", key).fetchone()
+                if row is not None:
+                    return row[0]
+                value = function(constituency_districts)
+                if value is not None:
+                    connection.execute("INSERT OR IGNORE INTO metrics VALUES (?, ?, ?, ?)", (*key, value))
+                return value
+            except sqlite3.Error as e:
+                print(f"WARNING: metric cache {CACHE_FILE} failed ({e}), computing metrics without it")
+                enabled = False
+                return function(constituency_districts)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,232 @@
+"""Vectorized evaluation of every boundary move and swap between two constituencies.
+
+Scoring each candidate move of a constituency pair with validate_assignment and score_assignment repeats the same work
+for hundreds of candidates that differ by one or two polling districts. Of the score components, the elector balance
+and relevance are linear in the districts of a constituency (relevance is a ratio of two sums over its districts), so
+evaluate_pair_moves computes them for all candidates at once as NumPy arrays. Contiguity follows from the articulation
+points of the two constituencies, and an upper bound of the overall score from the exact components and the best
+possible geometric terms. Nonenclavity, compactness and convexity are only filled in by score_candidates, for the
+candidates that survive the bound.
+"""
+
+import os
+import sys
+from typing import Any, Dict, List, Set
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.score_assignments import score_assignment, calculate_relevance_weights, is_contiguous, adjacency_data, district_to_elector_size
+
+# Components that score_candidates fills in for the shortlisted candidates
+LAZY_COMPONENTS = ["nonenclavity_1", "nonenclavity_2", "compactness_1", "compactness_2", "convexity_1", "convexity_2", "overall_score"]
+
+
+def articulation_points(constituency_districts: List[str]) -> Set[str]:
+    """Districts whose removal splits a contiguous constituency, by Tarjan's algorithm without recursion."""
+    district_set = set(constituency_districts)
+    discovery: Dict[str, int] = {}
+    low: Dict[str, int] = {}
+    result = set()
+    for root in sorted(district_set):
+        if root in discovery:
+            continue
+        discovery[root] = low[root] = len(discovery)
+        root_children = 0
+        stack = [(root, None, iter(sorted(adjacency_data.get(root, []))))]
+        while stack:
+            district, parent, neighbours = stack[-1]
+            for adjacent in neighbours:
+                if adjacent not in district_set or adjacent == parent:
+                    continue
+                if adjacent in discovery:
+                    low[district] = min(low[district], discovery[adjacent])
+                else:
+                    discovery[adjacent] = low[adjacent] = len(discovery)
+                    stack.append((adjacent, district, iter(sorted(adjacency_data.get(adjacent, [])))))
+                    break
+            else:
+                stack.pop()
+                if parent is None:
+                    continue
+                low[parent] = min(low[parent], low[district])
+                if parent == root:
+                    root_children += 1
+                elif low[district] >= discovery[parent]:
+                    result.add(parent)
+        if root_children > 1:
+            result.add(root)
+    return result
+
+
+def relevance_terms(constituency_name: str, districts: List[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Numerator and denominator contribution of each district to the relevance of a constituency."""
+    numerator_weights, denominator_weights = calculate_relevance_weights(constituency_name, tuple(districts))
+    elector_sizes = np.array([district_to_elector_size.get(district, 0) for district in districts], dtype=float)
+    return elector_sizes * numerator_weights, elector_sizes * denominator_weights
+
+
+def geometric_scores(a: np.ndarray, b: float) -> np.ndarray:
+    """calculate_geometric_score for an array of values against one value."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where((a == 0) | (b == 0), 0.0, np.minimum(a / b, b / a))
+
+
+def evaluate_pair_moves(assignment_data: Dict[str, Any], assignment_idx_1: int, assignment_idx_2: int, results: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Score components of every boundary move and swap between two constituencies of a valid assignment.
+
+    The candidates are the moves of each boundary district of constituency 1 to constituency 2, then the moves of each
+    boundary district of constituency 2 to constituency 1, then every swap of a boundary district of 1 with one of 2.
+    Returns the candidates as "moves_1_to_2" and "moves_2_to_1" (tuples of districts), "candidate_idxs" mapping
+    (move_1_to_2, move_2_to_1) to the candidate index, and arrays over the candidates:
+
+    - valid: whether both constituencies stay contiguous, which is the only validation a move can fail
+    - elector_balance_1, elector_balance_2, min_elector_balance, relevance_1, relevance_2: exact
+    - upper_bound: no higher than the overall score of the candidate, taking nonenclavity, compactness and convexity
+      as 1 for the pair and nonenclavity as 1 for the constituencies bordering the boundary districts
+    - the LAZY_COMPONENTS, NaN until filled in by score_candidates
+
+    results are the score_assignment results of the assignment, which are computed if not given.
+    """
+    if results is None:
+        results = score_assignment(assignment_data)
+    assignments = assignment_data["assignment"]
+    polling_districts_1 = assignments[assignment_idx_1]["polling_districts"]
+    polling_districts_2 = assignments[assignment_idx_2]["polling_districts"]
+    polling_districts_1_set = set(polling_districts_1)
+    polling_districts_2_set = set(polling_districts_2)
+
+    boundary_1 = sorted(a for a in polling_districts_1 if any(b in polling_districts_2_set for b in adjacency_data[a]))
+    boundary_2 = sorted(b for b in polling_districts_2 if any(a in polling_districts_1_set for a in adjacency_data[b]))
+    moves_1_to_2 = [(a,) for a in boundary_1] + [() for _ in boundary_2] + [(a,) for a in boundary_1 for _ in boundary_2]
+    moves_2_to_1 = [() for _ in boundary_1] + [(b,) for b in boundary_2] + [(b,) for _ in boundary_1 for b in boundary_2]
+    num_moves_1, num_moves_2 = len(boundary_1), len(boundary_2)
+
+    # Index of the district moved out of each constituency per candidate, -1 for none, into the boundary lists
+    out_1 = np.concatenate([np.arange(num_moves_1), np.full(num_moves_2, -1), np.repeat(np.arange(num_moves_1), num_moves_2)]).astype(int)
+    out_2 = np.concatenate([np.full(num_moves_1, -1), np.arange(num_moves_2), np.tile(np.arange(num_moves_2), num_moves_1)]).astype(int)
+
+    def gathered(values: np.ndarray, idxs: np.ndarray) -> np.ndarray:
+        return np.where(idxs >= 0, np.append(values, 0.0)[idxs], 0.0)
+
+    # Elector balance
+    elector_sizes_1 = np.array([district_to_elector_size.get(a, 0) for a in boundary_1], dtype=float)
+    elector_sizes_2 = np.array([district_to_elector_size.get(b, 0) for b in boundary_2], dtype=float)
+    annotations = results["annotations"]
+    full_elector_size = sum(annotation["elector_size"] for annotation in annotations)
+    full_member_size = sum(annotation["member_size"] for annotation in annotations)
+    mean_electors_per_member = full_elector_size / full_member_size
+    member_size_1, member_size_2 = annotations[assignment_idx_1]["member_size"], annotations[assignment_idx_2]["member_size"]
+    new_elector_sizes_1 = annotations[assignment_idx_1]["elector_size"] - gathered(elector_sizes_1, out_1) + gathered(elector_sizes_2, out_2)
+    new_elector_sizes_2 = annotations[assignment_idx_2]["elector_size"] - gathered(elector_sizes_2, out_2) + gathered(elector_sizes_1, out_1)
+    elector_balance_1 = geometric_scores(new_elector_sizes_1 / member_size_1, mean_electors_per_member)
+    elector_balance_2 = geometric_scores(new_elector_sizes_2 / member_size_2, mean_electors_per_member)
+    other_idxs = [assignment_idx for assignment_idx in range(len(assignments)) if assignment_idx not in (assignment_idx_1, assignment_idx_2)]
+    other_min_elector_balance = min((annotations[assignment_idx]["elector_balance"] for assignment_idx in other_idxs), default=1.0)
+    min_elector_balance = np.minimum(other_min_elector_balance, np.minimum(elector_balance_1, elector_balance_2))
+
+    # Relevance, as sums of per-district terms under each constituency's name
+    def relevance(assignment_idx: int, polling_districts: List[str], removed: np.ndarray, added_districts: List[str], added: np.ndarray, removed_districts: List[str]) -> np.ndarray:
+        constituency_name = assignments[assignment_idx]["constituency_name"]
+        numerators, denominators = relevance_terms(constituency_name, polling_districts)
+        removed_numerators, removed_denominators = relevance_terms(constituency_name, removed_districts)
+        added_numerators, added_denominators = relevance_terms(constituency_name, added_districts)
+        numerator = numerators.sum() - gathered(removed_numerators, removed) + gathered(added_numerators, added)
+        denominator = denominators.sum() - gathered(removed_denominators, removed) + gathered(added_denominators, added)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return numerator / denominator
+
+    relevance_1 = relevance(assignment_idx_1, polling_districts_1, out_1, boundary_2, out_2, boundary_1)
+    relevance_2 = relevance(assignment_idx_2, polling_districts_2, out_2, boundary_1, out_1, boundary_2)
+
+    # Contiguity from the articulation points, with an exact check when a swap is not covered by them
+    articulation_points_1 = articulation_points(polling_districts_1)
+    articulation_points_2 = articulation_points(polling_districts_2)
+    valid = np.zeros(len(moves_1_to_2), dtype=bool)
+    for candidate_idx, (move_1_to_2, move_2_to_1) in enumerate(zip(moves_1_to_2, moves_2_to_1)):
+        if not move_2_to_1:
+            valid[candidate_idx] = len(polling_districts_1) > 1 and move_1_to_2[0] not in articulation_points_1
+        elif not move_1_to_2:
+            valid[candidate_idx] = len(polling_districts_2) > 1 and move_2_to_1[0] not in articulation_points_2
+        else:
+            (a,), (b,) = move_1_to_2, move_2_to_1
+            if a not in articulation_points_1 and b not in articulation_points_2 and any(c in polling_districts_1_set and c != a for c in adjacency_data[b]):
+                valid[candidate_idx] = any(c in polling_districts_2_set and c != b for c in adjacency_data[a])
+            if not valid[candidate_idx]:
+                valid[candidate_idx] = is_contiguous([c for c in polling_districts_1 if c != a] + [b], adjacency_data) and is_contiguous(
+                    [c for c in polling_districts_2 if c != b] + [a], adjacency_data
+                )
+
+    # Upper bound of the overall score
+    boundary_set = set(boundary_1) | set(boundary_2)
+    nearby_districts = set(c for district in boundary_set for c in adjacency_data[district]) - polling_districts_1_set - polling_districts_2_set
+    nearby_idxs = set(assignment_idx for assignment_idx in other_idxs if nearby_districts & set(assignments[assignment_idx]["polling_districts"]))
+    other_weighted_score = 0.0
+    for assignment_idx in other_idxs:
+        annotation = annotations[assignment_idx]
+        constituency_score = annotation["constituency_score"]
+        if assignment_idx in nearby_idxs:
+            # The nonenclavity of a constituency bordering the moved districts can change, so it is taken as 1
+            constituency_score = min((1 + annotation["compactness"] + annotation["convexity"] + annotation["relevance"] + annotation["elector_balance"]) / 5, annotation["elector_balance"])
+        other_weighted_score += annotation["member_size"] * constituency_score
+    constituency_score_1 = np.minimum((3 + relevance_1 + elector_balance_1) / 5, elector_balance_1)
+    constituency_score_2 = np.minimum((3 + relevance_2 + elector_balance_2) / 5, elector_balance_2)
+    upper_bound = np.minimum((other_weighted_score + member_size_1 * constituency_score_1 + member_size_2 * constituency_score_2) / full_member_size, min_elector_balance)
+
+    pair_moves = {
+        "assignment_idx_1": assignment_idx_1,
+        "assignment_idx_2": assignment_idx_2,
+        "moves_1_to_2": moves_1_to_2,
+        "moves_2_to_1": moves_2_to_1,
+        "candidate_idxs": {moves: candidate_idx for candidate_idx, moves in enumerate(zip(moves_1_to_2, moves_2_to_1))},
+        "valid": valid,
+        "elector_balance_1": elector_balance_1,
+        "elector_balance_2": elector_balance_2,
+        "min_elector_balance": min_elector_balance,
+        "relevance_1": relevance_1,
+        "relevance_2": relevance_2,
+        "upper_bound": upper_bound,
+    }
+    for component in LAZY_COMPONENTS:
+        pair_moves[component] = np.full(len(moves_1_to_2), np.nan)
+    return pair_moves
+
+
+def shortlist(pair_moves: Dict[str, Any], threshold: float, top_k: int = None) -> np.ndarray:
+    """Indices of the valid candidates whose upper bound exceeds the threshold, highest bound first."""
+    candidate_idxs = np.flatnonzero(pair_moves["valid"] & (pair_moves["upper_bound"] > threshold))
+    candidate_idxs = candidate_idxs[np.argsort(-pair_moves["upper_bound"][candidate_idxs], kind="stable")]
+    return candidate_idxs[:top_k] if top_k is not None else candidate_idxs
+
+
+def apply_candidate(assignment_data: Dict[str, Any], pair_moves: Dict[str, Any], candidate_idx: int, reverse: bool = False) -> None:
+    polling_districts_1 = assignment_data["assignment"][pair_moves["assignment_idx_1"]]["polling_districts"]
+    polling_districts_2 = assignment_data["assignment"][pair_moves["assignment_idx_2"]]["polling_districts"]
+    move_1_to_2, move_2_to_1 = pair_moves["moves_1_to_2"][candidate_idx], pair_moves["moves_2_to_1"][candidate_idx]
+    if reverse:
+        polling_districts_1, polling_districts_2 = polling_districts_2, polling_districts_1
+    for a in move_1_to_2:
+        polling_districts_1.remove(a)
+        polling_districts_2.append(a)
+    for b in move_2_to_1:
+        polling_districts_2.remove(b)
+        polling_districts_1.append(b)
+
+
+def score_candidates(assignment_data: Dict[str, Any], pair_moves: Dict[str, Any], candidate_idxs: List[int]) -> np.ndarray:
+    """Fill in the LAZY_COMPONENTS of the given candidates with score_assignment, and return their overall scores."""
+    assignment_idx_1, assignment_idx_2 = pair_moves["assignment_idx_1"], pair_moves["assignment_idx_2"]
+    for candidate_idx in candidate_idxs:
+        if not np.isnan(pair_moves["overall_score"][candidate_idx]):
+            continue
+        apply_candidate(assignment_data, pair_moves, candidate_idx)
+        try:
+            results = score_assignment(assignment_data)
+        finally:
+            apply_candidate(assignment_data, pair_moves, candidate_idx, reverse=True)
+        for suffix, assignment_idx in (("_1", assignment_idx_1), ("_2", assignment_idx_2)):
+            for metric in ("nonenclavity", "compactness", "convexity"):
+                pair_moves[metric + suffix][candidate_idx] = results["annotations"][assignment_idx][metric]
+        pair_moves["overall_score"][candidate_idx] = results["overall_score"]
+    return pair_moves["overall_score"][np.asarray(candidate_idxs, dtype=int)]
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""In-memory data processing pipeline for the polling districts.
+
+The raw KML is streamed once (see scripts/kml_reader.py), and the polling districts flow through vertex snapping, elector size estimation,
+adjacency, MRT annotation and validation in memory. The requested outputs are only written at the end,
+so no stage parses the output of another stage from disk.
+
+fix_kml_boundaries.py, estimate_elector_size.py, generate_adjacent_districts.py and add_information_to_polling_districts.py
+run the pipeline for their own outputs, and only the stages those outputs need are run.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import fix_kml_boundaries
+from scripts.estimate_elector_size import estimate_elector_sizes, format_elector_sizes
+from scripts.generate_adjacent_districts import build_district_polygons, build_adjacency
+from scripts.add_information_to_polling_districts import load_mrt_stations, build_feature, add_information
+from scripts.validate_input_data import validate_polling_districts
+from scripts.topology import geojson_to_topojson, save_topojson
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INPUT_KML = os.path.join(repo_dir, "raw_data/ge2025_polling_districts.kml")
+INPUT_ELECTOR_SIZES = os.path.join(repo_dir, "raw_data/ge2025_polling_districts_and_elector_size.json")
+INPUT_MRT_STATIONS = os.path.join(repo_dir, "raw_data/mrt_stations.csv")
+
+OUTPUTS = {
+    "fixed_kml": os.path.join(repo_dir, "intermediate_data/ge2025_polling_districts_fixed.kml"),
+    "elector_sizes": os.path.join(repo_dir, "intermediate_data/ge2025_polling_distrct_and_estimated_elector_size.json"),
+    "adjacency": os.path.join(repo_dir, "intermediate_data/ge2025_polling_districts_to_adjacent_districts.json"),
+    "shared_boundary_lengths": os.path.join(repo_dir, "intermediate_data/ge2025_polling_districts_shared_boundary_lengths.json"),
+    "geojson": os.path.join(repo_dir, "processed_data/ge2025_polling_districts_with_information.geojson"),
+    "topojson": os.path.join(repo_dir, "processed_data/ge2025_polling_districts_with_information.topojson"),
+}
+
+
+def write_json(data, filepath):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "w") as f:
+        json.dump(data, f, indent=2)
+    print(f"Output written to {filepath}")
+
+
+def run_pipeline(outputs=tuple(OUTPUTS)):
+    """Run the stages that the requested outputs need, in memory, and write the outputs at the end."""
+    unknown_outputs = set(outputs) - set(OUTPUTS)
+    if unknown_outputs:
+        raise ValueError(f"Unknown outputs {sorted(unknown_outputs)}, choose from {list(OUTPUTS)}")
+    needs_features = bool({"geojson", "topojson"} & set(outputs))
+    needs_adjacency = needs_features or bool({"adjacency", "shared_boundary_lengths"} & set(outputs))
+    needs_snapping = needs_adjacency or "fixed_kml" in outputs
+    needs_elector_sizes = needs_features or "elector_sizes" in outputs
+
+    timings = {}
+    start_time = time.time()
+
+    def finish_stage(stage):
+        nonlocal start_time
+        timings[stage] = time.time() - start_time
+        start_time = time.time()
+
+    if needs_snapping:
+        print(f"Processing KML file: {INPUT_KML}")
+        placemarks_data, inner_rings, style_urls = fix_kml_boundaries.read_placemarks(INPUT_KML)
+        if not placemarks_data:
+            raise ValueError("No valid Placemark data found")
+        finish_stage("parse")
+        fix_kml_boundaries.fix_boundaries(placemarks_data)
+        finish_stage("snapping")
+
+    if needs_elector_sizes:
+        with open(INPUT_ELECTOR_SIZES, "r") as f:
+            raw_elector_sizes = json.load(f)
+        district_to_size = estimate_elector_sizes(raw_elector_sizes)
+        finish_stage("elector sizes")
+
+    if needs_adjacency:
+        districts = build_district_polygons(
+            {name: coords_list[:, :2] for name, coords_list in placemarks_data.items()},
+            {name: [inner_ring[:, :2] for inner_ring in rings] for name, rings in inner_rings.items()},
+        )
+        print(f"Built {len(districts)} district polygons")
+        adjacency, shared_boundary_lengths = build_adjacency(districts)
+        finish_stage("adjacency")
+
+    if needs_features:
+        features = [build_feature(name, coords_list, style_urls.get(name), inner_rings[name]) for name, coords_list in placemarks_data.items()]
+        geojson = add_information(features, district_to_size, adjacency, load_mrt_stations(INPUT_MRT_STATIONS))
+        finish_stage("MRT annotation")
+        if not validate_polling_districts(raw_elector_sizes, geojson):
+            print("WARNING: the processed polling districts do not match the raw elector size data")
+        finish_stage("validation")
+
+    # Write the outputs only once every stage has succeeded
+    if "fixed_kml" in outputs:
+        fix_kml_boundaries.write_kml(INPUT_KML, placemarks_data, OUTPUTS["fixed_kml"])
+    if "elector_sizes" in outputs:
+        write_json(format_elector_sizes(district_to_size), OUTPUTS["elector_sizes"])
+    if "adjacency" in outputs:
+        write_json(adjacency, OUTPUTS["adjacency"])
+    if "shared_boundary_lengths" in outputs:
+        write_json(shared_boundary_lengths, OUTPUTS["shared_boundary_lengths"])
+    if "geojson" in outputs:
+        write_json(geojson, OUTPUTS["geojson"])
+    if "topojson" in outputs:
+        # The quantized, arc-deduplicated TopoJSON that the scorer and the web page read, see scripts/topology.py
+        topology = geojson_to_topojson(geojson, "polling_districts")
+        written = save_topojson(topology, OUTPUTS["topojson"])
+        print(f"TopoJSON with {len(topology['arcs'])} shared arcs saved to {', '.join(written)}")
+    finish_stage("writing")
+
+    print("\nPipeline timings")
+    for stage, seconds in timings.items():
+        print(f"{stage:<20} {seconds:>8.2f}s")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate the intermediate and processed polling district data from raw_data/ in one in-memory pass.")
+    parser.add_argument("--outputs", nargs="+", choices=list(OUTPUTS), default=list(OUTPUTS), help="Outputs to write (default all)")
+    args = parser.parse_args()
+    run_pipeline(args.outputs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Zobrist hashing of assignments and a bounded transposition table of their scores.
+
+A plan is identified by which constituency (by position in the assignment) each polling district belongs to,
+and by the name of each constituency, since the name changes the relevance. Its hash is the XOR of one
+random 64-bit key per (district, constituency) and per (constituency, name), so a move of a district or
+a rename updates the hash in O(1) by XORing out the old key and XORing in the new one.
+
+The keys are derived from a hash of the strings rather than drawn from a random generator, so the plan hash of
+the same assignment is the same in every process and every run.
+
+Optimizers revisit plans (a move followed by its reverse, the same swap seen from either constituency of a pair,
+or a scan repeated after no improvement), and the transposition table maps the plan hash to the overall score so
+that revisited plans are not scored again.
+"""
+
+import hashlib
+from collections import OrderedDict
+from functools import cache
+from typing import Any, Dict, Union
+
+# Number of plans a transposition table remembers before it drops the least recently used one
+TRANSPOSITION_TABLE_SIZE = 200_000
+
+
+@cache
+def zobrist_key(*parts: Any) -> int:
+    return int.from_bytes(hashlib.blake2b("\0".join(map(str, parts)).encode(), digest_size=8).digest(), "little")
+
+
+def plan_hash(assignment_data: Dict[str, Any]) -> int:
+    """Zobrist hash of an assignment, computed from scratch."""
+    value = 0
+    for assignment_idx, item in enumerate(assignment_data["assignment"]):
+        value ^= zobrist_key("name", assignment_idx, item["constituency_name"])
+        for district in item["polling_districts"]:
+            value ^= zobrist_key("district", district, assignment_idx)
+    return value
+
+
+def move_hash(value: int, district: str, from_assignment_idx: int, to_assignment_idx: int) -> int:
+    """Plan hash after moving a polling district from one constituency to another."""
+    return value ^ zobrist_key("district", district, from_assignment_idx) ^ zobrist_key("district", district, to_assignment_idx)
+
+
+def rename_hash(value: int, assignment_idx: int, old_name: str, new_name: str) -> int:
+    """Plan hash after renaming a constituency."""
+    return value ^ zobrist_key("name", assignment_idx, old_name) ^ zobrist_key("name", assignment_idx, new_name)
+
+
+def new_transposition_table(max_size: int = TRANSPOSITION_TABLE_SIZE) -> Dict[str, Any]:
+    """Empty transposition table: scores maps the plan hash to (overall score, whether it is exact), least recently used first."""
+    return {"scores": OrderedDict(), "max_size": max_size, "hits": 0, "misses": 0}
+
+
+def lookup_score(table: Dict[str, Any], value: int, threshold: Union[float, None] = None) -> Union[float, None]:
+    """Stored overall score of a plan, or None if it has to be scored.
+
+    An entry stored from a score_assignment call that stopped at its threshold only holds an upper bound of the score,
+    which answers a lookup if it does not exceed the lookup threshold, as the full score would not either.
+    """
+    entry = table["scores"].get(value)
+    if entry is None or not entry[1] and (threshold is None or entry[0] > threshold):
+        table["misses"] += 1
+        return None
+    table["hits"] += 1
+    table["scores"].move_to_end(value)
+    return entry[0]
+
+
+def store_score(table: Dict[str, Any], value: int, results: Dict[str, Any]) -> float:
+    """Store the overall score from the results of score_assignment, and return it."""
+    # Only a score_assignment call that stopped at its threshold leaves out the geometric metrics
+    table["scores"][value] = (results["overall_score"], "compactness" in results["annotations"][0])
+    table["scores"].move_to_end(value)
+    while len(table["scores"]) > table["max_size"]:
+        table["scores"].popitem(last=False)
+    return results["overall_score"]
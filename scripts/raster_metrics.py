@@ -0,0 +1,203 @@
+"""Raster approximation of the compactness and convexity of constituencies.
+
+The vector metrics in score_assignments.py union the polygons of a constituency and intersect the union with 720 lines,
+which dominates the scoring time. Here every polling district is rasterized once onto a fixed grid of square cells
+(CELL_SIZE degrees, about 20 m), as the flat indices of the cells whose centres it contains, and its area, centroid,
+convex hull and overlaps with other districts are stored. A constituency is then handled without building its union:
+
+- the area and centroid are the area-weighted sums over the districts, minus the pairwise overlaps of member districts
+- the convex hull is the hull of the district hulls, which is the hull of the union
+- chord lengths are measured on a bitmap of the constituency's cells, by sampling each line through the centroid at
+  every cell size and counting the samples that fall in the constituency
+
+Each metric is returned with an error bound. A cell is uncertain when it borders a cell of the other class, since the
+true boundary can only pass through such cells (for features wider than a cell). Each chord is bounded by the samples
+that fall in uncertain cells and the runs of inside samples, and the chord bounds are propagated through the median and
+geometric scores by interval arithmetic. Convexity is only off by overlaps of three or more districts, which the
+pairwise overlap area bounds. The exact vector metric therefore lies within the returned bound.
+
+Run this module to compare the raster metrics with the vector metrics for every assignment in assignments/.
+"""
+
+import os
+import sys
+import time
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+import shapely
+
+# Cell size in degrees, about 20 m at Singapore's latitude
+CELL_SIZE = 1.8e-4
+
+# Same directions as calculate_compactness in score_assignments.py
+CHORD_ANGLES = np.linspace(0, np.pi, 720)
+
+
+def rasterize_districts(district_geometries: Dict[str, shapely.Geometry], cell_size: float = CELL_SIZE) -> Dict[str, object]:
+    """Grid covering all districts and the sorted flat cell indices of each district, with the per-district data of the exact terms.
+
+    A cell belongs to a district if the district contains its centre. A district smaller than a cell gets the cell of
+    its representative point, so that no district is lost.
+    """
+    min_x, min_y, max_x, max_y = shapely.total_bounds(list(district_geometries.values()))
+    # One cell of margin on every side, so that the bitmaps always have outside cells around them
+    x0, y0 = min_x - cell_size, min_y - cell_size
+    nx = int(np.ceil((max_x - x0) / cell_size)) + 2
+    ny = int(np.ceil((max_y - y0) / cell_size)) + 2
+
+    district_cells = {}
+    district_areas = {}
+    district_centroids = {}
+    district_hulls = {}
+    for district, geometry in district_geometries.items():
+        district_areas[district] = geometry.area
+        district_centroids[district] = np.array([geometry.centroid.x, geometry.centroid.y])
+        district_hulls[district] = shapely.get_coordinates(shapely.convex_hull(geometry))
+        bounds = geometry.bounds
+        col_0, col_1 = int((bounds[0] - x0) / cell_size), int((bounds[2] - x0) / cell_size) + 1
+        row_0, row_1 = int((bounds[1] - y0) / cell_size), int((bounds[3] - y0) / cell_size) + 1
+        rows, cols = np.mgrid[row_0:row_1, col_0:col_1]
+        inside = shapely.contains_xy(geometry, x0 + (cols + 0.5) * cell_size, y0 + (rows + 0.5) * cell_size)
+        cells = rows[inside] * nx + cols[inside]
+        if len(cells) == 0:
+            point = geometry.representative_point()
+            cells = np.array([int((point.y - y0) / cell_size) * nx + int((point.x - x0) / cell_size)])
+        district_cells[district] = np.sort(cells).astype(np.int64)
+
+    # Districts overlap slightly where their boundaries were not snapped together
+    districts = list(district_geometries)
+    geometries = [district_geometries[district] for district in districts]
+    district_overlaps = {district: [] for district in districts}
+    for i, j in shapely.STRtree(geometries).query(geometries, predicate="intersects").T:
+        if i < j:
+            overlap = shapely.intersection(geometries[i], geometries[j])
+            if overlap.area > 0:
+                centroid = np.array([overlap.centroid.x, overlap.centroid.y])
+                # Stored on one of the two districts only, so that each pair is subtracted once
+                district_overlaps[districts[i]].append((districts[j], overlap.area, centroid))
+    return {
+        "x0": x0,
+        "y0": y0,
+        "nx": nx,
+        "ny": ny,
+        "cell_size": cell_size,
+        "district_cells": district_cells,
+        "district_areas": district_areas,
+        "district_centroids": district_centroids,
+        "district_hulls": district_hulls,
+        "district_overlaps": district_overlaps,
+    }
+
+
+def neighbourhood_any(bitmap: np.ndarray) -> np.ndarray:
+    """Cells with a set cell among themselves and their 8 neighbours."""
+    padded = np.pad(bitmap, 1)
+    result = np.zeros_like(bitmap)
+    height, width = bitmap.shape
+    for row_offset in range(3):
+        for col_offset in range(3):
+            result |= padded[row_offset : row_offset + height, col_offset : col_offset + width]
+    return result
+
+
+def geometric_score_interval(a_low, a_high, b_low, b_high):
+    """Lower and upper bound of min(a / b, b / a) for a in [a_low, a_high] and b in [b_low, b_high], elementwise."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # The score falls as a and b move apart, so the lowest is at the farthest corners
+        low = np.minimum(np.where(a_high > 0, b_low / a_high, 0), np.where(b_high > 0, a_low / b_high, 0))
+        # and the highest is 1 if the intervals overlap, otherwise at the closest corners
+        high = np.where(a_high < b_low, a_high / b_low, np.where(b_high < a_low, b_high / a_low, 1.0))
+    return np.clip(np.nan_to_num(low), 0, 1), np.clip(np.nan_to_num(high, nan=1.0), 0, 1)
+
+
+def calculate_raster_metrics(raster: Dict[str, object], constituency_districts: Iterable[str]) -> Tuple[float, float, float, float]:
+    """Compactness, compactness error bound, convexity and convexity error bound of a constituency."""
+    constituency_districts = set(constituency_districts)
+    cell_size, nx = raster["cell_size"], raster["nx"]
+
+    # Area and centroid of the union by inclusion-exclusion over the overlaps of member districts
+    area = sum(raster["district_areas"][district] for district in constituency_districts)
+    moment = sum(raster["district_areas"][district] * raster["district_centroids"][district] for district in constituency_districts)
+    overlap_area = 0.0
+    for district in constituency_districts:
+        for other, pair_area, pair_centroid in raster["district_overlaps"][district]:
+            if other in constituency_districts:
+                overlap_area += pair_area
+                moment = moment - pair_area * pair_centroid
+    area -= overlap_area
+    center_x, center_y = moment / area
+
+    cells = np.concatenate([raster["district_cells"][district] for district in constituency_districts])
+    rows, cols = np.divmod(cells, nx)
+
+    # Bitmap of the bounding box, with one cell of outside margin
+    row_0, col_0 = rows.min() - 1, cols.min() - 1
+    bitmap = np.zeros((rows.max() - row_0 + 2, cols.max() - col_0 + 2), dtype=bool)
+    bitmap[rows - row_0, cols - col_0] = True
+    uncertain = neighbourhood_any(bitmap) & neighbourhood_any(~bitmap)
+
+    # Centroid, in cells relative to the bitmap
+    center_row = (center_y - raster["y0"]) / cell_size - row_0
+    center_col = (center_x - raster["x0"]) / cell_size - col_0
+
+    # Sample every line through the centroid at every cell, far enough to leave the bitmap on both sides
+    radius = max(np.hypot(row - center_row, col - center_col) for row in (0, bitmap.shape[0]) for col in (0, bitmap.shape[1]))
+    offsets = np.arange(-np.ceil(radius), np.ceil(radius) + 1)
+    sample_cols = np.floor(center_col + np.cos(CHORD_ANGLES)[:, None] * offsets).astype(np.int64)
+    sample_rows = np.floor(center_row + np.sin(CHORD_ANGLES)[:, None] * offsets).astype(np.int64)
+    in_bounds = (sample_rows >= 0) & (sample_rows < bitmap.shape[0]) & (sample_cols >= 0) & (sample_cols < bitmap.shape[1])
+    sample_cells = np.where(in_bounds, sample_rows * bitmap.shape[1] + sample_cols, 0)
+    inside = bitmap.ravel()[sample_cells] & in_bounds
+    chord_lengths = inside.sum(axis=1).astype(float)
+    # Each sample in an uncertain cell may be misclassified, and each run of inside samples may be one sample step too long or short
+    inside_runs = np.count_nonzero(np.diff(inside, axis=1, prepend=False, append=False), axis=1) / 2
+    chord_errors = (uncertain.ravel()[sample_cells] & in_bounds).sum(axis=1) + inside_runs + 1.0
+
+    median_chord_length = np.median(chord_lengths)
+    compactness = float(np.mean(geometric_score_interval(chord_lengths, chord_lengths, median_chord_length, median_chord_length)[0]))
+    chord_low, chord_high = np.maximum(chord_lengths - chord_errors, 0), chord_lengths + chord_errors
+    score_low, score_high = geometric_score_interval(chord_low, chord_high, np.median(chord_low), np.median(chord_high))
+    compactness_error = float(max(compactness - score_low.mean(), score_high.mean() - compactness, 0.0))
+
+    # The hull of the union is the hull of the district hulls, so convexity only errs by the overlaps of three or more districts,
+    # which inclusion-exclusion over pairs subtracts too often by at most the pairwise overlap area
+    hull_area = shapely.convex_hull(shapely.multipoints(np.concatenate([raster["district_hulls"][district] for district in constituency_districts]))).area
+    convexity = min(1.0, area / hull_area)
+    convexity_error = overlap_area / hull_area
+
+    return compactness, compactness_error, convexity, convexity_error
+
+
+def compare_engines() -> None:
+    """Print the largest difference between the raster and vector metrics, and the largest error bound, for every assignment."""
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from scripts import metric_cache
+    from scripts.score_assignments import load_json, score_assignment
+
+    # Time the vector engine from scratch
+    metric_cache.enabled = False
+    print(f"{'assignment':<36} {'engine':>8} {'seconds':>8} {'score':>10} {'|diff|':>10} {'bound':>10} {'max |compactness diff|':>24} {'max |convexity diff|':>22}")
+    for assignment_file in sorted(f for f in os.listdir("assignments") if f.endswith(".json")):
+        assignment_data = load_json(os.path.join("assignments", assignment_file))
+        start_time = time.time()
+        vector_results = score_assignment(assignment_data)
+        vector_seconds = time.time() - start_time
+        start_time = time.time()
+        raster_results = score_assignment(assignment_data, engine="raster")
+        raster_seconds = time.time() - start_time
+
+        pairs = list(zip(vector_results["annotations"], raster_results["annotations"]))
+        compactness_diff = max(abs(vector["compactness"] - raster["compactness"]) for vector, raster in pairs)
+        convexity_diff = max(abs(vector["convexity"] - raster["convexity"]) for vector, raster in pairs)
+        assert all(abs(vector["compactness"] - raster["compactness"]) <= raster["compactness_error_bound"] + 1e-9 for vector, raster in pairs)
+        assert all(abs(vector["convexity"] - raster["convexity"]) <= raster["convexity_error_bound"] + 1e-9 for vector, raster in pairs)
+        score_diff = abs(vector_results["overall_score"] - raster_results["overall_score"])
+        print(f"{assignment_file:<36} {'vector':>8} {vector_seconds:>8.2f} {vector_results['overall_score']:>10.6f}")
+        print(
+            f"{'':<36} {'raster':>8} {raster_seconds:>8.2f} {raster_results['overall_score']:>10.6f} {score_diff:>10.6f} {raster_results['error_bound']:>10.6f} {compactness_diff:>24.6f} {convexity_diff:>22.6f}"
+        )
+
+
+if __name__ == "__main__":
+    compare_engines()
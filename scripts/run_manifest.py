@@ -0,0 +1,78 @@
+"""Run manifests, written beside each optimizer output so that runs can be reproduced and compared.
+
+A manifest records the seed and parameters of a run, the SHA-256 hashes of the input data it read,
+its timings and its final score. It is saved as annotations/<output>_manifest.json, next to the annotations
+of the assignment it describes. Two runs with the same seed, parameters and input hashes should produce the same assignment.
+"""
+
+import hashlib
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Union
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.score_assignments import load_json, save_json, profile_counters
+
+# Every file that the scoring and the optimizers read, missing files (such as the GeoJSON when the TopoJSON is used) are skipped
+INPUT_DATA_FILES = [
+    "assignments/official_ge_2025.json",
+    "intermediate_data/ge2025_polling_districts_to_adjacent_districts.json",
+    "intermediate_data/ge2025_polling_districts_shared_boundary_lengths.json",
+    "processed_data/ge2025_polling_districts_with_information.topojson",
+    "processed_data/ge2025_polling_districts_with_information.geojson",
+    "raw_data/mrt_stations.csv",
+    "raw_data/name_aliases.json",
+]
+
+
+def file_sha256(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def git_commit() -> Union[str, None]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_run_manifest(algorithm: str, seed: Union[int, None], parameters: Dict[str, Any], input_files: List[str] = INPUT_DATA_FILES) -> Dict[str, Any]:
+    """Start a manifest before the run, so that the input hashes describe the data the run actually read."""
+    return {
+        "algorithm": algorithm,
+        "seed": seed,
+        "parameters": parameters,
+        "input_data": {filepath: file_sha256(filepath) for filepath in input_files if os.path.exists(filepath)},
+        "environment": {"git_commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(), "pythonhashseed": os.environ.get("PYTHONHASHSEED")},
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "start_time": time.time(),
+    }
+
+
+def save_run_manifest(manifest: Dict[str, Any], assignment_file: str, timings: Union[Dict[str, float], None] = None) -> str:
+    """Finish a manifest with the timings and the final score of the scored assignment, and save it beside its annotations.
+
+    The final score is read from annotations/<assignment_file>, so call this after score_assignment_file.
+    """
+    manifest = dict(manifest)
+    start_time = manifest.pop("start_time")
+    manifest["output"] = os.path.join("assignments", assignment_file)
+    manifest["output_sha256"] = file_sha256(manifest["output"])
+    manifest["overall_score"] = load_json(os.path.join("annotations", assignment_file))["overall_score"]
+    manifest["timings"] = {"total_seconds": time.time() - start_time, **(timings or {})}
+    # Calls and wall time of the scorer functions in this process (work done in worker processes is not counted)
+    manifest["timings"]["scorer"] = {name: counter for name, counter in sorted(profile_counters.items()) if counter["calls"]}
+
+    manifest_path = os.path.join("annotations", assignment_file.replace(".json", "_manifest.json"))
+    save_json(manifest, manifest_path, noindent=False)
+    print(f"Run manifest saved to {manifest_path}")
+    return manifest_path
@@ -1,14 +1,26 @@
+import argparse
+import cProfile
+import functools
+import hashlib
 import json
+import multiprocessing
 import os
+import pstats
 import sys
-from shapely.geometry import shape, Polygon, LineString, MultiPolygon
+import time
+from shapely.geometry import shape, mapping, Polygon, LineString, MultiPolygon
 import shapely.ops
 import numpy as np
 from collections import Counter
-from functools import cache
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import cache, lru_cache
 
 from typing import Dict, List, Set, Union, Any
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import metric_cache, raster_metrics, scoring_dataset, topology
+
 # Check if running in a virtual environment
 in_venv = sys.prefix != sys.base_prefix
 if not in_venv:
@@ -16,6 +28,57 @@ if not in_venv:
     print("Please run with: source .venv/bin/activate && python scripts/annotate_assignments.py")
 
 
+# Call counts and cumulative wall time of the instrumented functions, keyed by function name
+profile_counters: Dict[str, Dict[str, float]] = {}
+profiled_functions: List[Any] = []
+
+
+def profiled(function):
+    """Count the calls and accumulate the wall time of a function in profile_counters.
+
+    Apply it above @cache so that cache hits are counted as calls too.
+    """
+    counter = profile_counters.setdefault(function.__name__, {"calls": 0, "seconds": 0.0})
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            counter["calls"] += 1
+            counter["seconds"] += time.perf_counter() - start
+
+    profiled_functions.append(wrapper)
+    return wrapper
+
+
+def start_profiling() -> cProfile.Profile:
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def print_profile_summary(profiler: Union[cProfile.Profile, None] = None, top_n: int = 20) -> None:
+    """Print the call counts, wall time and cache statistics of the scorer, and the cProfile hotspots if profiled."""
+    print("\nScorer timing summary")
+    print(f"{'function':<36} {'calls':>10} {'seconds':>10} {'ms/call':>10} {'hits':>10} {'misses':>10}")
+    for wrapper in sorted(profiled_functions, key=lambda wrapper: -profile_counters[wrapper.__name__]["seconds"]):
+        counter = profile_counters[wrapper.__name__]
+        calls = int(counter["calls"])
+        ms_per_call = 1000 * counter["seconds"] / calls if calls else 0.0
+        hits, misses = "", ""
+        if hasattr(wrapper.__wrapped__, "cache_info"):
+            cache_info = wrapper.__wrapped__.cache_info()
+            hits, misses = cache_info.hits, cache_info.misses
+        print(f"{wrapper.__name__:<36} {calls:>10} {counter['seconds']:>10.2f} {ms_per_call:>10.3f} {hits:>10} {misses:>10}")
+
+    if profiler is not None:
+        profiler.disable()
+        print()
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top_n)
+
+
 def load_json(filepath: str) -> Dict[str, Any]:
     with open(filepath, "r") as f:
         return json.load(f)
@@ -30,6 +93,7 @@ def save_json(data: Dict[str, Any], filepath: str, noindent=True) -> None:
         f.write(json_string)
 
 
+@profiled
 def is_contiguous(constituency_districts: List[str], adjacency_data: Dict[str, List[str]]) -> bool:
     """Check if a constituency is contiguous using breadth-first search."""
     if not constituency_districts:
@@ -54,14 +118,20 @@ def is_contiguous(constituency_districts: List[str], adjacency_data: Dict[str, L
     return len(visited) == len(constituency_districts)
 
 
-def calculate_nonenclavity(constituency_districts: List[str], all_constituencies: Dict[str, List[str]]) -> float:
+@profiled
+def calculate_nonenclavity(constituency_districts: List[str], all_constituencies: Dict[str, List[str]], district_to_constituency: Union[Dict[str, str], None] = None) -> float:
     """
     Calculate nonenclavity as 1 minus (max adjacent constituency count / number of non-enclave polling districts).
     For each polling district that is not an enclave in the constituency, count the adjacent constituencies.
+    Pass district_to_constituency (see get_district_to_constituency) when scoring every constituency of an assignment, to build it once.
     """
     if not constituency_districts:
         return 0.0
 
+    if district_to_constituency is None:
+        district_to_constituency = get_district_to_constituency(all_constituencies)
+    constituency_district_set = set(constituency_districts)
+
     # Find districts that are not enclaves (have external adjacents)
     non_enclave_count = 0
 
@@ -74,7 +144,7 @@ def calculate_nonenclavity(constituency_districts: List[str], all_constituencies
             continue
 
         # Get adjacent districts outside the constituency
-        external_adjacents = [adj for adj in adjacency_data[district] if adj not in constituency_districts]
+        external_adjacents = [adj for adj in adjacency_data[district] if adj not in constituency_district_set]
 
         # If no external adjacents, this is an enclave district
         if not external_adjacents:
@@ -83,12 +153,7 @@ def calculate_nonenclavity(constituency_districts: List[str], all_constituencies
         non_enclave_count += 1
 
         # Count which constituencies the adjacents belong to
-        adjacent_constituencies = set()
-        for adjacent in external_adjacents:
-            # Find which constituency this adjacent district belongs to
-            for constituency, districts in all_constituencies.items():
-                if adjacent in districts:
-                    adjacent_constituencies.add(constituency)
+        adjacent_constituencies = set(district_to_constituency[adjacent] for adjacent in external_adjacents if adjacent in district_to_constituency)
 
         for adjacent_constituency in adjacent_constituencies:
             adjacent_constituency_counts[adjacent_constituency] += 1 / len(adjacent_constituencies)
@@ -109,6 +174,10 @@ def calculate_nonenclavity(constituency_districts: List[str], all_constituencies
     return 1 - (enclavity - allowed_enclavity) / allowed_enclavity
 
 
+def get_district_to_constituency(all_constituencies: Dict[str, List[str]]) -> Dict[str, str]:
+    return {district: constituency for constituency, districts in all_constituencies.items() for district in districts}
+
+
 def calculate_geometric_score(a, b):
     if a == 0 or b == 0:
         return 0
@@ -116,52 +185,79 @@ def calculate_geometric_score(a, b):
 
 
 @cache
-def calculate_compactness(constituency_districts: tuple[str]) -> float:
-    """Average geometric score between the chord length of every quarter-degree through the centroid, and the mean chord length"""
-    # Extract geometries for the constituency districts
-    constituency_features: List[Dict[str, Any]] = [f for f in geojson_data["features"] if f["properties"]["name"] in constituency_districts]
+def get_geometry_hash() -> str:
+    """Hash of the polling district geometries, the input data of the persistently cached geometric metrics."""
+    geometry_hash = hashlib.sha256()
+    for district in sorted(get_geometry_district_names()):
+        geometry_hash.update(district.encode())
+        geometry_hash.update(shapely.to_wkb(get_district_geometry(district)))
+    return geometry_hash.hexdigest()
+
+
+def get_geometry_district_names() -> List[str]:
+    """Names of the polling districts that have a polygon."""
+    if scoring_dataset.attached_dataset is not None:
+        return list(district_dataset_idxs)
+    return list(district_geometries)
 
-    if not constituency_features:
+
+def get_district_geometry(district: str) -> Union[Polygon, None]:
+    """Polygon of a polling district, or None if it has none.
+
+    Worker processes attached to a shared dataset keep no polygons, and build one from the shared coordinates
+    each time it is needed. The metrics built from them are cached instead.
+    """
+    if scoring_dataset.attached_dataset is not None:
+        if district not in district_dataset_idxs:
+            return None
+        return scoring_dataset.build_district_geometry(scoring_dataset.attached_dataset, district_dataset_idxs[district])
+    return district_geometries.get(district)
+
+
+@profiled
+@lru_cache(maxsize=256)
+def build_constituency_geometry(constituency_districts: tuple[str]) -> Union[MultiPolygon, Polygon, None]:
+    """Union of the polling district polygons of a constituency, shared by the compactness and convexity calculations."""
+    geometries: List[Union[MultiPolygon, Polygon]] = [geometry for geometry in map(get_district_geometry, constituency_districts) if geometry is not None]
+    if not geometries:
         return None
+    return shapely.ops.unary_union(geometries)
+
+
+# Directions of the chords through the centroid, every quarter-degree from 0 to π (unique directions)
+COMPACTNESS_ANGLES = np.linspace(0, np.pi, 720)
 
-    # Create a single geometry for the constituency
-    geometries: List[Union[MultiPolygon, Polygon]] = [shape(feature["geometry"]) for feature in constituency_features]
-    constituency_geometry: Union[MultiPolygon, Polygon] = shapely.ops.unary_union(geometries)
-    # Get the centroid (center of mass) of the polygon
-    center = constituency_geometry.centroid
-    cx, cy = center.x, center.y
 
+def calculate_chord_length(constituency_geometry: Union[MultiPolygon, Polygon], cx: float, cy: float, theta: float) -> float:
+    """Length of the intersection of a constituency with the line through (cx, cy) in direction theta."""
     # Use a large constant to approximate an "infinite" line.
     # Coordinates are latitude and longtitude
     L = 1e5
 
-    chord_lengths = []
+    dx = np.cos(theta)
+    dy = np.sin(theta)
+    # Construct a long line through the centroid
+    start = (cx - L * dx, cy - L * dy)
+    end = (cx + L * dx, cy + L * dy)
+    line = LineString([start, end])
 
-    # Iterate through angles from 0 to π (unique directions)
-    for theta in np.linspace(0, np.pi, 720):
-        dx = np.cos(theta)
-        dy = np.sin(theta)
-        # Construct a long line through the centroid
-        start = (cx - L * dx, cy - L * dy)
-        end = (cx + L * dx, cy + L * dy)
-        line = LineString([start, end])
-
-        # Find the intersection of the line with the polygon
-        inter = constituency_geometry.intersection(line)
+    # Find the intersection of the line with the polygon
+    inter = constituency_geometry.intersection(line)
 
+    chord_length = 0.0
+    if inter.is_empty:
+        chord_length = 0.0
+    elif inter.geom_type == "LineString":
+        chord_length = inter.length
+    elif inter.geom_type == "MultiLineString":
+        # Should also sum of the nonintersecting
+        chord_length = sum(segment.length for segment in inter.geoms)
+    elif inter.geom_type == "Point":
         chord_length = 0.0
-        if inter.is_empty:
-            chord_length = 0.0
-        elif inter.geom_type == "LineString":
-            chord_length = inter.length
-        elif inter.geom_type == "MultiLineString":
-            # Should also sum of the nonintersecting
-            chord_length = sum(segment.length for segment in inter.geoms)
-        elif inter.geom_type == "Point":
-            chord_length = 0.0
-
-        chord_lengths.append(chord_length)
+    return chord_length
 
+
+def calculate_compactness_from_chords(chord_lengths: List[float]) -> float:
     mean_chord_length = np.median(chord_lengths)
     compactness = []
     for chord_length in chord_lengths:
@@ -170,19 +266,81 @@ def calculate_compactness(constituency_districts: tuple[str]) -> float:
     return sum(compactness) / len(compactness)
 
 
+@profiled
 @cache
+@metric_cache.persistent(
+    "compactness", get_geometry_hash, dependencies=[build_constituency_geometry, COMPACTNESS_ANGLES, calculate_chord_length, calculate_compactness_from_chords, calculate_geometric_score]
+)
+def calculate_compactness(constituency_districts: tuple[str]) -> float:
+    """Average geometric score between the chord length of every quarter-degree through the centroid, and the mean chord length"""
+    constituency_geometry = build_constituency_geometry(constituency_districts)
+    if constituency_geometry is None:
+        return None
+
+    # Get the centroid (center of mass) of the polygon
+    center = constituency_geometry.centroid
+    cx, cy = center.x, center.y
+
+    chord_lengths = [calculate_chord_length(constituency_geometry, cx, cy, theta) for theta in COMPACTNESS_ANGLES]
+    return calculate_compactness_from_chords(chord_lengths)
+
+
+@profiled
+@cache
+def calculate_compactness_adaptive(constituency_districts: tuple[str], resolution: int = 45, tolerance: float = 0.05) -> tuple[float, float]:
+    """Compactness from a subset of the chords of calculate_compactness, and an error bound.
+
+    The chords are first measured in `resolution` evenly spread directions of COMPACTNESS_ANGLES. Wherever the chord
+    length of two neighbouring measured directions differs by more than tolerance times the median measured chord length,
+    the direction halfway between them is measured too, until the neighbours are close or adjacent.
+    The remaining chords are interpolated linearly and bounded by their two measured neighbours, and the bounds are
+    carried through the median and geometric scores. The bound assumes the chord length is monotone between measured
+    directions, which is where refinement stops. With a resolution of 720, every chord is measured and the result is exact.
+    """
+    constituency_geometry = build_constituency_geometry(constituency_districts)
+    if constituency_geometry is None:
+        return None, 0.0
+
+    center = constituency_geometry.centroid
+    num_angles = len(COMPACTNESS_ANGLES)
+    measured: Dict[int, float] = {}
+    for angle_idx in np.unique(np.linspace(0, num_angles - 1, min(resolution, num_angles)).round().astype(int)).tolist():
+        measured[angle_idx] = calculate_chord_length(constituency_geometry, center.x, center.y, COMPACTNESS_ANGLES[angle_idx])
+
+    measured_idxs = sorted(measured)
+    pending = list(zip(measured_idxs[:-1], measured_idxs[1:]))
+    while pending:
+        angle_idx_1, angle_idx_2 = pending.pop()
+        if angle_idx_2 - angle_idx_1 > 1 and abs(measured[angle_idx_1] - measured[angle_idx_2]) > tolerance * np.median(list(measured.values())):
+            middle_idx = (angle_idx_1 + angle_idx_2) // 2
+            measured[middle_idx] = calculate_chord_length(constituency_geometry, center.x, center.y, COMPACTNESS_ANGLES[middle_idx])
+            pending.extend([(angle_idx_1, middle_idx), (middle_idx, angle_idx_2)])
+
+    measured_idxs = np.array(sorted(measured))
+    measured_lengths = np.array([measured[angle_idx] for angle_idx in measured_idxs])
+    chord_lengths = np.interp(np.arange(num_angles), measured_idxs, measured_lengths)
+    compactness = calculate_compactness_from_chords(chord_lengths.tolist())
+    if len(measured) == num_angles:
+        return compactness, 0.0
+
+    # Each interpolated chord lies between its measured neighbours
+    right = np.clip(np.searchsorted(measured_idxs, np.arange(num_angles)), 0, len(measured_idxs) - 1)
+    left = np.where(measured_idxs[right] == np.arange(num_angles), right, right - 1)
+    chord_low = np.minimum(measured_lengths[left], measured_lengths[right])
+    chord_high = np.maximum(measured_lengths[left], measured_lengths[right])
+    score_low, score_high = raster_metrics.geometric_score_interval(chord_low, chord_high, np.median(chord_low), np.median(chord_high))
+    return compactness, float(max(compactness - score_low.mean(), score_high.mean() - compactness, 0.0))
+
+
+@profiled
+@cache
+@metric_cache.persistent("convexity", get_geometry_hash, dependencies=[build_constituency_geometry])
 def calculate_convexity(constituency_districts: tuple[str]) -> float:
     """Calculate convexity as area of shape over area of convex hull."""
-    # Extract geometries for the constituency districts
-    constituency_features: List[Dict[str, Any]] = [f for f in geojson_data["features"] if f["properties"]["name"] in constituency_districts]
-
-    if not constituency_features:
+    constituency_geometry = build_constituency_geometry(constituency_districts)
+    if constituency_geometry is None:
         return None
 
-    # Create a single geometry for the constituency
-    geometries: List[Union[MultiPolygon, Polygon]] = [shape(feature["geometry"]) for feature in constituency_features]
-    constituency_geometry: Union[MultiPolygon, Polygon] = shapely.ops.unary_union(geometries)
-
     # Calculate area of the constituency
     constituency_area: float = constituency_geometry.area
 
@@ -192,6 +350,80 @@ def calculate_convexity(constituency_districts: tuple[str]) -> float:
     return constituency_area / convex_hull.area
 
 
+def calculate_geometric_metrics(constituency_districts: tuple[str]) -> tuple[float, float]:
+    """Compactness and convexity of a constituency, as one task for a worker process."""
+    return calculate_compactness(constituency_districts), calculate_convexity(constituency_districts)
+
+
+@cache
+def get_district_raster() -> Dict[str, Any]:
+    """Polling districts rasterized onto the grid of the raster engine, see scripts/raster_metrics.py."""
+    return raster_metrics.rasterize_districts({district: get_district_geometry(district) for district in get_geometry_district_names()})
+
+
+@profiled
+@cache
+def calculate_raster_geometric_metrics(constituency_districts: tuple[str]) -> tuple[float, float, float, float]:
+    """Compactness, its error bound, convexity and its error bound from the raster engine, as one task for a worker process."""
+    return raster_metrics.calculate_raster_metrics(get_district_raster(), constituency_districts)
+
+
+def calculate_adaptive_geometric_metrics(constituency_districts: tuple[str]) -> tuple[float, float, float, float]:
+    """Adaptive compactness and its error bound, and the exact convexity, as one task for a worker process."""
+    return (*calculate_compactness_adaptive(constituency_districts), calculate_convexity(constituency_districts), 0.0)
+
+
+@profiled
+@cache
+def calculate_shared_boundary_length(district: str, adjacent: str) -> float:
+    """Length of the boundary of a polling district that runs along an adjacent polling district."""
+    if scoring_dataset.attached_dataset is not None and adjacent in adjacency_data.get(district, []):
+        # Precomputed lengths are in the shared dataset, in adjacency order
+        dataset = scoring_dataset.attached_dataset
+        shared_boundary_length = dataset["shared_boundary_lengths"][dataset["adjacency_indptr"][district_dataset_idxs[district]] + adjacency_data[district].index(adjacent)]
+        if not np.isnan(shared_boundary_length):
+            return float(shared_boundary_length)
+    elif adjacent in shared_boundary_lengths.get(district, {}):
+        # Precomputed by scripts/generate_adjacent_districts.py
+        return shared_boundary_lengths[district][adjacent]
+    # A small buffer absorbs boundary vertices that one district has and the other does not
+    return get_district_geometry(district).boundary.intersection(get_district_geometry(adjacent).buffer(1e-6)).length
+
+
+@profiled
+@cache
+def calculate_compactness_proxy(constituency_districts: tuple[str]) -> float:
+    """Polsby-Popper score 4πA/P² computed from per-district areas and perimeters, without building the union.
+
+    The perimeter of the union is the sum of the district perimeters minus twice the boundary shared between member districts.
+    """
+    constituency_districts_set = set(constituency_districts)
+    area = 0.0
+    perimeter = 0.0
+    for district in constituency_districts:
+        area += district_areas[district]
+        perimeter += district_perimeters[district]
+        for adjacent in adjacency_data.get(district, []):
+            if adjacent in constituency_districts_set:
+                # Each shared edge is visited once from either side
+                perimeter -= calculate_shared_boundary_length(district, adjacent)
+
+    if perimeter <= 0:
+        return 0.0
+    return min(1.0, 4 * np.pi * area / perimeter**2)
+
+
+@profiled
+@cache
+def calculate_convexity_proxy(constituency_districts: tuple[str]) -> float:
+    """Upper bound of convexity: sum of district areas over the convex hull of all district vertices."""
+    area = sum(district_areas[district] for district in constituency_districts)
+    convex_hull = shapely.convex_hull(shapely.MultiPoint(np.concatenate([district_coordinates[district] for district in constituency_districts])))
+    if convex_hull.area == 0:
+        return 0.0
+    return min(1.0, area / convex_hull.area)
+
+
 with open("raw_data/name_aliases.json", "r") as f:
     alias_groups = json.load(f)
 
@@ -202,6 +434,7 @@ for group in alias_groups:
         name_aliases[name] = group
 
 
+@profiled
 @cache
 def calculate_relevance(constituency_name: str, polling_districts: tuple[str]) -> float:
     """Calculate relevance based on constituency name and MRT station names.
@@ -217,30 +450,19 @@ def calculate_relevance(constituency_name: str, polling_districts: tuple[str]) -
     # Extract parts from constituency name
     constituency_parts = [constituency_name]
     if "-" in constituency_name:
-        constituency_parts = list(set(part.strip() for part in constituency_name.split("-")))
+        # Unique parts in name order, since a set would order the partial match sums by string hash
+        constituency_parts = list(dict.fromkeys(part.strip() for part in constituency_name.split("-")))
 
     all_match_count = 0
     partial_match_counts = [0 for _ in constituency_parts]
     total_elector_size = 0
 
     for district in polling_districts:
-        if district not in district_features:
+        if district not in district_mrt_names:
             continue
 
-        matched_constituency_parts = set()
-        properties = district_features[district]
-
-        # Get all MRT station names from the nearest_mrts list
-        mrt_stations = properties.get("nearest_mrts", [])
-
-        # Add aliases for each MRT station name
-        for mrt in mrt_stations:
-            if mrt in constituency_parts:
-                matched_constituency_parts.add(mrt)
-            if mrt in name_aliases:
-                for mrt_alias in name_aliases[mrt]:
-                    if mrt_alias in constituency_parts:
-                        matched_constituency_parts.add(mrt_alias)
+        # Match against the nearest MRT station names and their aliases
+        matched_constituency_parts = set(constituency_part for constituency_part in constituency_parts if constituency_part in district_mrt_names[district])
 
         elector_size = district_to_elector_size.get(district, 0)
         total_elector_size += elector_size
@@ -260,47 +482,224 @@ def calculate_relevance(constituency_name: str, polling_districts: tuple[str]) -
     return numerator / denominator
 
 
-# Load supporting data
-adjacency_data = load_json("intermediate_data/ge2025_polling_districts_to_adjacent_districts.json")
+def calculate_relevance_weights(constituency_name: str, polling_districts: tuple[str]) -> tuple[List[float], List[float]]:
+    """Weights of the elector size of each polling district in the numerator and denominator of calculate_relevance.
+
+    The relevance is the elector-size-weighted sum of the numerator weights over that of the denominator weights,
+    which lets the relevance be computed for many elector sizes or district sets at once.
+    """
+    constituency_parts = [constituency_name]
+    if "-" in constituency_name:
+        constituency_parts = list(dict.fromkeys(part.strip() for part in constituency_name.split("-")))
+
+    numerator_weights = []
+    denominator_weights = []
+    for district in polling_districts:
+        if district not in district_mrt_names:
+            numerator_weights.append(0.0)
+            denominator_weights.append(0.0)
+            continue
+        matched_count = sum(constituency_part in district_mrt_names[district] for constituency_part in constituency_parts)
+        numerator_weights.append(1.0 if matched_count == len(constituency_parts) else matched_count / len(constituency_parts) ** 0.5)
+        denominator_weights.append(1.0)
+    return numerator_weights, denominator_weights
+
+
+def get_mrt_names(nearest_mrts: List[str]) -> Set[str]:
+    """The nearest MRT station names of a polling district together with their aliases."""
+    mrt_names = set(nearest_mrts)
+    for mrt in nearest_mrts:
+        mrt_names.update(name_aliases.get(mrt, []))
+    return mrt_names
 
-# Load GeoJSON data for compactness calculation
-with open("processed_data/ge2025_polling_districts_with_information.geojson", "r") as f:
-    geojson_data = json.load(f)
 
-# Create mapping of district name to elector size and properties
 district_to_elector_size: Dict[str, int] = {}
-district_features: Dict[str, Dict[str, Any]] = {}
-for feature in geojson_data["features"]:
-    district_name = feature["properties"]["name"]
-    district_features[district_name] = feature["properties"]
-    if "elector_size" in feature["properties"]:
-        district_to_elector_size[district_name] = feature["properties"]["elector_size"]
+district_geometries: Dict[str, Union[MultiPolygon, Polygon]] = {}
+district_coordinates: Dict[str, np.ndarray] = {}
+district_mrt_names: Dict[str, Set[str]] = {}
+district_areas: Dict[str, float] = {}
+district_perimeters: Dict[str, float] = {}
+# Index of each polling district in the shared dataset of a worker process
+district_dataset_idxs: Dict[str, int] = {}
+shared_boundary_lengths: Dict[str, Dict[str, float]] = {}
+
+if scoring_dataset.attached_dataset is not None:
+    # Worker processes read the dataset that the parent process placed in shared memory instead of parsing the files,
+    # and leave district_geometries empty, see get_district_geometry
+    adjacency_data, district_to_elector_size, district_coordinates, district_mrt_names = scoring_dataset.unpack_scoring_dataset(scoring_dataset.attached_dataset)
+    district_dataset_idxs = {district: idx for idx, district in enumerate(adjacency_data)}
+    district_areas = dict(zip(adjacency_data, scoring_dataset.attached_dataset["district_areas"].tolist()))
+    district_perimeters = dict(zip(adjacency_data, scoring_dataset.attached_dataset["district_perimeters"].tolist()))
+else:
+    # Load supporting data
+    adjacency_data = load_json("intermediate_data/ge2025_polling_districts_to_adjacent_districts.json")
+
+    # Load polling district data for compactness calculation, preferring the compact TopoJSON export
+    if os.path.exists("processed_data/ge2025_polling_districts_with_information.topojson"):
+        geojson_data = topology.topojson_to_geojson(load_json("processed_data/ge2025_polling_districts_with_information.topojson"), "polling_districts")
+    else:
+        with open("processed_data/ge2025_polling_districts_with_information.geojson", "r") as f:
+            geojson_data = json.load(f)
+
+    # Create mapping of district name to elector size, geometry and MRT names
+    for feature in geojson_data["features"]:
+        district_name = feature["properties"]["name"]
+        district_geometries[district_name] = shape(feature["geometry"])
+        district_coordinates[district_name] = shapely.get_coordinates(district_geometries[district_name])
+        district_areas[district_name] = district_geometries[district_name].area
+        district_perimeters[district_name] = district_geometries[district_name].length
+        district_mrt_names[district_name] = get_mrt_names(feature["properties"].get("nearest_mrts", []))
+        if "elector_size" in feature["properties"]:
+            district_to_elector_size[district_name] = feature["properties"]["elector_size"]
+    del geojson_data
+
+    if os.path.exists("intermediate_data/ge2025_polling_districts_shared_boundary_lengths.json"):
+        shared_boundary_lengths = load_json("intermediate_data/ge2025_polling_districts_shared_boundary_lengths.json")
+
+
+def export_scoring_dataset():
+    """Place the loaded scoring data in shared memory, see scripts/scoring_dataset.py."""
+    dataset = scoring_dataset.build_scoring_dataset(district_geometries, adjacency_data, district_to_elector_size, district_mrt_names, shared_boundary_lengths)
+    return scoring_dataset.export_shared_dataset(dataset)
+
+
+@profiled
+def calculate_elector_balances(assignment_data: Dict[str, Any]) -> List[float]:
+    """Elector balance of each constituency, in assignment order. This is pure arithmetic over elector sizes."""
+    elector_sizes = [sum(district_to_elector_size.get(district, 0) for district in item["polling_districts"]) for item in assignment_data["assignment"]]
+    member_sizes = [item["member_size"] for item in assignment_data["assignment"]]
+    mean_electors_per_member = sum(elector_sizes) / sum(member_sizes)
+    return [calculate_geometric_score(elector_size / member_size, mean_electors_per_member) for elector_size, member_size in zip(elector_sizes, member_sizes)]
+
+
+def calculate_overall_score(results: List[Dict[str, Any]]) -> float:
+    """Add elector_balance and constituency_score to each result, and return the overall score."""
+    full_elector_size = 0
+    full_member_size = 0
+    for result in results:
+        full_elector_size += result["elector_size"]
+        full_member_size += result["member_size"]
+    for result in results:
+        result["elector_balance"] = calculate_geometric_score(result["elector_size"] / result["member_size"], full_elector_size / full_member_size)
+
+    for result in results:
+        constituency_score = (result["nonenclavity"] + result["compactness"] + result["convexity"] + result["relevance"] + result["elector_balance"]) / 5
+        # each constituency_score score is upper bounded by their elector_balance
+        constituency_score = min(constituency_score, result["elector_balance"])
+        result["constituency_score"] = constituency_score
+
+    # Calculate overall score as member-weighted average of constituency scores, bounded by minimum elector_balance
+    overall_score = sum(result["constituency_score"] * result["member_size"] for result in results) / full_member_size
+    overall_score = min(overall_score, min(result["elector_balance"] for result in results))
+    return overall_score
+
+
+# Geometric metric tasks of the approximate engines of score_assignment, returning compactness, its error bound, convexity and its error bound
+APPROXIMATE_ENGINE_METRICS = {"raster": calculate_raster_geometric_metrics, "adaptive": calculate_adaptive_geometric_metrics}
 
 
-def score_assignment(assignment_data: Dict[str, Any]) -> Dict[str, Any]:
+@profiled
+def score_assignment_proxy(assignment_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Cheap approximation of score_assignment for ranking candidates.
+
+    Elector balance, nonenclavity and relevance are exact.
+    Compactness is replaced by the Polsby-Popper score and convexity by its area-sum upper bound,
+    neither of which needs the union of the polling district polygons.
+    """
+    constituencies: Dict[str, List[str]] = {item["constituency_name"]: item["polling_districts"] for item in assignment_data["assignment"]}
+    district_to_constituency = get_district_to_constituency(constituencies)
+
+    results: List[Dict[str, Any]] = []
+    for item in assignment_data["assignment"]:
+        constituency_name = item["constituency_name"]
+        polling_districts = item["polling_districts"]
+        results.append(
+            {
+                "constituency_name": constituency_name,
+                "member_size": item["member_size"],
+                "elector_size": sum(district_to_elector_size.get(district, 0) for district in polling_districts),
+                "nonenclavity": calculate_nonenclavity(polling_districts, constituencies, district_to_constituency),
+                "compactness": calculate_compactness_proxy(tuple(polling_districts)),
+                "convexity": calculate_convexity_proxy(tuple(polling_districts)),
+                "relevance": calculate_relevance(constituency_name, tuple(polling_districts)),
+            }
+        )
+
+    overall_score = calculate_overall_score(results)
+    return {"annotations": results, "overall_score": overall_score}
+
+
+@profiled
+def score_assignment(assignment_data: Dict[str, Any], threshold: Union[float, None] = None, executor: Union[Executor, None] = None, engine: str = "vector") -> Dict[str, Any]:
+    """Score every constituency and the overall assignment.
+
+    If a threshold is given, the elector balances are computed first.
+    The overall score cannot exceed the minimum elector balance, so when that bound is not above the threshold
+    the geometric metrics are skipped and the bound is returned as the overall score with "exceeds_threshold" set to False.
+
+    If an executor is given, the compactness and convexity of the constituencies are computed on it.
+
+    With engine="raster", compactness and convexity are approximated on a grid instead (see scripts/raster_metrics.py),
+    and with engine="adaptive", compactness is computed from fewer chords (see calculate_compactness_adaptive).
+    Each annotation then has a compactness_error_bound and convexity_error_bound, and "error_bound" bounds the
+    difference between the overall score and the exact one.
+    """
+    if engine != "vector" and engine not in APPROXIMATE_ENGINE_METRICS:
+        raise ValueError(f"Unknown engine {engine}, choose from vector, {', '.join(APPROXIMATE_ENGINE_METRICS)}")
+
+    if threshold is not None:
+        elector_balances = calculate_elector_balances(assignment_data)
+        upper_bound = min(elector_balances)
+        if upper_bound <= threshold:
+            annotations = [
+                {
+                    "constituency_name": item["constituency_name"],
+                    "member_size": item["member_size"],
+                    "elector_size": sum(district_to_elector_size.get(district, 0) for district in item["polling_districts"]),
+                    "elector_balance": elector_balance,
+                }
+                for item, elector_balance in zip(assignment_data["assignment"], elector_balances)
+            ]
+            return {"annotations": annotations, "overall_score": upper_bound, "exceeds_threshold": False}
+
     # Organize constituencies and their districts
     constituencies: Dict[str, List[str]] = {}
     for item in assignment_data["assignment"]:
         constituency_name = item["constituency_name"]
         polling_districts = item["polling_districts"]
         constituencies[constituency_name] = polling_districts
+    district_to_constituency = get_district_to_constituency(constituencies)
+
+    # The geometric metrics dominate the scoring time, so they are spread over the executor in constituency order
+    geometric_metrics = None
+    if engine != "vector" and executor is not None:
+        geometric_metrics = list(executor.map(APPROXIMATE_ENGINE_METRICS[engine], [tuple(item["polling_districts"]) for item in assignment_data["assignment"]]))
+    elif engine != "vector":
+        geometric_metrics = [APPROXIMATE_ENGINE_METRICS[engine](tuple(item["polling_districts"])) for item in assignment_data["assignment"]]
+    elif executor is not None:
+        geometric_metrics = list(executor.map(calculate_geometric_metrics, [tuple(item["polling_districts"]) for item in assignment_data["assignment"]]))
 
     # Analyze each constituency
     results: List[Dict[str, Any]] = []
-    for item in assignment_data["assignment"]:
+    for assignment_idx, item in enumerate(assignment_data["assignment"]):
         constituency_name = item["constituency_name"]
         polling_districts = item["polling_districts"]
 
         local_elector_size = sum(district_to_elector_size.get(district, 0) for district in polling_districts)
 
         # Calculate nonenclavity
-        nonenclavity = calculate_nonenclavity(polling_districts, constituencies)
+        nonenclavity = calculate_nonenclavity(polling_districts, constituencies, district_to_constituency)
 
-        # Calculate compactness
-        compactness = calculate_compactness(tuple(polling_districts))
+        if engine != "vector":
+            compactness, compactness_error_bound, convexity, convexity_error_bound = geometric_metrics[assignment_idx]
+        elif geometric_metrics is not None:
+            compactness, convexity = geometric_metrics[assignment_idx]
+        else:
+            # Calculate compactness
+            compactness = calculate_compactness(tuple(polling_districts))
 
-        # Calculate convexity
-        convexity = calculate_convexity(tuple(polling_districts))
+            # Calculate convexity
+            convexity = calculate_convexity(tuple(polling_districts))
 
         # Calculate relevance score
         relevance = calculate_relevance(constituency_name, tuple(polling_districts))
@@ -317,28 +716,23 @@ def score_assignment(assignment_data: Dict[str, Any]) -> Dict[str, Any]:
                 "relevance": relevance,
             }
         )
+        if engine != "vector":
+            results[-1]["compactness_error_bound"] = compactness_error_bound
+            results[-1]["convexity_error_bound"] = convexity_error_bound
 
-    full_elector_size = 0
-    full_member_size = 0
-    for result in results:
-        full_elector_size += result["elector_size"]
-        full_member_size += result["member_size"]
-    for result in results:
-        result["elector_balance"] = calculate_geometric_score(result["elector_size"] / result["member_size"], full_elector_size / full_member_size)
-
-    for result in results:
-        constituency_score = (result["nonenclavity"] + result["compactness"] + result["convexity"] + result["relevance"] + result["elector_balance"]) / 5
-        # each constituency_score score is upper bounded by their elector_balance
-        constituency_score = min(constituency_score, result["elector_balance"])
-        result["constituency_score"] = constituency_score
-
-    # Calculate overall score as member-weighted average of constituency scores, bounded by minimum elector_balance
-    overall_score = sum(result["constituency_score"] * result["member_size"] for result in results) / full_member_size
-    overall_score = min(overall_score, min(result["elector_balance"] for result in results))
+    overall_score = calculate_overall_score(results)
+    scores = {"annotations": results, "overall_score": overall_score}
+    if engine != "vector":
+        # Constituency scores are means of five metrics, and the minimums and member-weighted mean do not widen the error
+        full_member_size = sum(result["member_size"] for result in results)
+        scores["error_bound"] = sum(result["member_size"] * (result["compactness_error_bound"] + result["convexity_error_bound"]) / 5 for result in results) / full_member_size
 
-    return {"annotations": results, "overall_score": overall_score}
+    if threshold is not None:
+        scores["exceeds_threshold"] = overall_score > threshold
+    return scores
 
 
+@profiled
 def validate_assignment(assignment_data: Dict[str, Any]) -> tuple[bool, Dict]:
     """
     Validate that the constituency assignment meets all requirements:
@@ -414,9 +808,60 @@ def validate_assignment(assignment_data: Dict[str, Any]) -> tuple[bool, Dict]:
     return is_valid, errors
 
 
-def score_assignment_file(assignment_file):
+# Simplification tolerance (in degrees) of the constituency boundaries drawn by index.html, from the minimum zoom level they are used at
+MAP_LEVELS = [{"min_zoom": 0, "tolerance": 5e-4}, {"min_zoom": 13, "tolerance": 1e-4}, {"min_zoom": 15, "tolerance": 2e-5}]
+
+# Holes smaller than this (in square degrees, about 1.2 hectares) are slivers between polling districts and are filled in
+MAP_MIN_HOLE_AREA = 1e-6
+
+
+def round_geometry(geometry):
+    return shapely.transform(shapely.force_2d(geometry), lambda coordinates: np.round(coordinates, 6))
+
+
+def build_constituency_map(assignment_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Constituency boundaries for index.html, so that the page does not need to union polling districts itself.
+
+    The boundaries are simplified together with shapely.coverage_simplify, which keeps the boundary shared by
+    two constituencies identical in both, at each tolerance in MAP_LEVELS.
+    The feature geometry is the coarsest level, and "geometries_by_level" holds every level.
+    """
+    constituency_geometries = []
+    for item in assignment_data["assignment"]:
+        geometry = build_constituency_geometry(tuple(item["polling_districts"]))
+        polygons = []
+        for polygon in getattr(geometry, "geoms", [geometry]):
+            interiors = [interior for interior in polygon.interiors if Polygon(interior).area >= MAP_MIN_HOLE_AREA]
+            polygons.append(Polygon(polygon.exterior, interiors))
+        constituency_geometries.append(MultiPolygon(polygons) if len(polygons) > 1 else polygons[0])
+
+    simplified_geometries_by_level = [shapely.coverage_simplify(constituency_geometries, level["tolerance"]) for level in MAP_LEVELS]
+
+    features = []
+    for idx, item in enumerate(assignment_data["assignment"]):
+        centroid = constituency_geometries[idx].centroid
+        geometries_by_level = [mapping(round_geometry(simplified_geometries[idx])) for simplified_geometries in simplified_geometries_by_level]
+        features.append(
+            {
+                "type": "Feature",
+                "properties": {
+                    "name": item["constituency_name"],
+                    "member_size": item["member_size"],
+                    "elector_size": sum(district_to_elector_size.get(district, 0) for district in item["polling_districts"]),
+                    "polling_districts": item["polling_districts"],
+                    "centroid": [round(centroid.x, 6), round(centroid.y, 6)],
+                },
+                "geometry": geometries_by_level[0],
+                "geometries_by_level": geometries_by_level,
+            }
+        )
+    return {"type": "FeatureCollection", "levels": MAP_LEVELS, "features": features}
+
+
+def score_assignment_file(assignment_file: str, executor: Union[Executor, None] = None) -> None:
     input_path = os.path.join("assignments", assignment_file)
     output_path = os.path.join("annotations", assignment_file)
+    map_output_path = os.path.join("annotations", assignment_file.replace(".json", ".geojson"))
 
     print(f"Processing {assignment_file}...")
 
@@ -429,19 +874,50 @@ def score_assignment_file(assignment_file):
         raise ValueError(f"Invalid assignment {assignment_file}: {errors}")
 
     # Score the assignment
-    results = score_assignment(assignment_data)
+    results = score_assignment(assignment_data, executor=executor)
 
     # Save results
     save_json(results, output_path, noindent=False)
     print(f"Annotations saved to {output_path}")
 
+    # Save the constituency boundaries for the map, compactly as it is served to the browser
+    with open(map_output_path, "w") as f:
+        json.dump(build_constituency_map(assignment_data), f, separators=(",", ":"))
+    print(f"Constituency boundaries saved to {map_output_path}")
 
-def main() -> None:
-    # Get all assignment files
-    assignment_files = [f for f in os.listdir("assignments") if f.endswith(".json")]
 
-    for assignment_file in assignment_files:
-        score_assignment_file(assignment_file)
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Validate and score every assignment in assignments/ and write the annotations.")
+    parser.add_argument("--profile", action="store_true", help="Run under cProfile and print a timing summary at the end (worker processes are not profiled)")
+    parser.add_argument("--no-metric-cache", action="store_true", help="Do not read or write the persistent metric cache, see scripts/metric_cache.py")
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Number of worker processes. With at least as many files as jobs the files are scored in parallel, otherwise the constituencies of each file are"
+    )
+    args = parser.parse_args()
+
+    if args.no_metric_cache:
+        metric_cache.enabled = False
+    profiler = start_profiling() if args.profile else None
+
+    # Get all assignment files, in a fixed order
+    assignment_files = sorted(f for f in os.listdir("assignments") if f.endswith(".json"))
+
+    if args.jobs > 1:
+        # Forked workers inherit the loaded scoring data instead of parsing the files again
+        mp_context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(max_workers=args.jobs, mp_context=mp_context) as executor:
+            if len(assignment_files) >= args.jobs:
+                # Each worker writes the outputs of its own files, and map re-raises the first error in file order
+                list(executor.map(score_assignment_file, assignment_files))
+            else:
+                for assignment_file in assignment_files:
+                    score_assignment_file(assignment_file, executor=executor)
+    else:
+        for assignment_file in assignment_files:
+            score_assignment_file(assignment_file)
+
+    if args.profile:
+        print_profile_summary(profiler)
 
 
 if __name__ == "__main__":
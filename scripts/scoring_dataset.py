@@ -0,0 +1,162 @@
+"""Flat NumPy representation of the scoring data, which can be placed in shared memory for worker processes.
+
+The GeoJSON and adjacency JSON parse into many small Python objects, and every worker process that imports
+scripts/score_assignments.py would hold its own copy. Instead, the parent process packs the data into a few arrays
+and copies them into multiprocessing.shared_memory blocks. Workers map the blocks as read-only arrays.
+
+The polygon coordinates, district areas and perimeters, and precomputed shared boundary lengths stay in the shared
+arrays. A worker keeps no polygons, and builds a district's polygon from the shared coordinates only when a metric
+needs it (see build_district_geometry). The adjacency, elector size and MRT name lookups are small, and are still
+rebuilt as Python dicts in each worker, since score_assignments reads them everywhere.
+
+This module deliberately does not import score_assignments, so that a worker can attach the dataset
+before score_assignments is imported and reads it instead of the files.
+"""
+
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Set, Tuple
+
+import numpy as np
+import shapely
+
+# Set in worker processes by attach_shared_dataset, and read by score_assignments at import
+attached_dataset: Dict[str, np.ndarray] = None
+attached_shared_memory: List[shared_memory.SharedMemory] = []
+
+
+def build_scoring_dataset(
+    district_geometries: Dict[str, Any],
+    adjacency_data: Dict[str, List[str]],
+    district_to_elector_size: Dict[str, int],
+    district_mrt_names: Dict[str, Set[str]],
+    shared_boundary_lengths: Dict[str, Dict[str, float]],
+) -> Dict[str, np.ndarray]:
+    """Pack the scoring data into arrays.
+
+    - district_names: name of each district, which defines the district index
+    - coordinates, ring_offsets, district_ring_offsets: polygon rings, the exterior ring of a district comes first
+    - district_areas, district_perimeters: area and boundary length of each district polygon
+    - adjacency_indptr, adjacency_indices: adjacency in compressed sparse row form
+    - shared_boundary_lengths: precomputed length of each adjacency, NaN where it was not precomputed
+    - elector_sizes: elector size of each district
+    - mrt_names, mrt_matches: whether each district matches each MRT name (including aliases)
+    """
+    district_names = sorted(district_geometries)
+    district_to_idx = {district: idx for idx, district in enumerate(district_names)}
+
+    rings = []
+    district_ring_offsets = [0]
+    for district in district_names:
+        polygon = district_geometries[district]
+        if polygon.geom_type != "Polygon":
+            raise ValueError(f"Polling district {district} is a {polygon.geom_type}, only Polygons are supported")
+        rings.append(shapely.get_coordinates(polygon.exterior))
+        rings.extend(shapely.get_coordinates(interior) for interior in polygon.interiors)
+        district_ring_offsets.append(len(rings))
+
+    adjacency_indptr = [0]
+    adjacency_indices = []
+    adjacency_lengths = []
+    for district in district_names:
+        adjacency_indices.extend(district_to_idx[adjacent] for adjacent in adjacency_data.get(district, []))
+        adjacency_lengths.extend(shared_boundary_lengths.get(district, {}).get(adjacent, np.nan) for adjacent in adjacency_data.get(district, []))
+        adjacency_indptr.append(len(adjacency_indices))
+
+    mrt_names = sorted(set().union(*district_mrt_names.values()))
+    mrt_name_to_idx = {mrt_name: idx for idx, mrt_name in enumerate(mrt_names)}
+    mrt_matches = np.zeros((len(district_names), len(mrt_names)), dtype=bool)
+    for district, mrt_name_set in district_mrt_names.items():
+        for mrt_name in mrt_name_set:
+            mrt_matches[district_to_idx[district], mrt_name_to_idx[mrt_name]] = True
+
+    return {
+        "district_names": np.array(district_names),
+        "coordinates": np.concatenate(rings),
+        "ring_offsets": np.cumsum([0] + [len(ring) for ring in rings]),
+        "district_ring_offsets": np.array(district_ring_offsets),
+        "district_areas": np.array([district_geometries[district].area for district in district_names]),
+        "district_perimeters": np.array([district_geometries[district].length for district in district_names]),
+        "adjacency_indptr": np.array(adjacency_indptr, dtype=np.int32),
+        "adjacency_indices": np.array(adjacency_indices, dtype=np.int32),
+        "shared_boundary_lengths": np.array(adjacency_lengths, dtype=float),
+        "elector_sizes": np.array([district_to_elector_size.get(district, 0) for district in district_names], dtype=np.int64),
+        "mrt_names": np.array(mrt_names),
+        "mrt_matches": mrt_matches,
+    }
+
+
+def unpack_scoring_dataset(dataset: Dict[str, np.ndarray]) -> Tuple[Dict[str, List[str]], Dict[str, int], Dict[str, np.ndarray], Dict[str, Set[str]]]:
+    """Rebuild the lookups that score_assignments uses from the arrays.
+
+    The district coordinates are views into the dataset arrays. Polygons are not built here, see build_district_geometry.
+    The keys of every lookup are in district index order.
+    """
+    district_names = [str(district) for district in dataset["district_names"]]
+    ring_offsets = dataset["ring_offsets"]
+    district_ring_offsets = dataset["district_ring_offsets"]
+    adjacency_indptr = dataset["adjacency_indptr"]
+    adjacency_indices = dataset["adjacency_indices"]
+    mrt_names = [str(mrt_name) for mrt_name in dataset["mrt_names"]]
+
+    adjacency_data: Dict[str, List[str]] = {}
+    district_to_elector_size: Dict[str, int] = {}
+    district_coordinates: Dict[str, np.ndarray] = {}
+    district_mrt_names: Dict[str, Set[str]] = {}
+    for idx, district in enumerate(district_names):
+        adjacency_data[district] = [district_names[adjacent_idx] for adjacent_idx in adjacency_indices[adjacency_indptr[idx] : adjacency_indptr[idx + 1]]]
+        district_to_elector_size[district] = int(dataset["elector_sizes"][idx])
+        district_coordinates[district] = dataset["coordinates"][ring_offsets[district_ring_offsets[idx]] : ring_offsets[district_ring_offsets[idx + 1]]]
+        district_mrt_names[district] = {mrt_names[mrt_idx] for mrt_idx in np.flatnonzero(dataset["mrt_matches"][idx])}
+
+    return adjacency_data, district_to_elector_size, district_coordinates, district_mrt_names
+
+
+def build_district_geometry(dataset: Dict[str, np.ndarray], district_idx: int) -> shapely.Polygon:
+    """Polygon of a district, built from its rings in the shared coordinates.
+
+    GEOS copies the coordinates into the polygon, so callers use it and drop it rather than keeping one per district.
+    """
+    coordinates = dataset["coordinates"]
+    ring_offsets = dataset["ring_offsets"]
+    first_ring, last_ring = dataset["district_ring_offsets"][district_idx], dataset["district_ring_offsets"][district_idx + 1]
+    rings = [coordinates[ring_offsets[ring] : ring_offsets[ring + 1]] for ring in range(first_ring, last_ring)]
+    return shapely.Polygon(rings[0], rings[1:])
+
+
+def export_shared_dataset(dataset: Dict[str, np.ndarray]) -> Tuple[List[shared_memory.SharedMemory], Dict[str, Tuple[str, tuple, str]]]:
+    """Copy each array into a shared memory block.
+
+    Returns the blocks, which the caller must keep alive and release with release_shared_dataset,
+    and a picklable spec that workers pass to attach_shared_dataset.
+    """
+    shared_memory_blocks = []
+    spec = {}
+    for key, array in dataset.items():
+        block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        shared_memory_blocks.append(block)
+        spec[key] = (block.name, array.shape, array.dtype.str)
+    return shared_memory_blocks, spec
+
+
+def attach_shared_dataset(spec: Dict[str, Tuple[str, tuple, str]]) -> Dict[str, np.ndarray]:
+    """Attach to the shared memory blocks of an exported dataset, as read-only arrays over the blocks.
+
+    Use it as the initializer of a worker process, before score_assignments is imported.
+    """
+    global attached_dataset
+    dataset = {}
+    for key, (name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=name)
+        attached_shared_memory.append(block)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        dataset[key] = array
+    attached_dataset = dataset
+    return dataset
+
+
+def release_shared_dataset(shared_memory_blocks: List[shared_memory.SharedMemory]) -> None:
+    for block in shared_memory_blocks:
+        block.close()
+        block.unlink()
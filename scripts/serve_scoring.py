@@ -0,0 +1,210 @@
+"""Long-running local scoring service for interactive editing in index.html.
+
+Scoring an assignment from the command line reloads the polling district data and starts with cold metric caches.
+This service loads the data once and keeps the caches of score_assignments.py warm between requests,
+so that scoring an edit that changes a few constituencies only recomputes the metrics of those constituencies.
+
+Every endpoint takes an assignment in the format of assignments/*.json as the POST body and returns JSON:
+
+- POST /score: score_assignment, with an optional "threshold" field in the body
+- POST /validate: validate_assignment, as {"valid": ..., "errors": ...}
+- POST /suggest: the single polling district move that most improves the overall score, with an optional "top_k" field in the body
+- GET /health
+
+/score and /suggest validate the assignment first and answer 400 with the validation errors if it is invalid.
+Any other failure answers 500, so the browser always gets a JSON response.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.score_assignments import (
+    adjacency_data,
+    calculate_elector_balances,
+    is_contiguous,
+    load_json,
+    score_assignment,
+    score_assignment_proxy,
+    validate_assignment,
+)
+
+# Requests are scored one at a time on a single worker thread, so the event loop keeps accepting connections
+# while a request is being scored, and the metric caches are never filled from two threads at once
+scoring_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def handle_score(request: Dict[str, Any]) -> Dict[str, Any]:
+    return score_assignment(request, threshold=request.get("threshold"))
+
+
+def handle_validate(request: Dict[str, Any]) -> Dict[str, Any]:
+    validated, errors = validate_assignment(request)
+    return {"valid": validated, "errors": errors}
+
+
+def handle_suggest(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Find the best move of one polling district to an adjacent constituency.
+
+    Every move that keeps the source constituency contiguous is ranked by the proxy score,
+    after pruning the moves whose elector balance bound does not beat the current score,
+    and only the top K are scored exactly.
+    """
+    top_k = int(request.get("top_k", 5))
+    assignments = request["assignment"]
+    district_to_assignment_idx = {district: assignment_idx for assignment_idx, item in enumerate(assignments) for district in item["polling_districts"]}
+    current_score = score_assignment(request)["overall_score"]
+
+    candidates: List[Tuple[str, int, int]] = []
+    for assignment_idx_1, item in enumerate(assignments):
+        polling_districts_1 = item["polling_districts"]
+        if len(polling_districts_1) == 1:
+            continue
+        for a in sorted(polling_districts_1):
+            adjacent_assignment_idxs = sorted(set(district_to_assignment_idx[b] for b in adjacency_data.get(a, []) if b in district_to_assignment_idx) - {assignment_idx_1})
+            if not adjacent_assignment_idxs or not is_contiguous([district for district in polling_districts_1 if district != a], adjacency_data):
+                continue
+            candidates.extend((a, assignment_idx_1, assignment_idx_2) for assignment_idx_2 in adjacent_assignment_idxs)
+
+    screened = []
+    for a, assignment_idx_1, assignment_idx_2 in candidates:
+        move_district(assignments, a, assignment_idx_1, assignment_idx_2)
+        if min(calculate_elector_balances(request)) > current_score:
+            screened.append((score_assignment_proxy(request)["overall_score"], a, assignment_idx_1, assignment_idx_2))
+        move_district(assignments, a, assignment_idx_2, assignment_idx_1)
+    screened.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    best_score = current_score
+    best_move = None
+    for _, a, assignment_idx_1, assignment_idx_2 in screened[:top_k]:
+        move_district(assignments, a, assignment_idx_1, assignment_idx_2)
+        score = score_assignment(request, threshold=best_score)["overall_score"]
+        if score > best_score:
+            best_score = score
+            best_move = {"polling_district": a, "from": assignments[assignment_idx_1]["constituency_name"], "to": assignments[assignment_idx_2]["constituency_name"]}
+        move_district(assignments, a, assignment_idx_2, assignment_idx_1)
+
+    return {"move": best_move, "overall_score": best_score, "current_score": current_score, "candidates": len(candidates), "screened": len(screened)}
+
+
+def move_district(assignments: List[Dict[str, Any]], district: str, from_assignment_idx: int, to_assignment_idx: int) -> None:
+    assignments[from_assignment_idx]["polling_districts"].remove(district)
+    assignments[to_assignment_idx]["polling_districts"].append(district)
+
+
+# Endpoints whose metrics are only defined for a valid assignment (an empty constituency has no relevance, for example)
+VALIDATED_PATHS = {"/score", "/suggest"}
+
+ROUTES = {
+    ("POST", "/score"): handle_score,
+    ("POST", "/validate"): handle_validate,
+    ("POST", "/suggest"): handle_suggest,
+    ("GET", "/health"): lambda request: {"status": "ok"},
+}
+
+
+async def handle_request(method: str, path: str, body: bytes) -> Tuple[HTTPStatus, Dict[str, Any]]:
+    if method == "OPTIONS":
+        return HTTPStatus.NO_CONTENT, None
+
+    route = ROUTES.get((method, path))
+    if route is None:
+        if any(route_path == path for _, route_path in ROUTES):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"{method} is not supported for {path}"}
+        return HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {path}"}
+
+    try:
+        request = json.loads(body) if body else {}
+    except json.JSONDecodeError as e:
+        return HTTPStatus.BAD_REQUEST, {"error": f"Invalid JSON: {e}"}
+    if method == "POST" and not isinstance(request.get("assignment") if isinstance(request, dict) else None, list):
+        return HTTPStatus.BAD_REQUEST, {"error": 'The body must be an assignment with an "assignment" list'}
+
+    loop = asyncio.get_running_loop()
+    try:
+        if path in VALIDATED_PATHS:
+            validated, errors = await loop.run_in_executor(scoring_executor, validate_assignment, request)
+            if not validated:
+                return HTTPStatus.BAD_REQUEST, {"error": "Invalid assignment", "errors": errors}
+        return HTTPStatus.OK, await loop.run_in_executor(scoring_executor, route, request)
+    except (KeyError, TypeError, ValueError) as e:
+        return HTTPStatus.BAD_REQUEST, {"error": f"Invalid assignment: {e!r}"}
+    except Exception as e:
+        print(f"Failed {method} {path}: {e!r}")
+        return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Scoring failed: {e!r}"}
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    start_time = time.time()
+    try:
+        request_line = await reader.readline()
+        if not request_line:
+            return
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        path = path.split("?", 1)[0]
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+        status, payload = await handle_request(method, path, body)
+        response_body = b"" if payload is None else json.dumps(payload).encode()
+        response_headers = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(response_body)}",
+            # index.html is served from a different origin (python -m http.server or GitHub Pages)
+            "Access-Control-Allow-Origin: *",
+            "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+            "Access-Control-Allow-Headers: Content-Type",
+            "Connection: close",
+        ]
+        writer.write(("\r\n".join(response_headers) + "\r\n\r\n").encode("latin-1") + response_body)
+        await writer.drain()
+        print(f"{method} {path} {status.value} {1000 * (time.time() - start_time):.0f}ms")
+    except (ValueError, asyncio.IncompleteReadError, ConnectionError) as e:
+        print(f"Dropped malformed request: {e!r}")
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int) -> None:
+    server = await asyncio.start_server(handle_connection, host, port)
+    print(f"Scoring service listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve score, validate and suggest endpoints over warm scoring caches.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--warm-up", nargs="*", default=["official_ge_2025.json"], help="Assignments in assignments/ to score at startup, so their metrics are cached")
+    args = parser.parse_args()
+
+    for assignment_file in args.warm_up:
+        start_time = time.time()
+        overall_score = score_assignment(load_json(os.path.join("assignments", assignment_file)))["overall_score"]
+        print(f"Warmed up with {assignment_file} (score {overall_score}) in {time.time() - start_time:.1f}s")
+
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
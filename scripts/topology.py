@@ -0,0 +1,165 @@
+"""Quantized TopoJSON encoding of the polling district GeoJSON.
+
+Neighbouring polling districts share their boundaries, so the GeoJSON stores every shared boundary twice.
+TopoJSON cuts the polygon rings into arcs at the points where districts meet, stores each arc once,
+and refers to it from both districts (a reversed arc i is referred to as ~i, which is -i - 1).
+Coordinates are quantized to integers on a grid of 10^-decimals degrees and delta-encoded along each arc.
+
+The polling district coordinates have at most 7 decimals, so the default grid is lossless. The start point of every
+ring is also a junction, so each ring is cut there and decodes from the same vertex, and repeated consecutive vertices
+are kept (as zero-length arcs between them). topojson_to_geojson therefore returns exactly the input rings
+(without the z coordinate), and the scorer gives the same results from the TopoJSON as from the GeoJSON.
+"""
+
+import gzip
+import json
+import math
+import os
+from typing import Any, Dict, List, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+Point = Tuple[int, int]
+
+
+def quantize_ring(ring: List[List[float]], translate: List[float], scale: float) -> List[Point]:
+    """Quantized points of a ring, including repeated ones, so that decoding gives back the same vertices."""
+    quantized = [(round((coordinate[0] - translate[0]) / scale), round((coordinate[1] - translate[1]) / scale)) for coordinate in ring]
+    # Rings are closed, the arcs are cut from the open ring
+    if len(quantized) > 1 and quantized[0] == quantized[-1]:
+        quantized.pop()
+    return quantized
+
+
+def find_junctions(rings: List[List[Point]]) -> set:
+    """A junction is a point where the rings through it do not all continue to the same neighbours, or where a ring starts.
+
+    A repeated point is its own neighbour, so it is a junction and the zero-length arc between the repeats is kept.
+    """
+    neighbours: Dict[Point, frozenset] = {}
+    junctions = {ring[0] for ring in rings if ring}
+    for ring in rings:
+        for idx, point in enumerate(ring):
+            point_neighbours = frozenset((ring[idx - 1], ring[(idx + 1) % len(ring)]))
+            if neighbours.setdefault(point, point_neighbours) != point_neighbours:
+                junctions.add(point)
+    return junctions
+
+
+def cut_ring(ring: List[Point], junctions: set) -> List[List[Point]]:
+    """Cut an open ring, whose start point is a junction, into closed-ended arcs at its junctions."""
+    cut_idxs = [idx for idx, point in enumerate(ring) if point in junctions] + [len(ring)]
+    closed_ring = ring + [ring[0]]
+    return [closed_ring[start : end + 1] for start, end in zip(cut_idxs, cut_idxs[1:])]
+
+
+def geojson_to_topojson(geojson: Dict[str, Any], object_name: str, decimals: int = 7) -> Dict[str, Any]:
+    """Encode a FeatureCollection of Polygons and MultiPolygons as a TopoJSON Topology with one GeometryCollection."""
+    scale = 10**-decimals
+    all_coordinates = [coordinate for feature in geojson["features"] for polygon in feature_polygons(feature) for ring in polygon for coordinate in ring]
+    translate = [min(coordinate[0] for coordinate in all_coordinates), min(coordinate[1] for coordinate in all_coordinates)]
+    bbox = translate + [max(coordinate[0] for coordinate in all_coordinates), max(coordinate[1] for coordinate in all_coordinates)]
+
+    quantized_features = [[[quantize_ring(ring, translate, scale) for ring in polygon] for polygon in feature_polygons(feature)] for feature in geojson["features"]]
+    junctions = find_junctions([ring for polygons in quantized_features for polygon in polygons for ring in polygon])
+
+    arcs: List[List[Point]] = []
+    arc_to_idx: Dict[Tuple[Point, ...], int] = {}
+
+    def arc_index(arc: List[Point]) -> int:
+        key = tuple(arc)
+        if key in arc_to_idx:
+            return arc_to_idx[key]
+        reversed_key = tuple(arc[::-1])
+        if reversed_key in arc_to_idx:
+            return ~arc_to_idx[reversed_key]
+        arc_to_idx[key] = len(arcs)
+        arcs.append(arc)
+        return arc_to_idx[key]
+
+    geometries = []
+    for feature, polygons in zip(geojson["features"], quantized_features):
+        polygon_arcs = [[[arc_index(arc) for arc in cut_ring(ring, junctions)] for ring in polygon] for polygon in polygons]
+        geometry = {"type": feature["geometry"]["type"], "arcs": polygon_arcs[0] if feature["geometry"]["type"] == "Polygon" else polygon_arcs}
+        geometry["properties"] = feature.get("properties", {})
+        geometries.append(geometry)
+
+    encoded_arcs = []
+    for arc in arcs:
+        encoded_arc = [list(arc[0])]
+        for previous, point in zip(arc, arc[1:]):
+            encoded_arc.append([point[0] - previous[0], point[1] - previous[1]])
+        encoded_arcs.append(encoded_arc)
+
+    return {
+        "type": "Topology",
+        "bbox": bbox,
+        "transform": {"scale": [scale, scale], "translate": translate},
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": encoded_arcs,
+    }
+
+
+def feature_polygons(feature: Dict[str, Any]) -> List[List[List[List[float]]]]:
+    geometry = feature["geometry"]
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    raise ValueError(f"Feature {feature.get('properties', {}).get('name')} is a {geometry['type']}, only Polygons and MultiPolygons are supported")
+
+
+def topojson_to_geojson(topology: Dict[str, Any], object_name: str) -> Dict[str, Any]:
+    """Decode a GeometryCollection of a TopoJSON Topology back into a GeoJSON FeatureCollection."""
+    scale_x, scale_y = topology["transform"]["scale"]
+    translate_x, translate_y = topology["transform"]["translate"]
+    # Rounding to the grid removes the float error of the transform, so that the coordinates compare equal to the original ones
+    decimals = max(0, round(-math.log10(scale_x)))
+
+    arcs = []
+    for encoded_arc in topology["arcs"]:
+        x, y = 0, 0
+        arc = []
+        for dx, dy in encoded_arc:
+            x += dx
+            y += dy
+            arc.append([round(x * scale_x + translate_x, decimals), round(y * scale_y + translate_y, decimals)])
+        arcs.append(arc)
+
+    def decode_ring(ring_arcs: List[int]) -> List[List[float]]:
+        ring = []
+        for arc_idx in ring_arcs:
+            arc = arcs[arc_idx] if arc_idx >= 0 else arcs[~arc_idx][::-1]
+            ring.extend(arc if not ring else arc[1:])
+        return ring
+
+    features = []
+    for geometry in topology["objects"][object_name]["geometries"]:
+        if geometry["type"] == "Polygon":
+            coordinates = [decode_ring(ring_arcs) for ring_arcs in geometry["arcs"]]
+        else:
+            coordinates = [[decode_ring(ring_arcs) for ring_arcs in polygon_arcs] for polygon_arcs in geometry["arcs"]]
+        features.append({"type": "Feature", "properties": geometry.get("properties", {}), "geometry": {"type": geometry["type"], "coordinates": coordinates}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def save_topojson(topology: Dict[str, Any], filepath: str) -> List[str]:
+    """Write the topology compactly, with gzip and (if the brotli package is installed) brotli precompressed copies for static hosting."""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    data = json.dumps(topology, separators=(",", ":")).encode()
+    written = [filepath, filepath + ".gz"]
+    with open(filepath, "wb") as f:
+        f.write(data)
+    with open(filepath + ".gz", "wb") as f:
+        # mtime=0 keeps the output identical between runs
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(filepath + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+        written.append(filepath + ".br")
+    else:
+        print(f"brotli is not installed, skipping {filepath}.br")
+    return written